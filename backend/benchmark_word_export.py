@@ -0,0 +1,61 @@
+"""Benchmark the Word export writer at growing row counts.
+
+Run from the backend directory:  python benchmark_word_export.py [rows ...]
+
+The time per row should stay roughly flat as the table grows; the script
+exits non-zero when the largest run is more than MAX_SLOWDOWN times slower
+per row than the smallest one.
+"""
+import os
+import sys
+import tempfile
+import time
+
+os.environ.setdefault('MONGO_URL', 'mongodb://localhost:27017')
+os.environ.setdefault('DB_NAME', 'inventory_benchmark')
+
+from docx import Document
+
+from server import WordExportWriter, export_header
+
+FIELDS = ["sku", "name", "brand", "category", "gender", "color", "size", "quantity", "price", "warehouse"]
+ROW_COUNTS = [2500, 5000, 10000, 20000, 40000]
+MAX_SLOWDOWN = 1.5
+
+def sample_row(idx: int) -> list:
+    return [
+        f"SKU-{idx:06d}", f"Cotton T-Shirt {idx}", "Nike", "T-Shirts", "Unisex",
+        "Navy Blue", "XL", idx % 500, 499.0 + idx % 100, "Main Warehouse"
+    ]
+
+def render(row_count: int, output_path: str) -> float:
+    started = time.perf_counter()
+    writer = WordExportWriter([export_header(field) for field in FIELDS], output_path, row_count)
+    for idx in range(row_count):
+        writer.write_row(sample_row(idx))
+    writer.close()
+    return time.perf_counter() - started
+
+def main():
+    row_counts = [int(arg) for arg in sys.argv[1:]] or ROW_COUNTS
+    per_row = []
+    with tempfile.TemporaryDirectory() as directory:
+        for row_count in row_counts:
+            output_path = os.path.join(directory, f"export_{row_count}.docx")
+            elapsed = render(row_count, output_path)
+            per_row.append(elapsed / row_count)
+            size_kb = os.path.getsize(output_path) / 1024
+            print(f"{row_count:>7} rows  {elapsed * 1000:9.0f} ms  {per_row[-1] * 1e6:7.1f} us/row  {size_kb:9.0f} KB")
+        
+        # The smallest document must still open with python-docx and hold every row
+        table = Document(os.path.join(directory, f"export_{row_counts[0]}.docx")).tables[0]
+        assert len(table.rows) == row_counts[0] + 1, "Row count mismatch in the generated document"
+    
+    slowdown = per_row[-1] / per_row[0]
+    print(f"Per-row slowdown from {row_counts[0]} to {row_counts[-1]} rows: {slowdown:.2f}x")
+    if slowdown > MAX_SLOWDOWN:
+        print(f"Scaling is worse than near-linear (limit {MAX_SLOWDOWN}x)")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,7 @@
-from fastapi import FastAPI, APIRouter, HTTPException, Depends, status, Query
+from fastapi import FastAPI, APIRouter, HTTPException, Depends, status, Query, Request, Header
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, Response
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
 
@@ -10,8 +10,27 @@ import os
 import logging
 from pathlib import Path
 from pydantic import BaseModel, Field, ConfigDict, EmailStr
-from typing import List, Optional, Dict
+from typing import List, Optional, Dict, Union
 import uuid
+import json
+import hashlib
+import asyncio
+import tempfile
+import shutil
+import multiprocessing
+import time
+import threading
+import fcntl
+import csv
+import hmac
+import math
+import secrets
+import re
+import zipfile
+from io import StringIO
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from collections import OrderedDict, Counter
+from contextlib import contextmanager
 from datetime import datetime, timezone, timedelta
 import bcrypt
 import jwt
@@ -19,17 +38,23 @@ from enum import Enum
 from io import BytesIO
 from openpyxl import Workbook
 from openpyxl.styles import Font, PatternFill, Alignment
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.utils import get_column_letter
 from docx import Document
 from docx.shared import Inches, Pt, RGBColor
 from docx.enum.text import WD_ALIGN_PARAGRAPH
 from reportlab.lib import colors
-from reportlab.lib.pagesizes import letter, A4
-from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+from reportlab.lib.pagesizes import letter, A4, landscape
 from reportlab.lib.units import inch
+from reportlab.pdfbase.pdfmetrics import stringWidth
+from reportlab.pdfgen import canvas
 from fastapi.responses import StreamingResponse
 from fastapi import UploadFile, File
 from openpyxl import load_workbook
+from starlette.concurrency import run_in_threadpool
+from pymongo import InsertOne, UpdateOne, ReturnDocument
+from pymongo.errors import BulkWriteError, DuplicateKeyError, ExecutionTimeout
+from starlette.background import BackgroundTask
 
 
 ROOT_DIR = Path(__file__).parent
@@ -43,7 +68,135 @@ db = client[os.environ['DB_NAME']]
 # JWT Configuration
 JWT_SECRET = os.environ.get('JWT_SECRET', 'your-secret-key-change-in-production')
 JWT_ALGORITHM = 'HS256'
-JWT_EXPIRATION_HOURS = 24
+ACCESS_TOKEN_EXPIRE_MINUTES = int(os.environ.get('ACCESS_TOKEN_EXPIRE_MINUTES', 15))
+REFRESH_TOKEN_EXPIRE_DAYS = int(os.environ.get('REFRESH_TOKEN_EXPIRE_DAYS', 30))
+# Browser tabs share one refresh token, so a second use shortly after rotation is not treated as theft
+REFRESH_REUSE_GRACE_SECONDS = int(os.environ.get('REFRESH_REUSE_GRACE_SECONDS', 30))
+REVOCATION_SYNC_SECONDS = int(os.environ.get('REVOCATION_SYNC_SECONDS', 30))
+# Role changes reach other API workers within the user cache TTL
+USER_CACHE_TTL_SECONDS = int(os.environ.get('USER_CACHE_TTL_SECONDS', 60))
+USER_CACHE_MAX_ENTRIES = int(os.environ.get('USER_CACHE_MAX_ENTRIES', 10000))
+
+# Master Data Configuration
+# How often each API worker checks whether another worker changed master data
+MASTER_DATA_SYNC_SECONDS = int(os.environ.get('MASTER_DATA_SYNC_SECONDS', 5))
+MASTER_DATA_RENAME_BATCH_SIZE = int(os.environ.get('MASTER_DATA_RENAME_BATCH_SIZE', 1000))
+# A rename job whose worker stops renewing this lease (e.g. after a restart) is resumed by another worker
+MASTER_DATA_RENAME_LEASE_SECONDS = int(os.environ.get('MASTER_DATA_RENAME_LEASE_SECONDS', 60))
+master_data_rename_tasks: Dict[str, asyncio.Task] = {}
+# A usage counter build whose worker died is retried by another worker after this
+MASTER_DATA_USAGE_BUILD_LEASE_SECONDS = int(os.environ.get('MASTER_DATA_USAGE_BUILD_LEASE_SECONDS', 600))
+master_data_usage_built = False  # until the counters are built, usage is counted from inventory
+
+# API Key Configuration
+# Integration keys are checked against this in-memory table instead of bcrypt and JWT
+API_KEY_HMAC_SECRET = os.environ.get('API_KEY_HMAC_SECRET', JWT_SECRET)
+api_key_table: Dict[str, dict] = {}  # key id -> secret HMAC, name, role, warehouses
+
+# Login Throttling Configuration
+LOGIN_RATE_LIMIT_ENABLED = os.environ.get('LOGIN_RATE_LIMIT_ENABLED', 'true').lower() == 'true'
+LOGIN_RATE_EMAIL_CAPACITY = int(os.environ.get('LOGIN_RATE_EMAIL_CAPACITY', 5))
+LOGIN_RATE_EMAIL_PER_MINUTE = float(os.environ.get('LOGIN_RATE_EMAIL_PER_MINUTE', 5))
+LOGIN_RATE_IP_CAPACITY = int(os.environ.get('LOGIN_RATE_IP_CAPACITY', 20))
+LOGIN_RATE_IP_PER_MINUTE = float(os.environ.get('LOGIN_RATE_IP_PER_MINUTE', 30))
+LOGIN_RATE_MAX_KEYS = int(os.environ.get('LOGIN_RATE_MAX_KEYS', 100000))
+# Only enable behind a proxy that sets X-Forwarded-For itself
+LOGIN_TRUST_FORWARDED_FOR = os.environ.get('LOGIN_TRUST_FORWARDED_FOR', 'false').lower() == 'true'
+login_throttle_metrics = {"allowed": 0, "rejected_ip": 0, "rejected_email": 0}
+# Sessions whose access tokens are rejected before they expire
+revoked_sessions: set = set()
+
+# Password Hashing Configuration
+# bcrypt runs in its own thread pool (it releases the GIL) so logins never block the event loop
+BCRYPT_ROUNDS = int(os.environ.get('BCRYPT_ROUNDS', 12))
+PASSWORD_HASH_WORKERS = int(os.environ.get('PASSWORD_HASH_WORKERS', min(4, os.cpu_count() or 1)))
+PASSWORD_HASH_MAX_QUEUE = int(os.environ.get('PASSWORD_HASH_MAX_QUEUE', 100))
+password_hash_pool = ThreadPoolExecutor(max_workers=PASSWORD_HASH_WORKERS, thread_name_prefix="bcrypt")
+password_hash_slots = asyncio.Semaphore(PASSWORD_HASH_WORKERS)
+password_hash_metrics = {
+    "queued": 0,
+    "running": 0,
+    "completed": 0,
+    "rejected": 0,
+    "rehashed": 0,
+    "queue_wait_ms_total": 0.0,
+    "hash_ms_total": 0.0
+}
+
+# Import Configuration
+IMPORT_WORKERS = int(os.environ.get('IMPORT_WORKERS', os.cpu_count() or 1))
+IMPORT_BATCH_SIZE = int(os.environ.get('IMPORT_BATCH_SIZE', 1000))
+IMPORT_ERROR_PREVIEW_LIMIT = int(os.environ.get('IMPORT_ERROR_PREVIEW_LIMIT', 100))
+IMPORT_ERROR_RETENTION_DAYS = int(os.environ.get('IMPORT_ERROR_RETENTION_DAYS', 7))
+import_process_pool: Optional[ProcessPoolExecutor] = None
+
+# Export Configuration
+EXPORT_WIDTH_SAMPLE_ROWS = int(os.environ.get('EXPORT_WIDTH_SAMPLE_ROWS', 500))
+EXPORT_WORKERS = int(os.environ.get('EXPORT_WORKERS', 2))
+EXPORT_MAX_QUEUE = int(os.environ.get('EXPORT_MAX_QUEUE', 20))
+export_process_pool: Optional[ProcessPoolExecutor] = None
+export_slots = asyncio.Semaphore(EXPORT_WORKERS)
+export_metrics = {
+    "queued": 0,
+    "running": 0,
+    "completed": 0,
+    "failed": 0,
+    "rejected": 0,
+    "queue_wait_ms_total": 0.0,
+    "render_ms_total": 0.0
+}
+
+# Output file extension and media type per export format
+EXPORT_FORMATS = {
+    "excel": ("xlsx", "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"),
+    "word": ("docx", "application/vnd.openxmlformats-officedocument.wordprocessingml.document"),
+    "pdf": ("pdf", "application/pdf"),
+    "csv": ("csv", "text/csv"),
+    "ndjson": ("ndjson", "application/x-ndjson")
+}
+# Export fields stored inside fabric_specs
+EXPORT_FABRIC_FIELDS = ("material", "weight", "composition")
+EXPORT_STREAM_CHUNK_SIZE = int(os.environ.get('EXPORT_STREAM_CHUNK_SIZE', 64 * 1024))
+EXPORT_CACHE_DIR = Path(os.environ.get('EXPORT_CACHE_DIR', Path(tempfile.gettempdir()) / 'inventory_export_cache'))
+EXPORT_CACHE_MAX_BYTES = int(os.environ.get('EXPORT_CACHE_MAX_BYTES', 512 * 1024 * 1024))
+EXPORT_JOBS_DIR = Path(os.environ.get('EXPORT_JOBS_DIR', Path(tempfile.gettempdir()) / 'inventory_export_jobs'))
+EXPORT_JOB_TTL_HOURS = int(os.environ.get('EXPORT_JOB_TTL_HOURS', 24))
+# A running job renews this lease; once it lapses (e.g. after a restart) the janitor fails the job
+EXPORT_JOB_LEASE_SECONDS = int(os.environ.get('EXPORT_JOB_LEASE_SECONDS', 60))
+# Download links are signed with their own key and audience so they never pass as access tokens
+EXPORT_DOWNLOAD_SECRET = os.environ.get('EXPORT_DOWNLOAD_SECRET', hashlib.sha256(f"export-download:{JWT_SECRET}".encode('utf-8')).hexdigest())
+EXPORT_DOWNLOAD_AUDIENCE = "export_download"
+EXPORT_PROGRESS_INTERVAL = int(os.environ.get('EXPORT_PROGRESS_INTERVAL', 5000))
+export_job_tasks: Dict[str, asyncio.Task] = {}
+EXPORT_TEMPLATE_CACHE_SIZE = int(os.environ.get('EXPORT_TEMPLATE_CACHE_SIZE', 1000))
+# How often a worker checks whether another worker changed export templates
+EXPORT_TEMPLATE_SYNC_SECONDS = int(os.environ.get('EXPORT_TEMPLATE_SYNC_SECONDS', 5))
+# Preflight: sampled rows are measured as CSV or NDJSON and scaled per format
+# as (sample encoding, bytes per sampled byte, fixed document overhead)
+EXPORT_SIZE_ESTIMATES = {
+    "csv": ("csv", 1.0, 0),
+    "ndjson": ("ndjson", 1.0, 0),
+    "excel": ("csv", 0.5, 6 * 1024),
+    "pdf": ("csv", 1.0, 4 * 1024),
+    "word": ("csv", 0.2, 38 * 1024)
+}
+EXPORT_PREFLIGHT_SAMPLE_ROWS = int(os.environ.get('EXPORT_PREFLIGHT_SAMPLE_ROWS', 50))
+EXPORT_PREFLIGHT_COUNT_TIMEOUT_MS = int(os.environ.get('EXPORT_PREFLIGHT_COUNT_TIMEOUT_MS', 2000))
+EXPORT_BACKGROUND_ROWS = int(os.environ.get('EXPORT_BACKGROUND_ROWS', 50000))
+EXPORT_BACKGROUND_BYTES = int(os.environ.get('EXPORT_BACKGROUND_BYTES', 50 * 1024 * 1024))
+EXPORT_TEXT_FILTERS = ("brand", "warehouse", "category", "gender", "color", "size", "search", "sku", "name", "design")
+
+# Chunked Upload Configuration
+UPLOAD_DIR = Path(os.environ.get('UPLOAD_DIR', Path(tempfile.gettempdir()) / 'inventory_uploads'))
+UPLOAD_MAX_FILE_SIZE = int(os.environ.get('UPLOAD_MAX_FILE_SIZE', 500 * 1024 * 1024))
+UPLOAD_MAX_CHUNK_SIZE = int(os.environ.get('UPLOAD_MAX_CHUNK_SIZE', 8 * 1024 * 1024))
+UPLOAD_EXPIRY_HOURS = int(os.environ.get('UPLOAD_EXPIRY_HOURS', 24))
+
+# Janitor for expired export files and abandoned uploads
+JANITOR_INTERVAL_SECONDS = int(os.environ.get('JANITOR_INTERVAL_SECONDS', 600))
+janitor_task: Optional[asyncio.Task] = None
+revocation_sync_task: Optional[asyncio.Task] = None
+master_data_sync_task: Optional[asyncio.Task] = None
 
 # Create the main app without a prefix
 app = FastAPI(title="Inventory Management API", version="1.0.0")
@@ -61,7 +214,7 @@ app.add_middleware(
 # Create a router with the /api prefix
 api_router = APIRouter(prefix="/api")
 
-security = HTTPBearer()
+security = HTTPBearer(auto_error=False)
 
 # Enums
 class UserRole(str, Enum):
@@ -97,15 +250,40 @@ class UserCreate(BaseModel):
     password: str
     role: UserRole = UserRole.VIEWER
 
+class ApiKeyCreate(BaseModel):
+    name: str
+    role: UserRole
+    warehouses: List[str] = []  # empty means every warehouse
+
+class ApiKey(BaseModel):
+    id: str
+    name: str
+    role: UserRole
+    warehouses: List[str]
+    created_by: str
+    created_at: datetime
+    revoked_at: Optional[datetime] = None
+
+class ApiKeyCreated(ApiKey):
+    api_key: str
+
+class UserRoleUpdate(BaseModel):
+    role: UserRole
+
 class UserLogin(BaseModel):
     email: EmailStr
     password: str
 
 class Token(BaseModel):
     access_token: str
+    refresh_token: str
     token_type: str
+    expires_in: int  # access token lifetime in seconds
     user: User
 
+class RefreshRequest(BaseModel):
+    refresh_token: str
+
 class FabricSpecs(BaseModel):
     material: str
     weight: Optional[str] = None
@@ -206,10 +384,38 @@ class ExportTemplateCreate(BaseModel):
     is_default: bool = False
 
 class ExportRequest(BaseModel):
-    format: str  # excel, pdf, word
-    fields: List[str]
+    format: str  # excel, pdf, word, csv, ndjson
+    fields: List[str] = []
+    template_id: Optional[str] = None  # used when no fields are given; falls back to the default template
     filters: Optional[Dict] = None
 
+class ExportBundleRequest(BaseModel):
+    formats: List[str]  # any of the export formats, each rendered once into the zip
+    fields: List[str] = []
+    template_id: Optional[str] = None
+    filters: Optional[Dict] = None
+
+class ExportPreflight(BaseModel):
+    format: str
+    fields: List[str]
+    estimated_rows: int
+    count_exact: bool
+    estimated_bytes: int
+    recommended_mode: str  # direct, background
+
+class ExportJob(BaseModel):
+    id: str
+    status: str  # queued, running, completed, failed, expired
+    format: str
+    total_rows: Optional[int] = None
+    processed_rows: int = 0
+    progress: float = 0.0
+    error: Optional[str] = None
+    download_url: Optional[str] = None
+    created_at: datetime
+    completed_at: Optional[datetime] = None
+    expires_at: datetime
+
 class ImportResult(BaseModel):
     total_rows: int
     successful: int
@@ -217,36 +423,339 @@ class ImportResult(BaseModel):
     errors: List[Dict]
     inserted: int
     updated: int
+    unchanged: int = 0
+    import_id: Optional[str] = None
+    errors_truncated: bool = False
+    master_data_added: Dict[str, List[str]] = {}
+
+class ChunkedUploadCreate(BaseModel):
+    filename: str
+    total_size: int
+    chunk_size: int
+
+class ChunkedUploadStatus(BaseModel):
+    upload_id: str
+    filename: str
+    total_size: int
+    chunk_size: int
+    total_chunks: int
+    received_chunks: List[int]
+    completed: bool = False
+    import_id: Optional[str] = None
+
+# Columns every import sheet must provide
+IMPORT_REQUIRED_FIELDS = ['sku', 'name', 'brand', 'warehouse', 'product_type', 'category', 'gender', 'size', 'design', 'mrp', 'selling_price', 'quantity']
+
+# Master data lists kept in sync with imported values (master data field -> inventory field)
+IMPORT_MASTER_DATA_FIELDS = {
+    "brands": "brand",
+    "warehouses": "warehouse",
+    "colors": "color",
+    "sizes": "size",
+    "materials": "fabric_specs.material",
+    "weights": "fabric_specs.weight"
+}
+
+# Master data lists and the inventory field holding their values
+MASTER_DATA_INVENTORY_FIELDS = {
+    "brands": "brand",
+    "warehouses": "warehouse",
+    "product_types": "product_type",
+    "categories": "category",
+    "product_names": "name",
+    "designs": "design",
+    "colors": "color",
+    "sizes": "size",
+    "materials": "fabric_specs.material",
+    "weights": "fabric_specs.weight"
+}
+
+# Fields written by the importer; their hash lets re-imports skip unchanged rows
+IMPORT_HASH_FIELDS = [
+    "sku", "name", "brand", "warehouse", "product_type", "category", "gender", "color", "color_code",
+    "fabric_specs", "size", "design", "mrp", "selling_price", "cost_price", "quantity",
+    "low_stock_threshold", "status"
+]
 
 # Helper Functions
+def default_master_data() -> dict:
+    """Master data used before any value has been configured"""
+    return {
+        "brands": [],
+        "warehouses": [],
+        "product_types": [],
+        "product_hierarchy": {},  # {"Product Type": {"Category": ["Product Name1", "Product Name2"]}}
+        "designs": [],
+        "colors": [],
+        "sizes": ["XS(36)", "S(38)", "M(40)", "L(42)", "XL(44)", "2XL(46)"],
+        "materials": [],
+        "weights": []
+    }
+
+def compute_content_hash(item: dict) -> str:
+    """Hash the import-relevant fields of an inventory item"""
+    payload = {field: item.get(field) for field in IMPORT_HASH_FIELDS}
+    encoded = json.dumps(payload, sort_keys=True, default=str).encode('utf-8')
+    return hashlib.sha256(encoded).hexdigest()
+
+def master_data_usage_of(item: Optional[dict]) -> Counter:
+    """Master data values used by one inventory item, keyed by (field_name, value)"""
+    usage = Counter()
+    for field_name, item_field in MASTER_DATA_INVENTORY_FIELDS.items():
+        value = item or {}
+        for key in item_field.split("."):
+            value = value.get(key) if isinstance(value, dict) else None
+        if value:
+            usage[(field_name, value)] += 1
+    return usage
+
+def master_data_usage_delta(old_item: Optional[dict], new_item: Optional[dict]) -> Counter:
+    """Counter changes for replacing old_item by new_item (either may be None)"""
+    delta = master_data_usage_of(new_item)
+    delta.subtract(master_data_usage_of(old_item))
+    return delta
+
 def hash_password(password: str) -> str:
-    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt(rounds=BCRYPT_ROUNDS)).decode('utf-8')
 
 def verify_password(password: str, hashed: str) -> bool:
     return bcrypt.checkpw(password.encode('utf-8'), hashed.encode('utf-8'))
 
-def create_access_token(user_id: str, email: str, role: str) -> str:
-    expiration = datetime.now(timezone.utc) + timedelta(hours=JWT_EXPIRATION_HOURS)
+def password_needs_rehash(hashed: str) -> bool:
+    """True when a stored hash was made with a different work factor than BCRYPT_ROUNDS"""
+    # bcrypt hashes look like $2b$<rounds>$<salt and digest>
+    try:
+        return int(hashed.split('$')[2]) != BCRYPT_ROUNDS
+    except (IndexError, ValueError):
+        return True
+
+async def run_password_work(func, *args):
+    """Run a bcrypt call in the password hashing pool, waiting for a free slot"""
+    if password_hash_metrics["queued"] >= PASSWORD_HASH_MAX_QUEUE:
+        password_hash_metrics["rejected"] += 1
+        raise HTTPException(status_code=503, detail="Too many sign-in attempts in progress. Please try again shortly.")
+    
+    queued_at = time.perf_counter()
+    password_hash_metrics["queued"] += 1
+    try:
+        await password_hash_slots.acquire()
+    finally:
+        password_hash_metrics["queued"] -= 1
+    queue_wait = time.perf_counter() - queued_at
+    
+    password_hash_metrics["running"] += 1
+    started = time.perf_counter()
+    try:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(password_hash_pool, func, *args)
+    finally:
+        password_hash_metrics["running"] -= 1
+        password_hash_slots.release()
+        password_hash_metrics["completed"] += 1
+        password_hash_metrics["queue_wait_ms_total"] += queue_wait * 1000
+        password_hash_metrics["hash_ms_total"] += (time.perf_counter() - started) * 1000
+
+def create_access_token(user_id: str, email: str, role: str, session_id: Optional[str] = None) -> str:
+    expiration = datetime.now(timezone.utc) + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
     payload = {
         'user_id': user_id,
         'email': email,
         'role': role,
+        'sid': session_id,
         'exp': expiration
     }
     return jwt.encode(payload, JWT_SECRET, algorithm=JWT_ALGORITHM)
 
-async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)) -> dict:
+def hash_refresh_token(token: str) -> str:
+    # Refresh tokens are long random strings, so a fast hash is enough to protect them at rest
+    return hashlib.sha256(token.encode('utf-8')).hexdigest()
+
+async def issue_session_tokens(user_doc: dict, session_id: Optional[str] = None) -> Token:
+    """Issue an access token and a new refresh token for a login session"""
+    session_id = session_id or str(uuid.uuid4())
+    refresh_token = secrets.token_urlsafe(32)
+    now = datetime.now(timezone.utc)
+    await db.refresh_tokens.insert_one({
+        "token_hash": hash_refresh_token(refresh_token),
+        "session_id": session_id,
+        "user_id": user_doc["id"],
+        "used_at": None,
+        "created_at": now.isoformat(),
+        "expires_at": now + timedelta(days=REFRESH_TOKEN_EXPIRE_DAYS)
+    })
+    
+    return Token(
+        access_token=create_access_token(user_doc["id"], user_doc["email"], user_doc["role"], session_id),
+        refresh_token=refresh_token,
+        token_type="bearer",
+        expires_in=ACCESS_TOKEN_EXPIRE_MINUTES * 60,
+        user=User(
+            id=user_doc["id"],
+            email=user_doc["email"],
+            role=user_doc["role"],
+            created_at=datetime.fromisoformat(user_doc["created_at"])
+        )
+    )
+
+async def revoke_session(session_id: str):
+    """Reject the session's access tokens from now on and drop its refresh tokens"""
+    revoked_sessions.add(session_id)
+    # Access tokens of the session die on their own, so the record only has to outlive them
+    await db.revoked_sessions.update_one(
+        {"session_id": session_id},
+        {"$set": {"expires_at": datetime.now(timezone.utc) + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)}},
+        upsert=True
+    )
+    await db.refresh_tokens.delete_many({"session_id": session_id})
+
+async def load_revoked_sessions():
+    """Reload the revocation set, picking up sessions revoked by other API workers"""
+    session_ids = set()
+    async for doc in db.revoked_sessions.find(
+        {"expires_at": {"$gt": datetime.now(timezone.utc)}},
+        {"_id": 0, "session_id": 1}
+    ):
+        session_ids.add(doc["session_id"])
+    revoked_sessions.clear()
+    revoked_sessions.update(session_ids)
+
+async def run_revocation_sync():
+    while True:
+        await asyncio.sleep(REVOCATION_SYNC_SECONDS)
+        try:
+            await load_revoked_sessions()
+            await load_api_keys()
+        except Exception:
+            logger.exception("Revocation sync failed")
+
+def hash_api_key_secret(secret: str) -> str:
+    return hmac.new(API_KEY_HMAC_SECRET.encode('utf-8'), secret.encode('utf-8'), hashlib.sha256).hexdigest()
+
+def authenticate_api_key(api_key: str) -> dict:
+    """Check an X-API-Key header against the in-memory key table, in constant time"""
+    # Keys look like ik_<key id>_<secret>
+    prefix, _, rest = api_key.partition("_")
+    key_id, _, secret = rest.partition("_")
+    entry = api_key_table.get(key_id) if prefix == "ik" else None
+    
+    # Unknown ids are compared too, so timing does not reveal which key ids exist
+    expected = entry["secret_hmac"] if entry else hash_api_key_secret("")
+    if not hmac.compare_digest(expected, hash_api_key_secret(secret)) or not entry:
+        raise HTTPException(status_code=401, detail="Invalid API key")
+    
+    # Key names are not unique, so the owner recorded on jobs, uploads and templates is the key id
+    return {
+        'user_id': f"api_key:{key_id}",
+        'email': f"api-key:{key_id}",
+        'role': entry['role'],
+        'api_key_id': key_id,
+        'warehouses': entry['warehouses']
+    }
+
+async def load_api_keys():
+    """Reload the active API keys, picking up keys created or revoked by other API workers"""
+    keys = {}
+    async for key_doc in db.api_keys.find({"revoked_at": None}, {"_id": 0}):
+        keys[key_doc["id"]] = {
+            "secret_hmac": key_doc["secret_hmac"],
+            "name": key_doc["name"],
+            "role": key_doc["role"],
+            "warehouses": key_doc.get("warehouses", [])
+        }
+    api_key_table.clear()
+    api_key_table.update(keys)
+
+def scope_inventory_query(query: dict, current_user: dict) -> dict:
+    """Restrict an inventory query to the warehouses an API key is scoped to"""
+    warehouses = current_user.get('warehouses')
+    if not warehouses:
+        return query
+    scope = {"warehouse": {"$in": warehouses}}
+    return {"$and": [query, scope]} if query else scope
+
+def check_warehouse_scope(current_user: dict, warehouse: str):
+    warehouses = current_user.get('warehouses')
+    if warehouses and warehouse not in warehouses:
+        raise HTTPException(status_code=403, detail=f"Access denied to warehouse '{warehouse}'")
+
+def reject_api_key(current_user: dict, action: str):
+    """Keep user and key management with people; keys only act for integrations"""
+    if current_user.get('api_key_id'):
+        raise HTTPException(status_code=403, detail=f"API keys cannot {action}")
+
+def check_master_data_admin(current_user: dict):
+    # Master data is shared by every warehouse, so warehouse-scoped keys cannot change it
+    if current_user["role"] != "admin":
+        raise HTTPException(status_code=403, detail="Only admins can manage master data")
+    if current_user.get('warehouses'):
+        raise HTTPException(status_code=403, detail="Warehouse-scoped API keys cannot manage master data")
+
+async def get_current_user(
+    credentials: Optional[HTTPAuthorizationCredentials] = Depends(security),
+    x_api_key: Optional[str] = Header(None)
+) -> dict:
+    if x_api_key:
+        return authenticate_api_key(x_api_key)
+    if not credentials:
+        raise HTTPException(status_code=403, detail="Not authenticated")
+    
     try:
         token = credentials.credentials
         payload = jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALGORITHM])
-        return payload
     except jwt.ExpiredSignatureError:
         raise HTTPException(status_code=401, detail="Token has expired")
     except jwt.InvalidTokenError:
         raise HTTPException(status_code=401, detail="Invalid token")
+    
+    # Only access tokens carry a user; purpose-bound tokens such as download links are rejected
+    if not payload.get('user_id') or not payload.get('role') or 'purpose' in payload:
+        raise HTTPException(status_code=401, detail="Invalid token")
+    if payload.get('sid') in revoked_sessions:
+        raise HTTPException(status_code=401, detail="Session has been revoked")
+    return payload
+
+class UserCache:
+    """In-process cache of user documents by id, refreshed after a short TTL"""
+    
+    def __init__(self, ttl_seconds: int, max_entries: int):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.entries = OrderedDict()  # user id -> (loaded at, user document or None)
+        self.hits = 0
+        self.misses = 0
+    
+    async def get(self, user_id: str) -> Optional[dict]:
+        entry = self.entries.get(user_id)
+        if entry and time.monotonic() - entry[0] < self.ttl_seconds:
+            self.entries.move_to_end(user_id)
+            self.hits += 1
+            return entry[1]
+        
+        self.misses += 1
+        user_doc = await db.users.find_one({"id": user_id}, {"_id": 0, "password_hash": 0})
+        self.entries[user_id] = (time.monotonic(), user_doc)
+        self.entries.move_to_end(user_id)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+        return user_doc
+    
+    def invalidate(self, user_id: str):
+        self.entries.pop(user_id, None)
+    
+    def stats(self) -> dict:
+        return {"entries": len(self.entries), "hits": self.hits, "misses": self.misses, "ttl_seconds": self.ttl_seconds}
+
+user_cache = UserCache(USER_CACHE_TTL_SECONDS, USER_CACHE_MAX_ENTRIES)
 
-def require_role(allowed_roles: List[UserRole]):
+def require_role(allowed_roles: List[UserRole], fresh_role: bool = False):
+    """Role guard; with fresh_role the current role is read from the user cache instead of the token"""
     async def role_checker(current_user: dict = Depends(get_current_user)):
+        # API key roles come from the key table, which is already current
+        if fresh_role and not current_user.get('api_key_id'):
+            user_doc = await user_cache.get(current_user['user_id'])
+            if not user_doc:
+                raise HTTPException(status_code=401, detail="User not found")
+            current_user = {**current_user, 'role': user_doc['role']}
         if current_user['role'] not in [role.value for role in allowed_roles]:
             raise HTTPException(
                 status_code=403,
@@ -255,6 +764,60 @@ def require_role(allowed_roles: List[UserRole]):
         return current_user
     return role_checker
 
+class TokenBucketLimiter:
+    """In-memory token buckets per key: capacity attempts at once, refilled at a steady rate"""
+    
+    def __init__(self, capacity: int, per_minute: float, max_keys: int):
+        self.capacity = capacity
+        self.refill_per_second = per_minute / 60
+        self.max_keys = max_keys
+        self.buckets = OrderedDict()  # key -> (tokens, last refill time)
+    
+    def acquire(self, key: str) -> float:
+        """Take one token; returns 0 when allowed, otherwise the seconds until a token is available"""
+        now = time.monotonic()
+        tokens, updated_at = self.buckets.pop(key, (self.capacity, now))
+        tokens = min(self.capacity, tokens + (now - updated_at) * self.refill_per_second)
+        
+        retry_after = 0.0
+        if tokens >= 1:
+            tokens -= 1
+        else:
+            retry_after = (1 - tokens) / self.refill_per_second
+        self.buckets[key] = (tokens, now)
+        
+        # Idle keys are dropped first; a dropped key simply starts with a full bucket again
+        while len(self.buckets) > self.max_keys:
+            self.buckets.popitem(last=False)
+        return retry_after
+
+login_ip_limiter = TokenBucketLimiter(LOGIN_RATE_IP_CAPACITY, LOGIN_RATE_IP_PER_MINUTE, LOGIN_RATE_MAX_KEYS)
+login_email_limiter = TokenBucketLimiter(LOGIN_RATE_EMAIL_CAPACITY, LOGIN_RATE_EMAIL_PER_MINUTE, LOGIN_RATE_MAX_KEYS)
+
+def client_ip(request: Request) -> str:
+    if LOGIN_TRUST_FORWARDED_FOR and request.headers.get("x-forwarded-for"):
+        return request.headers["x-forwarded-for"].split(",")[0].strip()
+    return request.client.host if request.client else "unknown"
+
+def throttle_login(request: Request, email: str):
+    """Reject login attempts over the per-IP or per-email budget before any password work"""
+    if not LOGIN_RATE_LIMIT_ENABLED:
+        return
+    
+    for limiter, key, counter in (
+        (login_ip_limiter, client_ip(request), "rejected_ip"),
+        (login_email_limiter, email.lower(), "rejected_email")
+    ):
+        retry_after = limiter.acquire(key)
+        if retry_after:
+            login_throttle_metrics[counter] += 1
+            raise HTTPException(
+                status_code=429,
+                detail="Too many login attempts. Please try again later.",
+                headers={"Retry-After": str(math.ceil(retry_after))}
+            )
+    login_throttle_metrics["allowed"] += 1
+
 # Auth Routes
 @api_router.post("/auth/register", response_model=User)
 async def register(user_data: UserCreate):
@@ -267,7 +830,7 @@ async def register(user_data: UserCreate):
     user_dict = {
         "id": str(uuid.uuid4()),
         "email": user_data.email,
-        "password_hash": hash_password(user_data.password),
+        "password_hash": await run_password_work(hash_password, user_data.password),
         "role": user_data.role.value,
         "created_at": datetime.now(timezone.utc).isoformat()
     }
@@ -282,37 +845,103 @@ async def register(user_data: UserCreate):
     )
 
 @api_router.post("/auth/login", response_model=Token)
-async def login(credentials: UserLogin):
+async def login(credentials: UserLogin, request: Request):
+    throttle_login(request, credentials.email)
+    
     # Find user
     user_doc = await db.users.find_one({"email": credentials.email})
     if not user_doc:
         raise HTTPException(status_code=401, detail="Invalid email or password")
     
     # Verify password
-    if not verify_password(credentials.password, user_doc["password_hash"]):
+    if not await run_password_work(verify_password, credentials.password, user_doc["password_hash"]):
         raise HTTPException(status_code=401, detail="Invalid email or password")
     
-    # Create token
-    access_token = create_access_token(user_doc["id"], user_doc["email"], user_doc["role"])
+    # Upgrade the stored hash when the configured work factor changed
+    if password_needs_rehash(user_doc["password_hash"]):
+        new_hash = await run_password_work(hash_password, credentials.password)
+        await db.users.update_one(
+            {"id": user_doc["id"], "password_hash": user_doc["password_hash"]},
+            {"$set": {"password_hash": new_hash}}
+        )
+        password_hash_metrics["rehashed"] += 1
+    
+    # Create tokens
+    return await issue_session_tokens(user_doc)
+
+@api_router.post("/auth/refresh", response_model=Token)
+async def refresh_session(refresh_request: RefreshRequest):
+    """Exchange a refresh token for new tokens; each refresh token works once"""
+    token_hash = hash_refresh_token(refresh_request.refresh_token)
+    token_doc = await db.refresh_tokens.find_one_and_update(
+        {"token_hash": token_hash, "used_at": None},
+        {"$set": {"used_at": datetime.now(timezone.utc).isoformat()}}
+    )
+    if not token_doc:
+        reused = await db.refresh_tokens.find_one({"token_hash": token_hash}, {"_id": 0})
+        if not reused or not reused.get("used_at"):
+            raise HTTPException(status_code=401, detail="Invalid refresh token")
+        if datetime.now(timezone.utc) - datetime.fromisoformat(reused["used_at"]) > timedelta(seconds=REFRESH_REUSE_GRACE_SECONDS):
+            # A rotated token coming back later means it leaked: end the whole session
+            await revoke_session(reused["session_id"])
+            raise HTTPException(status_code=401, detail="Invalid refresh token")
+        # Another tab refreshed with the same token a moment ago; it gets its own successor
+        token_doc = reused
+    
+    expires_at = token_doc["expires_at"]
+    if expires_at.tzinfo is None:
+        expires_at = expires_at.replace(tzinfo=timezone.utc)
+    if token_doc["session_id"] in revoked_sessions or expires_at <= datetime.now(timezone.utc):
+        raise HTTPException(status_code=401, detail="Refresh token has expired")
+    
+    user_doc = await user_cache.get(token_doc["user_id"])
+    if not user_doc:
+        raise HTTPException(status_code=401, detail="User not found")
+    
+    return await issue_session_tokens(user_doc, token_doc["session_id"])
+
+@api_router.post("/auth/logout")
+async def logout(refresh_request: RefreshRequest):
+    """End the session of a refresh token"""
+    token_doc = await db.refresh_tokens.find_one(
+        {"token_hash": hash_refresh_token(refresh_request.refresh_token)},
+        {"_id": 0, "session_id": 1}
+    )
+    if token_doc:
+        await revoke_session(token_doc["session_id"])
     
-    user = User(
+    return {"message": "Logged out successfully"}
+
+@api_router.get("/auth/me", response_model=User)
+async def get_me(current_user: dict = Depends(get_current_user)):
+    user_doc = await user_cache.get(current_user["user_id"])
+    if not user_doc:
+        raise HTTPException(status_code=404, detail="User not found")
+    
+    return User(
         id=user_doc["id"],
         email=user_doc["email"],
         role=user_doc["role"],
         created_at=datetime.fromisoformat(user_doc["created_at"])
     )
-    
-    return Token(
-        access_token=access_token,
-        token_type="bearer",
-        user=user
-    )
 
-@api_router.get("/auth/me", response_model=User)
-async def get_me(current_user: dict = Depends(get_current_user)):
-    user_doc = await db.users.find_one({"id": current_user["user_id"]})
+@api_router.put("/users/{user_id}/role", response_model=User)
+async def update_user_role(
+    user_id: str,
+    role_update: UserRoleUpdate,
+    current_user: dict = Depends(require_role([UserRole.ADMIN], fresh_role=True))
+):
+    """Change a user's role; guarded routes see it without waiting for token expiry"""
+    reject_api_key(current_user, "change user roles")
+    user_doc = await db.users.find_one_and_update(
+        {"id": user_id},
+        {"$set": {"role": role_update.role.value}},
+        projection={"_id": 0, "password_hash": 0},
+        return_document=ReturnDocument.AFTER
+    )
     if not user_doc:
         raise HTTPException(status_code=404, detail="User not found")
+    user_cache.invalidate(user_id)
     
     return User(
         id=user_doc["id"],
@@ -327,6 +956,8 @@ async def create_inventory_item(
     item_data: InventoryItemCreate,
     current_user: dict = Depends(require_role([UserRole.ADMIN, UserRole.STAFF]))
 ):
+    check_warehouse_scope(current_user, item_data.warehouse)
+    
     # Check if SKU + Warehouse combination already exists
     existing_item = await db.inventory.find_one({
         "sku": item_data.sku,
@@ -351,31 +982,37 @@ async def create_inventory_item(
     item_dict["updated_at"] = item_dict["updated_at"].isoformat()
     if item_dict.get("last_synced_at"):
         item_dict["last_synced_at"] = item_dict["last_synced_at"].isoformat()
+    item_dict["content_hash"] = compute_content_hash(item_dict)
     
     await db.inventory.insert_one(item_dict)
+    await bump_inventory_version()
+    await apply_master_data_usage(master_data_usage_of(item_dict))
     
     return item
 
-@api_router.get("/inventory", response_model=List[InventoryItem])
-async def get_inventory(
+def build_inventory_query(
+    brand: Optional[str] = None,
+    warehouse: Optional[str] = None,
     category: Optional[str] = None,
     gender: Optional[str] = None,
     color: Optional[str] = None,
     size: Optional[str] = None,
+    status: Optional[str] = None,
     min_price: Optional[float] = None,
     max_price: Optional[float] = None,
-    status: Optional[ItemStatus] = None,
     search: Optional[str] = None,
     sku: Optional[str] = None,
     name: Optional[str] = None,
-    design: Optional[str] = None,
-    sort_by: Optional[str] = "created_at",
-    sort_order: Optional[str] = "desc",
-    current_user: dict = Depends(get_current_user)
-):
-    # Build query
+    design: Optional[str] = None
+) -> dict:
+    """Mongo query shared by the inventory listing and exports"""
     query = {}
+    conditions = []
     
+    if brand:
+        query["brand"] = brand
+    if warehouse:
+        query["warehouse"] = warehouse
     if category:
         query["category"] = category
     if gender:
@@ -385,32 +1022,72 @@ async def get_inventory(
     if size:
         query["size"] = size
     if status:
-        query["status"] = status.value
+        query["status"] = status
     if min_price is not None or max_price is not None:
         price_query = {}
         if min_price is not None:
             price_query["$gte"] = min_price
         if max_price is not None:
             price_query["$lte"] = max_price
-        query["$or"] = [
+        conditions.append({"$or": [
             {"mrp": price_query},
-            {"price": price_query}
-        ]
+            {"selling_price": price_query}
+        ]})
     
     # Specific field search
     if sku:
-        # Filter by SKU (match base SKU pattern)
-        query["sku"] = {"$regex": f"^{sku}"}
+        # Anchored prefix match, served by the sku index
+        query["sku"] = {"$regex": f"^{re.escape(sku)}"}
     elif name:
-        query["name"] = {"$regex": name, "$options": "i"}
+        query["name"] = {"$regex": re.escape(name), "$options": "i"}
     elif design:
-        query["design"] = {"$regex": design, "$options": "i"}
+        query["design"] = {"$regex": re.escape(design), "$options": "i"}
     elif search:
-        query["$or"] = [
-            {"sku": {"$regex": search, "$options": "i"}},
-            {"name": {"$regex": search, "$options": "i"}},
-            {"design": {"$regex": search, "$options": "i"}}
-        ]
+        conditions.append({"$or": [
+            {"sku": {"$regex": re.escape(search), "$options": "i"}},
+            {"name": {"$regex": re.escape(search), "$options": "i"}},
+            {"design": {"$regex": re.escape(search), "$options": "i"}}
+        ]})
+    
+    # Price range and free-text search both need an $or of their own
+    if len(conditions) == 1:
+        query.update(conditions[0])
+    elif conditions:
+        query["$and"] = conditions
+    
+    return query
+
+@api_router.get("/inventory", response_model=List[InventoryItem])
+async def get_inventory(
+    category: Optional[str] = None,
+    gender: Optional[str] = None,
+    color: Optional[str] = None,
+    size: Optional[str] = None,
+    min_price: Optional[float] = None,
+    max_price: Optional[float] = None,
+    status: Optional[ItemStatus] = None,
+    search: Optional[str] = None,
+    sku: Optional[str] = None,
+    name: Optional[str] = None,
+    design: Optional[str] = None,
+    sort_by: Optional[str] = "created_at",
+    sort_order: Optional[str] = "desc",
+    current_user: dict = Depends(get_current_user)
+):
+    query = build_inventory_query(
+        category=category,
+        gender=gender,
+        color=color,
+        size=size,
+        status=status.value if status else None,
+        min_price=min_price,
+        max_price=max_price,
+        search=search,
+        sku=sku,
+        name=name,
+        design=design
+    )
+    query = scope_inventory_query(query, current_user)
     
     # Sort order
     sort_direction = -1 if sort_order == "desc" else 1
@@ -435,7 +1112,7 @@ async def get_filter_options(
 ):
     """Get all unique values for filter dropdowns"""
     # Get all items
-    all_items = await db.inventory.find({}, {"_id": 0, "brand": 1, "warehouse": 1, "product_type": 1, "category": 1, "gender": 1, "color": 1, "size": 1, "design": 1, "fabric_specs": 1}).to_list(10000)
+    all_items = await db.inventory.find(scope_inventory_query({}, current_user), {"_id": 0, "brand": 1, "warehouse": 1, "product_type": 1, "category": 1, "gender": 1, "color": 1, "size": 1, "design": 1, "fabric_specs": 1}).to_list(10000)
     
     brands = sorted(list(set(item.get("brand") for item in all_items if item.get("brand"))))
     warehouses = sorted(list(set(item.get("warehouse") for item in all_items if item.get("warehouse"))))
@@ -478,7 +1155,7 @@ async def get_brand_warehouses(
 ):
     """Get all brands with their associated warehouses"""
     # Get all items
-    all_items = await db.inventory.find({}, {"_id": 0, "brand": 1, "warehouse": 1}).to_list(10000)
+    all_items = await db.inventory.find(scope_inventory_query({}, current_user), {"_id": 0, "brand": 1, "warehouse": 1}).to_list(10000)
     
     # Build brand-warehouse mapping
     brand_warehouses = {}
@@ -556,7 +1233,7 @@ async def get_inventory_item(
     item_id: str,
     current_user: dict = Depends(get_current_user)
 ):
-    item = await db.inventory.find_one({"id": item_id}, {"_id": 0})
+    item = await db.inventory.find_one(scope_inventory_query({"id": item_id}, current_user), {"_id": 0})
     if not item:
         raise HTTPException(status_code=404, detail="Item not found")
     
@@ -577,9 +1254,11 @@ async def update_inventory_item(
     current_user: dict = Depends(require_role([UserRole.ADMIN, UserRole.STAFF]))
 ):
     # Check if item exists
-    existing_item = await db.inventory.find_one({"id": item_id})
+    existing_item = await db.inventory.find_one(scope_inventory_query({"id": item_id}, current_user))
     if not existing_item:
         raise HTTPException(status_code=404, detail="Item not found")
+    if item_data.warehouse:
+        check_warehouse_scope(current_user, item_data.warehouse)
     
     # Prepare update data
     update_data = {k: v for k, v in item_data.model_dump(exclude_unset=True).items() if v is not None}
@@ -595,10 +1274,16 @@ async def update_inventory_item(
                 update_data["fabric_specs"] = update_data["fabric_specs"].model_dump()
             # If it's already a dict, keep it as is
         
-        await db.inventory.update_one(
+        # Manual edits invalidate the import hash so the next import rewrites the row
+        previous_item = await db.inventory.find_one_and_update(
             {"id": item_id},
-            {"$set": update_data}
+            {"$set": update_data, "$unset": {"content_hash": ""}},
+            projection={"_id": 0},
+            return_document=ReturnDocument.BEFORE
         )
+        await bump_inventory_version()
+        if previous_item:
+            await apply_master_data_usage(master_data_usage_delta(previous_item, {**previous_item, **update_data}))
     
     # Fetch and return updated item
     updated_item = await db.inventory.find_one({"id": item_id}, {"_id": 0})
@@ -616,12 +1301,14 @@ async def update_inventory_item(
 @api_router.delete("/inventory/{item_id}")
 async def delete_inventory_item(
     item_id: str,
-    current_user: dict = Depends(require_role([UserRole.ADMIN]))
+    current_user: dict = Depends(require_role([UserRole.ADMIN], fresh_role=True))
 ):
-    result = await db.inventory.delete_one({"id": item_id})
+    deleted_item = await db.inventory.find_one_and_delete(scope_inventory_query({"id": item_id}, current_user), projection={"_id": 0})
     
-    if result.deleted_count == 0:
+    if deleted_item is None:
         raise HTTPException(status_code=404, detail="Item not found")
+    await bump_inventory_version()
+    await apply_master_data_usage(master_data_usage_delta(deleted_item, None))
     
     return {"message": "Item deleted successfully", "id": item_id}
 
@@ -630,7 +1317,7 @@ async def get_inventory_stats(
     current_user: dict = Depends(get_current_user)
 ):
     # Get all items
-    all_items = await db.inventory.find({}, {"_id": 0}).to_list(10000)
+    all_items = await db.inventory.find(scope_inventory_query({}, current_user), {"_id": 0}).to_list(10000)
     
     total_items = len(all_items)
     total_quantity = sum(item["quantity"] for item in all_items)
@@ -647,6 +1334,62 @@ async def get_inventory_stats(
         total_value=round(total_value, 2)
     )
 
+# API Keys
+@api_router.post("/api-keys", response_model=ApiKeyCreated)
+async def create_api_key(
+    key_data: ApiKeyCreate,
+    current_user: dict = Depends(require_role([UserRole.ADMIN], fresh_role=True))
+):
+    """Create an API key for an integration; the key is only shown in this response"""
+    reject_api_key(current_user, "create other API keys")
+    
+    key_id = secrets.token_hex(8)
+    secret = secrets.token_urlsafe(32)
+    key_doc = {
+        "id": key_id,
+        "name": key_data.name,
+        "role": key_data.role.value,
+        "warehouses": key_data.warehouses,
+        "secret_hmac": hash_api_key_secret(secret),
+        "created_by": current_user["email"],
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "revoked_at": None
+    }
+    await db.api_keys.insert_one(key_doc)
+    api_key_table[key_id] = {
+        "secret_hmac": key_doc["secret_hmac"],
+        "name": key_doc["name"],
+        "role": key_doc["role"],
+        "warehouses": key_doc["warehouses"]
+    }
+    
+    return ApiKeyCreated(**key_doc, api_key=f"ik_{key_id}_{secret}")
+
+@api_router.get("/api-keys", response_model=List[ApiKey])
+async def get_api_keys(
+    current_user: dict = Depends(require_role([UserRole.ADMIN], fresh_role=True))
+):
+    """List API keys without their secrets"""
+    reject_api_key(current_user, "list API keys")
+    return await db.api_keys.find({}, {"_id": 0, "secret_hmac": 0}).sort("created_at", -1).to_list(1000)
+
+@api_router.delete("/api-keys/{key_id}")
+async def revoke_api_key(
+    key_id: str,
+    current_user: dict = Depends(require_role([UserRole.ADMIN], fresh_role=True))
+):
+    """Revoke a single API key"""
+    reject_api_key(current_user, "revoke API keys")
+    result = await db.api_keys.update_one(
+        {"id": key_id, "revoked_at": None},
+        {"$set": {"revoked_at": datetime.now(timezone.utc).isoformat()}}
+    )
+    if result.matched_count == 0:
+        raise HTTPException(status_code=404, detail="API key not found")
+    api_key_table.pop(key_id, None)
+    
+    return {"message": "API key revoked successfully"}
+
 # Export Templates
 @api_router.post("/export-templates", response_model=ExportTemplate)
 async def create_export_template(
@@ -663,6 +1406,8 @@ async def create_export_template(
     template_dict["created_at"] = template_dict["created_at"].isoformat()
     
     await db.export_templates.insert_one(template_dict)
+    await bump_export_template_version()
+    export_template_cache.invalidate(current_user["email"])
     
     return template
 
@@ -695,347 +1440,1480 @@ async def delete_export_template(
     
     if result.deleted_count == 0:
         raise HTTPException(status_code=404, detail="Template not found")
+    await bump_export_template_version()
+    export_template_cache.invalidate(current_user["email"], template_id)
     
     return {"message": "Template deleted successfully"}
 
 # Export Functions
-def generate_excel(items: List[dict], fields: List[str]) -> BytesIO:
-    """Generate Excel file"""
-    wb = Workbook()
-    ws = wb.active
-    ws.title = "Inventory Report"
-    
-    # Header style
-    header_fill = PatternFill(start_color="4472C4", end_color="4472C4", fill_type="solid")
-    header_font = Font(bold=True, color="FFFFFF", size=12)
-    
-    # Write headers
-    for col_idx, field in enumerate(fields, 1):
-        cell = ws.cell(row=1, column=col_idx, value=field.replace("_", " ").title())
-        cell.fill = header_fill
-        cell.font = header_font
-        cell.alignment = Alignment(horizontal="center", vertical="center")
-    
-    # Write data
-    for row_idx, item in enumerate(items, 2):
-        for col_idx, field in enumerate(fields, 1):
-            value = item.get(field, "")
-            # Handle nested fabric_specs fields
-            if field == "material":
-                value = item.get("fabric_specs", {}).get("material", "")
-            elif field == "weight":
-                value = item.get("fabric_specs", {}).get("weight", "")
-            elif field == "composition":
-                value = item.get("fabric_specs", {}).get("composition", "")
-            # Convert to string, but handle None and 0 properly
-            if value is None or value == "":
-                ws.cell(row=row_idx, column=col_idx, value="")
-            else:
-                ws.cell(row=row_idx, column=col_idx, value=str(value))
-    
-    # Auto-adjust column widths
-    for col in ws.columns:
-        max_length = 0
-        column = col[0].column_letter
-        for cell in col:
-            if cell.value:
-                max_length = max(max_length, len(str(cell.value)))
-        ws.column_dimensions[column].width = min(max_length + 2, 50)
-    
-    # Save to BytesIO
-    output = BytesIO()
-    wb.save(output)
-    output.seek(0)
-    return output
-
-def generate_word(items: List[dict], fields: List[str]) -> BytesIO:
-    """Generate Word document"""
-    doc = Document()
-    
-    # Title
-    title = doc.add_heading('Inventory Report', 0)
-    title.alignment = WD_ALIGN_PARAGRAPH.CENTER
-    
-    # Add metadata
-    doc.add_paragraph(f'Generated on: {datetime.now().strftime("%Y-%m-%d %H:%M:%S")}')
-    doc.add_paragraph(f'Total Items: {len(items)}')
-    doc.add_paragraph('')
-    
-    # Create table
-    table = doc.add_table(rows=1, cols=len(fields))
-    table.style = 'Light Grid Accent 1'
-    
-    # Header row
-    header_cells = table.rows[0].cells
-    for idx, field in enumerate(fields):
-        header_cells[idx].text = field.replace("_", " ").title()
-        # Bold header
-        for paragraph in header_cells[idx].paragraphs:
-            for run in paragraph.runs:
-                run.font.bold = True
-    
-    # Data rows
-    for item in items:
-        row_cells = table.add_row().cells
-        for idx, field in enumerate(fields):
-            value = item.get(field, "")
-            # Handle nested fabric_specs fields
-            if field == "material":
-                value = item.get("fabric_specs", {}).get("material", "")
-            elif field == "weight":
-                value = item.get("fabric_specs", {}).get("weight", "")
-            elif field == "composition":
-                value = item.get("fabric_specs", {}).get("composition", "")
-            # Convert to string, but handle None and 0 properly
-            if value is None or value == "":
-                row_cells[idx].text = ""
-            else:
-                row_cells[idx].text = str(value)
-    
-    # Save to BytesIO
-    output = BytesIO()
-    doc.save(output)
-    output.seek(0)
-    return output
+def export_header(field: str) -> str:
+    return field.replace("_", " ").title()
+
+def normalize_export_value(value):
+    """Empty values become None, numbers stay numeric, everything else becomes text"""
+    if value is None or value == "":
+        return None
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        if isinstance(value, datetime):
+            return value.strftime("%Y-%m-%d %H:%M:%S")
+        return str(value)
+    return value
+
+def compile_field_accessor(field: str):
+    """Build the function that reads one export field from an inventory document"""
+    if field in EXPORT_FABRIC_FIELDS:
+        def read_fabric_field(item: dict):
+            return normalize_export_value((item.get("fabric_specs") or {}).get(field))
+        return read_fabric_field
+    
+    def read_field(item: dict):
+        return normalize_export_value(item.get(field))
+    return read_field
+
+class ExportPlan:
+    """Requested export fields compiled once into row accessors and a minimal Mongo projection"""
+    
+    def __init__(self, fields: List[str]):
+        self.fields = list(fields)
+        self.headers = [export_header(field) for field in self.fields]
+        self.accessors = [compile_field_accessor(field) for field in self.fields]
+        
+        paths = {f"fabric_specs.{field}" if field in EXPORT_FABRIC_FIELDS else field for field in self.fields}
+        if "fabric_specs" in paths:
+            # The whole sub-document already covers its nested paths
+            paths = {path for path in paths if not path.startswith("fabric_specs.")}
+        self.projection = {"_id": 0, **{path: 1 for path in sorted(paths)}}
+    
+    def row(self, item: dict) -> list:
+        return [accessor(item) for accessor in self.accessors]
+
+class ExportTemplateCache:
+    """In-memory cache of export templates compiled into export plans"""
+    
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self.plans = OrderedDict()  # template id -> (owner email, ExportPlan)
+        self.default_ids = {}  # owner email -> default template id, or None when there is none
+        self.hits = 0
+        self.misses = 0
+        self.version = None
+        self.checked_at = 0.0
+    
+    async def check_version(self):
+        """Drop every cached plan when templates changed on any API worker"""
+        if time.monotonic() - self.checked_at < EXPORT_TEMPLATE_SYNC_SECONDS:
+            return
+        version_doc = await db.data_versions.find_one({"_id": "export_templates"})
+        version = version_doc["version"] if version_doc else 0
+        if version != self.version:
+            self.plans.clear()
+            self.default_ids.clear()
+            self.version = version
+        self.checked_at = time.monotonic()
+    
+    def remember(self, template: dict) -> ExportPlan:
+        plan = ExportPlan(template["fields"])
+        self.plans[template["id"]] = (template["created_by"], plan)
+        while len(self.plans) > self.max_entries:
+            self.plans.popitem(last=False)
+        return plan
+    
+    async def get(self, template_id: str, user_email: str) -> ExportPlan:
+        await self.check_version()
+        entry = self.plans.get(template_id)
+        if entry and entry[0] == user_email:
+            self.plans.move_to_end(template_id)
+            self.hits += 1
+            return entry[1]
+        
+        self.misses += 1
+        template = await db.export_templates.find_one(
+            {"id": template_id, "created_by": user_email},
+            {"_id": 0, "id": 1, "fields": 1, "created_by": 1}
+        )
+        if not template:
+            raise HTTPException(status_code=404, detail="Template not found")
+        return self.remember(template)
+    
+    async def get_default(self, user_email: str) -> Optional[ExportPlan]:
+        await self.check_version()
+        if user_email not in self.default_ids:
+            template = await db.export_templates.find_one(
+                {"created_by": user_email, "is_default": True},
+                {"_id": 0, "id": 1, "fields": 1, "created_by": 1},
+                sort=[("created_at", -1)]
+            )
+            self.default_ids[user_email] = template["id"] if template else None
+            if template:
+                self.remember(template)
+        
+        template_id = self.default_ids[user_email]
+        return await self.get(template_id, user_email) if template_id else None
+    
+    def invalidate(self, user_email: str, template_id: Optional[str] = None):
+        if template_id:
+            self.plans.pop(template_id, None)
+        self.default_ids.pop(user_email, None)
+    
+    def stats(self) -> dict:
+        return {"entries": len(self.plans), "hits": self.hits, "misses": self.misses}
+
+export_template_cache = ExportTemplateCache(EXPORT_TEMPLATE_CACHE_SIZE)
+
+async def bump_export_template_version():
+    """Record a template change so the template caches of other API workers reload"""
+    await db.data_versions.update_one({"_id": "export_templates"}, {"$inc": {"version": 1}}, upsert=True)
+
+async def resolve_export_plan(export_request: Union[ExportRequest, ExportBundleRequest], current_user: dict) -> ExportPlan:
+    """Export plan for explicit fields, a saved template, or the user's default template"""
+    if export_request.fields:
+        return ExportPlan(export_request.fields)
+    if export_request.template_id:
+        return await export_template_cache.get(export_request.template_id, current_user["email"])
+    
+    plan = await export_template_cache.get_default(current_user["email"])
+    if not plan:
+        raise HTTPException(status_code=400, detail="Select at least one field to export")
+    return plan
+
+class ExcelExportWriter:
+    """Writes export rows to a write-only workbook with native numeric cells"""
+    
+    def __init__(self, headers: List[str], output_path: str):
+        self.output_path = output_path
+        self.wb = Workbook(write_only=True)
+        self.ws = self.wb.create_sheet(title="Inventory Report")
+        self.headers = headers
+        self.widths = [len(header) for header in self.headers]
+        # Write-only sheets emit column widths before the first row, so the
+        # first rows are held back until the widths are known
+        self.held_rows = []
+    
+    def write_row(self, values: list):
+        if self.held_rows is None:
+            self.ws.append(values)
+            return
+        for idx, value in enumerate(values):
+            if value is not None:
+                self.widths[idx] = max(self.widths[idx], len(str(value)))
+        self.held_rows.append(values)
+        if len(self.held_rows) >= EXPORT_WIDTH_SAMPLE_ROWS:
+            self.release_held_rows()
+    
+    def release_held_rows(self):
+        for col_idx, width in enumerate(self.widths, 1):
+            self.ws.column_dimensions[get_column_letter(col_idx)].width = min(width + 2, 50)
+        
+        # Header style
+        header_fill = PatternFill(start_color="4472C4", end_color="4472C4", fill_type="solid")
+        header_font = Font(bold=True, color="FFFFFF", size=12)
+        header_cells = []
+        for header in self.headers:
+            cell = WriteOnlyCell(self.ws, value=header)
+            cell.fill = header_fill
+            cell.font = header_font
+            cell.alignment = Alignment(horizontal="center", vertical="center")
+            header_cells.append(cell)
+        self.ws.append(header_cells)
+        
+        for values in self.held_rows:
+            self.ws.append(values)
+        self.held_rows = None
+    
+    def close(self):
+        if self.held_rows is not None:
+            self.release_held_rows()
+        self.wb.save(self.output_path)
+
+class CsvExportWriter:
+    """Writes export rows as CSV to a text stream"""
+    
+    def __init__(self, fields: List[str], stream):
+        self.writer = csv.writer(stream)
+        self.writer.writerow(fields)
+    
+    def write_row(self, values: list):
+        self.writer.writerow(["" if value is None else value for value in values])
+    
+    def close(self):
+        pass
+
+class NdjsonExportWriter:
+    """Writes export rows as one JSON object per line to a text stream"""
+    
+    def __init__(self, fields: List[str], stream):
+        self.fields = fields
+        self.stream = stream
+    
+    def write_row(self, values: list):
+        self.stream.write(json.dumps(dict(zip(self.fields, values))))
+        self.stream.write("\n")
+    
+    def close(self):
+        pass
+
+async def stream_export_rows(cursor, writer_class, plan: ExportPlan):
+    """Yield a text export straight from the database cursor in bounded chunks"""
+    buffer = StringIO()
+    writer = writer_class(plan.fields, buffer)
+    async for item in cursor:
+        writer.write_row(plan.row(item))
+        if buffer.tell() >= EXPORT_STREAM_CHUNK_SIZE:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    writer.close()
+    yield buffer.getvalue()
+
+class WordExportWriter:
+    """Streams export rows into the document XML of a Word file from a precomputed row template"""
+    
+    CELL_MARKER = " __export_cell_{}__ "
+    # Characters that python-docx would reject as not XML compatible
+    INVALID_XML_CHARS = re.compile(r"[\x00-\x08\x0b\x0c\x0e-\x1f\ufffe\uffff]")
+    BATCH_ROWS = 1000
+    
+    def __init__(self, headers: List[str], output_path: str, total_rows: int):
+        # Lay out the document once with python-docx, including one data row holding cell markers
+        doc = Document()
+        title = doc.add_heading('Inventory Report', 0)
+        title.alignment = WD_ALIGN_PARAGRAPH.CENTER
+        doc.add_paragraph(f'Generated on: {datetime.now().strftime("%Y-%m-%d %H:%M:%S")}')
+        doc.add_paragraph(f'Total Items: {total_rows}')
+        doc.add_paragraph('')
+        
+        table = doc.add_table(rows=1, cols=len(headers))
+        table.style = 'Light Grid Accent 1'
+        header_cells = table.rows[0].cells
+        for idx, header in enumerate(headers):
+            header_cells[idx].text = header
+            for paragraph in header_cells[idx].paragraphs:
+                for run in paragraph.runs:
+                    run.font.bold = True
+        template_cells = table.add_row().cells
+        for idx in range(len(headers)):
+            template_cells[idx].text = self.CELL_MARKER.format(idx)
+        
+        template = BytesIO()
+        doc.save(template)
+        template_zip = zipfile.ZipFile(template)
+        document_xml = template_zip.read("word/document.xml").decode("utf-8")
+        
+        # Cut the document around the template row and the row around its cells
+        first_marker = document_xml.index(self.CELL_MARKER.format(0))
+        row_start = max(match.start() for match in re.finditer(r"<w:tr[ >]", document_xml[:first_marker]))
+        row_end = document_xml.index("</w:tr>", first_marker) + len("</w:tr>")
+        self.row_parts = re.split(r" __export_cell_\d+__ ", document_xml[row_start:row_end])
+        self.document_suffix = document_xml[row_end:].encode("utf-8")
+        
+        # Parts are copied in their original order around the streamed document.xml
+        self.zip = zipfile.ZipFile(output_path, "w", zipfile.ZIP_DEFLATED)
+        infos = template_zip.infolist()
+        document_index = next(idx for idx, info in enumerate(infos) if info.filename == "word/document.xml")
+        for info in infos[:document_index]:
+            self.zip.writestr(info, template_zip.read(info))
+        self.trailing_parts = [(info, template_zip.read(info)) for info in infos[document_index + 1:]]
+        self.document = self.zip.open(infos[document_index], "w", force_zip64=True)
+        self.document.write(document_xml[:row_start].encode("utf-8"))
+        self.pending = []
+    
+    def cell_xml(self, value) -> str:
+        if value is None:
+            return ""
+        text = self.INVALID_XML_CHARS.sub("", str(value))
+        text = text.replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;")
+        if "\n" in text or "\t" in text:
+            text = text.replace("\r\n", "\n").replace("\n", '</w:t><w:br/><w:t xml:space="preserve">')
+            text = text.replace("\t", '</w:t><w:tab/><w:t xml:space="preserve">')
+        return text
+    
+    def write_row(self, values: list):
+        parts = self.row_parts
+        row = [parts[0]]
+        for idx, value in enumerate(values):
+            row.append(self.cell_xml(value))
+            row.append(parts[idx + 1])
+        self.pending.append("".join(row))
+        if len(self.pending) >= self.BATCH_ROWS:
+            self.flush()
+    
+    def flush(self):
+        self.document.write("".join(self.pending).encode("utf-8"))
+        self.pending = []
+    
+    def close(self):
+        self.flush()
+        self.document.write(self.document_suffix)
+        self.document.close()
+        for info, data in self.trailing_parts:
+            self.zip.writestr(info, data)
+        self.zip.close()
+
+class PdfExportWriter:
+    """Draws export rows straight onto PDF pages, one page-sized table at a time"""
+    
+    FONT_SIZE = 8
+    HEADER_FONT_SIZE = 9
+    ROW_HEIGHT = 14
+    HEADER_HEIGHT = 20
+    CELL_PADDING = 6
+    MARGIN = 0.5 * inch
+    # Widest Helvetica glyph per point of font size; shorter strings need no measuring
+    MAX_CHAR_WIDTH = 1.015
+    
+    def __init__(self, headers: List[str], output_path: str, total_rows: int):
+        self.output_path = output_path
+        self.total_rows = total_rows
+        self.headers = headers
+        self.char_widths = {}
+        self.widths = [self.text_width(header, self.HEADER_FONT_SIZE) for header in self.headers]
+        # Columns are sized from the first rows before the first page is drawn
+        self.held_rows = []
+        self.page_rows = []
+        self.page_number = 0
+        self.canvas = None
+    
+    def text_width(self, text: str, font_size: float = FONT_SIZE) -> float:
+        # Per-character widths are cached; reportlab's generic stringWidth is slow in pure Python
+        width = 0.0
+        for char in text:
+            char_width = self.char_widths.get(char)
+            if char_width is None:
+                char_width = self.char_widths[char] = stringWidth(char, "Helvetica-Bold", 1)
+            width += char_width
+        return width * font_size
+    
+    def write_row(self, values: list):
+        cells = ["" if value is None else str(value) for value in values]
+        if self.held_rows is None:
+            self.add_to_page(cells)
+            return
+        for idx, text in enumerate(cells):
+            self.widths[idx] = max(self.widths[idx], self.text_width(text))
+        self.held_rows.append(cells)
+        if len(self.held_rows) >= EXPORT_WIDTH_SAMPLE_ROWS:
+            self.start()
+    
+    def start(self):
+        natural_widths = [width + self.CELL_PADDING for width in self.widths]
+        # Wide field sets switch to landscape
+        page_size = A4 if sum(natural_widths) <= A4[0] - 2 * self.MARGIN else landscape(A4)
+        self.page_width, self.page_height = page_size
+        self.col_widths = self.share_width(natural_widths, self.page_width - 2 * self.MARGIN)
+        self.col_x = [self.MARGIN]
+        for width in self.col_widths:
+            self.col_x.append(self.col_x[-1] + width)
+        
+        self.canvas = canvas.Canvas(self.output_path, pagesize=page_size)
+        self.canvas.setTitle("Inventory Report")
+        self.start_page()
+        
+        held_rows, self.held_rows = self.held_rows, None
+        for cells in held_rows:
+            self.add_to_page(cells)
+    
+    @staticmethod
+    def share_width(natural_widths: List[float], available_width: float) -> List[float]:
+        """Keep narrow columns at their natural width and split the rest evenly among the wide ones"""
+        if sum(natural_widths) <= available_width:
+            return natural_widths
+        widths = list(natural_widths)
+        pending = list(range(len(widths)))
+        remaining = available_width
+        while pending:
+            share = remaining / len(pending)
+            narrow = [idx for idx in pending if natural_widths[idx] <= share]
+            if not narrow:
+                for idx in pending:
+                    widths[idx] = share
+                break
+            remaining -= sum(natural_widths[idx] for idx in narrow)
+            pending = [idx for idx in pending if natural_widths[idx] > share]
+        return widths
+    
+    def start_page(self):
+        self.page_number += 1
+        self.top = self.page_height - self.MARGIN
+        if self.page_number == 1:
+            # Title and metadata on the first page only
+            self.canvas.setFont("Helvetica-Bold", 24)
+            self.canvas.setFillColor(colors.HexColor('#4472C4'))
+            self.canvas.drawCentredString(self.page_width / 2, self.top - 24, "Inventory Report")
+            self.canvas.setFont("Helvetica", 10)
+            self.canvas.setFillColor(colors.black)
+            self.canvas.drawString(self.MARGIN, self.top - 54, f"Generated on: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
+            self.canvas.drawString(self.MARGIN, self.top - 68, f"Total Items: {self.total_rows}")
+            self.top -= 84
+        self.capacity = max(1, int((self.top - self.MARGIN - 12 - self.HEADER_HEIGHT) // self.ROW_HEIGHT))
+    
+    def fit(self, text: str, width: float, font_size: float = FONT_SIZE) -> str:
+        """Shorten text with an ellipsis so every row keeps a single-line height"""
+        available = (width - self.CELL_PADDING) / font_size
+        if len(text) * self.MAX_CHAR_WIDTH <= available:
+            return text
+        
+        used = 0.0
+        cut = None
+        ellipsis_width = self.text_width("...", 1)
+        for idx, char in enumerate(text):
+            char_width = self.char_widths.get(char)
+            if char_width is None:
+                char_width = self.char_widths[char] = stringWidth(char, "Helvetica-Bold", 1)
+            if cut is None and used + ellipsis_width > available:
+                cut = max(idx - 1, 0)
+            used += char_width
+            if used > available:
+                return text[:cut] + "..." if cut else ""
+        return text
+    
+    def add_to_page(self, cells: list):
+        self.page_rows.append([self.fit(text, width) for text, width in zip(cells, self.col_widths)])
+        if len(self.page_rows) >= self.capacity:
+            self.finish_page()
+            self.start_page()
+    
+    def finish_page(self):
+        pdf = self.canvas
+        left, right = self.col_x[0], self.col_x[-1]
+        header_bottom = self.top - self.HEADER_HEIGHT
+        
+        # Backgrounds: header band and alternating row stripes
+        pdf.setFillColor(colors.HexColor('#4472C4'))
+        pdf.rect(left, header_bottom, right - left, self.HEADER_HEIGHT, stroke=0, fill=1)
+        pdf.setFillColor(colors.lightgrey)
+        for idx in range(1, len(self.page_rows), 2):
+            pdf.rect(left, header_bottom - self.ROW_HEIGHT * (idx + 1), right - left, self.ROW_HEIGHT, stroke=0, fill=1)
+        
+        # Grid in a single path
+        pdf.setStrokeColor(colors.black)
+        pdf.setLineWidth(0.5)
+        row_lines = [self.top, header_bottom] + [header_bottom - self.ROW_HEIGHT * (idx + 1) for idx in range(len(self.page_rows))]
+        pdf.grid(self.col_x, row_lines)
+        
+        # Cell text through one text object per page
+        text = pdf.beginText()
+        text.setFont("Helvetica-Bold", self.HEADER_FONT_SIZE)
+        text.setFillColor(colors.whitesmoke)
+        baseline = header_bottom + (self.HEADER_HEIGHT - self.HEADER_FONT_SIZE) / 2 + 1
+        for x, header, width in zip(self.col_x, self.headers, self.col_widths):
+            text.setTextOrigin(x + self.CELL_PADDING / 2, baseline)
+            text.textOut(self.fit(header, width, self.HEADER_FONT_SIZE))
+        text.setFont("Helvetica", self.FONT_SIZE)
+        text.setFillColor(colors.black)
+        for idx, cells in enumerate(self.page_rows):
+            baseline = header_bottom - self.ROW_HEIGHT * (idx + 1) + (self.ROW_HEIGHT - self.FONT_SIZE) / 2 + 1
+            for x, cell in zip(self.col_x, cells):
+                if cell:
+                    text.setTextOrigin(x + self.CELL_PADDING / 2, baseline)
+                    text.textOut(cell)
+        pdf.drawText(text)
+        
+        pdf.setFont("Helvetica", 8)
+        pdf.drawRightString(self.page_width - self.MARGIN, self.MARGIN / 2, f"Page {self.page_number}")
+        pdf.showPage()
+        self.page_rows = []
+    
+    def close(self):
+        if self.canvas is None:
+            self.start()
+        if self.page_rows or self.page_number == 1:
+            self.finish_page()
+        self.canvas.save()
+
+# Export Result Cache
+async def get_inventory_version() -> int:
+    """Current inventory data version; it changes on every inventory write"""
+    version_doc = await db.data_versions.find_one({"_id": "inventory"})
+    return version_doc["version"] if version_doc else 0
+
+async def bump_inventory_version():
+    """Record an inventory write so exports rendered before it are no longer served"""
+    await db.data_versions.update_one({"_id": "inventory"}, {"$inc": {"version": 1}}, upsert=True)
+
+def normalize_export_filters(filters: Optional[Dict]) -> dict:
+    """Drop empty filter values so equivalent requests share a cache entry"""
+    return {key: value for key, value in sorted((filters or {}).items()) if value not in (None, "", [])}
+
+class ExportCache:
+    """Size-bounded LRU cache of rendered export files on local disk, shared by the API workers on a host
+    
+    Files being sent hold a shared flock, and eviction only removes files it can lock exclusively,
+    so no worker deletes a file another worker is still serving. Recency is the file mtime.
+    """
+    
+    LOCK_NAME = ".lock"
+    
+    def __init__(self, directory: Path, max_bytes: int):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.pins = {}  # file name -> descriptors holding a shared lock until release()
+        self.hits = 0
+        self.misses = 0
+        # put() runs in threadpool threads while get() runs on the event loop
+        self.lock = threading.Lock()
+    
+    @staticmethod
+    def make_key(query: dict, fields: List[str], export_format: str, version: int) -> str:
+        payload = {"query": query, "fields": fields, "format": export_format, "version": version}
+        return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+    
+    def pin(self, path: Path) -> bool:
+        """Take a shared lock on a cached file; False if another worker evicted it first"""
+        try:
+            fd = os.open(path, os.O_RDONLY)
+        except FileNotFoundError:
+            return False
+        fcntl.flock(fd, fcntl.LOCK_SH)
+        # Eviction unlinks while holding the exclusive lock, so an unlinked file means we lost the race
+        if os.fstat(fd).st_nlink == 0:
+            os.close(fd)
+            return False
+        self.pins.setdefault(path.name, []).append(fd)
+        os.utime(path)
+        return True
+    
+    def get(self, key: str, extension: str) -> Optional[Path]:
+        """Return a cached file pinned against eviction; release() it once the response is sent"""
+        # Files survive restarts; their keys include the data version, so they stay valid
+        path = self.directory / f"{key}.{extension}"
+        with self.lock:
+            if self.pin(path):
+                self.hits += 1
+                return path
+            self.misses += 1
+            return None
+    
+    def put(self, key: str, extension: str, source_path: str) -> Path:
+        """Move a rendered file into the cache, pinned like get(), and evict the least recently used files"""
+        self.directory.mkdir(parents=True, exist_ok=True)
+        path = self.directory / f"{key}.{extension}"
+        # Copy under a hidden name first so other workers never see a partly written file
+        staging_path = self.directory / f".{uuid.uuid4().hex}.{extension}"
+        shutil.move(source_path, staging_path)
+        # Holding the directory lock keeps other workers from evicting the file before it is pinned
+        with self.directory_lock(), self.lock:
+            os.replace(staging_path, path)
+            self.pin(path)
+        self.evict()
+        return path
+    
+    def release(self, path: Path):
+        with self.lock:
+            fds = self.pins.get(path.name)
+            if fds:
+                os.close(fds.pop())
+                if not fds:
+                    del self.pins[path.name]
+        self.evict()
+    
+    @contextmanager
+    def directory_lock(self):
+        self.directory.mkdir(parents=True, exist_ok=True)
+        lock_fd = os.open(self.directory / self.LOCK_NAME, os.O_RDWR | os.O_CREAT)
+        try:
+            fcntl.flock(lock_fd, fcntl.LOCK_EX)
+            yield
+        finally:
+            os.close(lock_fd)
+    
+    def cached_files(self) -> List[tuple]:
+        """(path, stat) of every cached file; hidden names are the lock file and files being moved in"""
+        files = []
+        for entry in os.scandir(self.directory):
+            if entry.is_file() and not entry.name.startswith("."):
+                try:
+                    files.append((entry.path, entry.stat()))
+                except FileNotFoundError:
+                    pass
+        return files
+    
+    def evict(self):
+        """Delete the least recently used unpinned files until the directory fits in max_bytes"""
+        # One evicting worker at a time, so the byte limit holds across all of them
+        with self.directory_lock():
+            files = sorted(self.cached_files(), key=lambda file: file[1].st_mtime)
+            total_bytes = sum(stat.st_size for _, stat in files)
+            remaining = len(files)
+            for path, stat in files:
+                if total_bytes <= self.max_bytes or remaining <= 1:
+                    break
+                try:
+                    fd = os.open(path, os.O_RDONLY)
+                except FileNotFoundError:
+                    continue
+                try:
+                    # Files still being sent by any worker are skipped; they are evicted after their release()
+                    fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    continue
+                else:
+                    os.unlink(path)
+                    total_bytes -= stat.st_size
+                    remaining -= 1
+                finally:
+                    os.close(fd)
+    
+    def stats(self) -> dict:
+        files = self.cached_files() if self.directory.exists() else []
+        return {
+            "entries": len(files),
+            "bytes": sum(stat.st_size for _, stat in files),
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses
+        }
 
-def generate_pdf(items: List[dict], fields: List[str]) -> BytesIO:
-    """Generate PDF document"""
-    output = BytesIO()
-    doc = SimpleDocTemplate(output, pagesize=A4)
-    elements = []
-    
-    # Styles
-    styles = getSampleStyleSheet()
-    title_style = ParagraphStyle(
-        'CustomTitle',
-        parent=styles['Heading1'],
-        fontSize=24,
-        textColor=colors.HexColor('#4472C4'),
-        spaceAfter=30,
-        alignment=1  # Center
-    )
-    
-    # Title
-    elements.append(Paragraph("Inventory Report", title_style))
-    elements.append(Spacer(1, 0.2*inch))
-    
-    # Metadata
-    meta_style = styles['Normal']
-    elements.append(Paragraph(f"Generated on: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}", meta_style))
-    elements.append(Paragraph(f"Total Items: {len(items)}", meta_style))
-    elements.append(Spacer(1, 0.3*inch))
+export_cache = ExportCache(EXPORT_CACHE_DIR, EXPORT_CACHE_MAX_BYTES)
+
+# Export Rendering Pool
+def create_worker_pool(max_workers: int) -> ProcessPoolExecutor:
+    """Process pool for CPU-heavy work; spawned workers never inherit the Mongo client threads"""
+    return ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context("spawn"))
+
+def get_export_pool() -> ProcessPoolExecutor:
+    """Return the shared worker pool used for rendering exports"""
+    global export_process_pool
+    if export_process_pool is None or getattr(export_process_pool, "_broken", False):
+        export_process_pool = create_worker_pool(EXPORT_WORKERS)
+    return export_process_pool
+
+async def spool_export_rows(cursor, plan: ExportPlan, on_progress=None) -> tuple:
+    """Copy the projected rows of a cursor to a temporary JSON-lines file; returns (path, row count)"""
+    row_count = 0
+    with tempfile.NamedTemporaryFile("w", suffix=".jsonl", delete=False, encoding="utf-8") as spool:
+        try:
+            async for item in cursor:
+                spool.write(json.dumps(plan.row(item)))
+                spool.write("\n")
+                row_count += 1
+                if on_progress and row_count % EXPORT_PROGRESS_INTERVAL == 0:
+                    await on_progress(row_count)
+        except Exception:
+            spool.close()
+            os.unlink(spool.name)
+            raise
+    return spool.name, row_count
+
+def render_export_files(
+    export_formats: List[str],
+    fields: List[str],
+    headers: List[str],
+    rows_path: str,
+    output_paths: List[str],
+    total_rows: int
+) -> float:
+    """Render a spooled export once per format, reading the spool a single time; returns the render time (runs in a worker process)"""
+    started = time.perf_counter()
+    writers = []
+    streams = []
+    for export_format, output_path in zip(export_formats, output_paths):
+        if export_format == "excel":
+            writers.append(ExcelExportWriter(headers, output_path))
+        elif export_format == "pdf":
+            writers.append(PdfExportWriter(headers, output_path, total_rows))
+        elif export_format == "word":
+            writers.append(WordExportWriter(headers, output_path, total_rows))
+        else:
+            stream = open(output_path, "w", encoding="utf-8", newline="")
+            streams.append(stream)
+            writer_class = CsvExportWriter if export_format == "csv" else NdjsonExportWriter
+            writers.append(writer_class(fields, stream))
     
-    # Prepare table data
-    table_data = []
+    try:
+        with open(rows_path, encoding="utf-8") as rows_file:
+            for line in rows_file:
+                values = json.loads(line)
+                for writer in writers:
+                    writer.write_row(values)
+        for writer in writers:
+            writer.close()
+    finally:
+        for stream in streams:
+            stream.close()
+    return time.perf_counter() - started
+
+async def render_export(
+    export_formats: List[str],
+    fields: List[str],
+    headers: List[str],
+    rows_path: str,
+    output_paths: List[str],
+    total_rows: int,
+    reject_when_busy: bool = True
+) -> Dict[str, float]:
+    """Render an export in the worker pool, waiting for a free slot; returns timings in ms
+    
+    Requests waiting on the response are turned away with a 503 once EXPORT_MAX_QUEUE exports are queued;
+    background jobs pass reject_when_busy=False and wait their turn.
+    """
+    if reject_when_busy and export_metrics["queued"] >= EXPORT_MAX_QUEUE:
+        export_metrics["rejected"] += 1
+        raise HTTPException(status_code=503, detail="Too many exports in progress. Please try again shortly.")
+    
+    queued_at = time.perf_counter()
+    export_metrics["queued"] += 1
+    try:
+        await export_slots.acquire()
+    finally:
+        export_metrics["queued"] -= 1
+    queue_wait = time.perf_counter() - queued_at
     
-    # Headers
-    headers = [field.replace("_", " ").title() for field in fields]
-    table_data.append(headers)
+    export_metrics["running"] += 1
+    try:
+        loop = asyncio.get_running_loop()
+        render_time = await loop.run_in_executor(
+            get_export_pool(), render_export_files, export_formats, fields, headers, rows_path, output_paths, total_rows
+        )
+    except Exception:
+        export_metrics["failed"] += 1
+        raise
+    finally:
+        export_metrics["running"] -= 1
+        export_slots.release()
+    
+    export_metrics["completed"] += 1
+    export_metrics["queue_wait_ms_total"] += queue_wait * 1000
+    export_metrics["render_ms_total"] += render_time * 1000
+    logger.info(
+        "Rendered %s export in %.0f ms after waiting %.0f ms in queue",
+        "+".join(export_formats), render_time * 1000, queue_wait * 1000
+    )
+    return {"queue_wait_ms": round(queue_wait * 1000, 1), "render_ms": round(render_time * 1000, 1)}
+
+# Import Functions
+def to_storable_value(value):
+    """Keep spreadsheet values MongoDB can store natively, stringify the rest"""
+    if value is None or isinstance(value, (str, bool, int, float, datetime)):
+        return value
+    return str(value)
+
+def read_import_headers(header_row) -> List[str]:
+    """Normalize the header row of an import sheet"""
+    return [str(value).lower().replace(" ", "_") for value in (header_row or ()) if value]
+
+def build_import_item(item_data: dict) -> dict:
+    """Convert a raw spreadsheet row into inventory fields"""
+    # Validate required fields
+    for field in IMPORT_REQUIRED_FIELDS:
+        # Check if field exists in item_data and is not None or empty string
+        # Note: Allow 0 as valid value for numeric fields like quantity
+        if field not in item_data or item_data[field] is None or item_data[field] == '':
+            raise ValueError(f"Missing required field: {field}")
+    
+    # Handle fabric_specs
+    fabric_specs = {
+        "material": str(item_data.get("material", "")),
+        "weight": str(item_data.get("weight", "")) if item_data.get("weight") else None,
+        "composition": str(item_data.get("composition", "")) if item_data.get("composition") else None
+    }
     
-    # Data rows
-    for item in items:
-        row = []
-        for field in fields:
-            value = item.get(field, "")
-            # Handle nested fabric_specs fields
-            if field == "material":
-                value = item.get("fabric_specs", {}).get("material", "")
-            elif field == "weight":
-                value = item.get("fabric_specs", {}).get("weight", "")
-            elif field == "composition":
-                value = item.get("fabric_specs", {}).get("composition", "")
-            # Convert to string, but handle None and 0 properly
-            if value is None or value == "":
-                row.append("")
-            else:
-                row.append(str(value))
-        table_data.append(row)
-    
-    # Create table
-    table = Table(table_data)
-    table.setStyle(TableStyle([
-        ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#4472C4')),
-        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-        ('FONTSIZE', (0, 0), (-1, 0), 10),
-        ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-        ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
-        ('GRID', (0, 0), (-1, -1), 1, colors.black),
-        ('FONTSIZE', (0, 1), (-1, -1), 8),
-        ('ROWBACKGROUNDS', (0, 1), (-1, -1), [colors.white, colors.lightgrey]),
-    ]))
-    
-    elements.append(table)
-    
-    # Build PDF
-    doc.build(elements)
-    output.seek(0)
-    return output
+    return {
+        "sku": str(item_data["sku"]),
+        "name": str(item_data["name"]),
+        "brand": str(item_data["brand"]),
+        "warehouse": str(item_data["warehouse"]),
+        "product_type": str(item_data.get("product_type", "Clothing")),
+        "category": str(item_data["category"]),
+        "gender": str(item_data["gender"]).lower(),
+        "color": str(item_data.get("color", "")),
+        "color_code": str(item_data.get("color_code", "")) if item_data.get("color_code") else None,
+        "fabric_specs": fabric_specs,
+        "size": str(item_data["size"]),
+        "design": str(item_data["design"]),
+        "mrp": float(item_data["mrp"]),
+        "selling_price": float(item_data["selling_price"]),
+        "cost_price": float(item_data["cost_price"]) if item_data.get("cost_price") else None,
+        "quantity": int(item_data["quantity"]),
+        "low_stock_threshold": int(item_data.get("low_stock_threshold", 10)),
+        "status": str(item_data.get("status", "active")).lower()
+    }
 
-@api_router.post("/inventory/import", response_model=ImportResult)
-async def import_inventory(
-    file: UploadFile = File(...),
-    current_user: dict = Depends(require_role([UserRole.ADMIN, UserRole.STAFF]))
-):
-    """Import inventory data from Excel file"""
-    if not file.filename.endswith(('.xlsx', '.xls')):
-        raise HTTPException(status_code=400, detail="Only Excel files (.xlsx, .xls) are supported")
-    
+def resolve_import_sheets(file_path: str, sheets: Optional[str]) -> List[str]:
+    """Pick the worksheets to import and check their headers (runs in a worker process)"""
+    wb = load_workbook(file_path, read_only=True, data_only=True)
     try:
-        # Read Excel file
-        contents = await file.read()
-        wb = load_workbook(BytesIO(contents))
-        ws = wb.active
-        
-        # Get headers from first row
-        headers = []
-        for cell in ws[1]:
-            if cell.value:
-                headers.append(str(cell.value).lower().replace(" ", "_"))
+        if not sheets:
+            selected = [wb.active.title]
+        elif sheets.strip().lower() == "all":
+            selected = wb.sheetnames
+        else:
+            selected = [name.strip() for name in sheets.split(",") if name.strip()]
+            unknown = [name for name in selected if name not in wb.sheetnames]
+            if unknown:
+                raise ValueError(f"Sheets not found in workbook: {', '.join(unknown)}")
         
-        # Required fields
-        required_fields = ['sku', 'name', 'brand', 'warehouse', 'product_type', 'category', 'gender', 'size', 'design', 'mrp', 'selling_price', 'quantity']
-        missing_fields = [field for field in required_fields if field not in headers]
+        sheet_names = []
+        for name in selected:
+            header_row = next(wb[name].iter_rows(max_row=1, values_only=True), None)
+            headers = read_import_headers(header_row)
+            if not headers and len(selected) > 1:
+                # Blank sheets (notes, covers) are skipped when importing several sheets
+                continue
+            
+            missing_fields = [field for field in IMPORT_REQUIRED_FIELDS if field not in headers]
+            if missing_fields:
+                location = f" in sheet '{name}'" if len(selected) > 1 else ""
+                raise ValueError(f"Missing required columns{location}: {', '.join(missing_fields)}")
+            sheet_names.append(name)
         
-        if missing_fields:
-            raise HTTPException(
-                status_code=400,
-                detail=f"Missing required columns: {', '.join(missing_fields)}"
-            )
+        return sheet_names
+    finally:
+        wb.close()
+
+def parse_import_sheet(file_path: str, sheet_name: str) -> dict:
+    """Parse one worksheet into import-ready rows (runs in a worker process)"""
+    wb = load_workbook(file_path, read_only=True, data_only=True)
+    try:
+        rows_iter = wb[sheet_name].iter_rows(values_only=True)
+        header_row = next(rows_iter, None) or ()
+        headers = read_import_headers(header_row)
         
-        # Process rows
         total_rows = 0
-        successful = 0
-        failed = 0
-        inserted = 0
-        updated = 0
+        rows = []
         errors = []
         
-        for row_idx, row in enumerate(ws.iter_rows(min_row=2, values_only=True), start=2):
+        for row_idx, row in enumerate(rows_iter, start=2):
             if not any(row):  # Skip empty rows
                 continue
             
             total_rows += 1
             
+            # Build item dict from row
+            item_data = {}
+            for col_idx, value in enumerate(row):
+                if col_idx < len(headers):
+                    item_data[headers[col_idx]] = value
+            
             try:
-                # Build item dict from row
-                item_data = {}
-                for col_idx, value in enumerate(row):
-                    if col_idx < len(headers):
-                        header = headers[col_idx]
-                        item_data[header] = value
-                
-                # Validate required fields
-                for field in required_fields:
-                    # Check if field exists in item_data and is not None or empty string
-                    # Note: Allow 0 as valid value for numeric fields like quantity
-                    if field not in item_data or item_data[field] is None or item_data[field] == '':
-                        raise ValueError(f"Missing required field: {field}")
-                
-                # Handle fabric_specs
-                fabric_specs = {
-                    "material": str(item_data.get("material", "")),
-                    "weight": str(item_data.get("weight", "")) if item_data.get("weight") else None,
-                    "composition": str(item_data.get("composition", "")) if item_data.get("composition") else None
-                }
-                
-                # Check if item exists (by SKU + Warehouse combination)
-                existing_item = await db.inventory.find_one({
-                    "sku": item_data["sku"],
-                    "warehouse": item_data["warehouse"]
-                })
-                
-                if existing_item:
-                    # Update existing item
-                    update_data = {
-                        "name": str(item_data["name"]),
-                        "brand": str(item_data["brand"]),
-                        "warehouse": str(item_data["warehouse"]),
-                        "product_type": str(item_data.get("product_type", "Clothing")),
-                        "category": str(item_data["category"]),
-                        "gender": str(item_data["gender"]).lower(),
-                        "color": str(item_data.get("color", "")),
-                        "color_code": str(item_data.get("color_code", "")) if item_data.get("color_code") else None,
-                        "fabric_specs": fabric_specs,
-                        "size": str(item_data["size"]),
-                        "design": str(item_data["design"]),
-                        "mrp": float(item_data["mrp"]),
-                        "selling_price": float(item_data["selling_price"]),
-                        "cost_price": float(item_data["cost_price"]) if item_data.get("cost_price") else None,
-                        "quantity": int(item_data["quantity"]),
-                        "low_stock_threshold": int(item_data.get("low_stock_threshold", 10)),
-                        "status": str(item_data.get("status", "active")).lower(),
-                        "updated_at": datetime.now(timezone.utc).isoformat(),
-                        "last_modified_by": current_user["email"]
-                    }
-                    
-                    await db.inventory.update_one(
-                        {
-                            "sku": item_data["sku"],
-                            "warehouse": item_data["warehouse"]
-                        },
-                        {"$set": update_data}
-                    )
-                    updated += 1
-                    successful += 1
-                else:
-                    # Insert new item
-                    new_item = {
-                        "id": str(uuid.uuid4()),
-                        "sku": str(item_data["sku"]),
-                        "name": str(item_data["name"]),
-                        "brand": str(item_data["brand"]),
-                        "warehouse": str(item_data["warehouse"]),
-                        "product_type": str(item_data.get("product_type", "Clothing")),
-                        "category": str(item_data["category"]),
-                        "gender": str(item_data["gender"]).lower(),
-                        "color": str(item_data.get("color", "")),
-                        "color_code": str(item_data.get("color_code", "")) if item_data.get("color_code") else None,
-                        "fabric_specs": fabric_specs,
-                        "size": str(item_data["size"]),
-                        "design": str(item_data["design"]),
-                        "mrp": float(item_data["mrp"]),
-                        "selling_price": float(item_data["selling_price"]),
-                        "cost_price": float(item_data["cost_price"]) if item_data.get("cost_price") else None,
-                        "quantity": int(item_data["quantity"]),
-                        "low_stock_threshold": int(item_data.get("low_stock_threshold", 10)),
-                        "images": [],
-                        "status": str(item_data.get("status", "active")).lower(),
-                        "sync_status": "synced",
-                        "created_at": datetime.now(timezone.utc).isoformat(),
-                        "updated_at": datetime.now(timezone.utc).isoformat(),
-                        "created_by": current_user["email"],
-                        "last_modified_by": current_user["email"],
-                        "last_synced_at": None
-                    }
-                    
-                    await db.inventory.insert_one(new_item)
-                    inserted += 1
-                    successful += 1
-                
+                item = build_import_item(item_data)
             except Exception as e:
-                failed += 1
                 errors.append({
+                    "sheet": sheet_name,
                     "row": row_idx,
                     "sku": item_data.get("sku", "Unknown"),
-                    "error": str(e)
+                    "error": str(e),
+                    "values": [to_storable_value(value) for value in row]
                 })
+                continue
+            
+            rows.append({
+                "sheet": sheet_name,
+                "row": row_idx,
+                "item": item,
+                "content_hash": compute_content_hash(item),
+                "values": [to_storable_value(value) for value in row]
+            })
+        
+        return {
+            "sheet": sheet_name,
+            "header_row": ["" if value is None else str(value) for value in header_row],
+            "total_rows": total_rows,
+            "rows": rows,
+            "errors": errors
+        }
+    finally:
+        wb.close()
+
+def get_import_pool() -> ProcessPoolExecutor:
+    """Return the shared worker pool used for parsing import sheets"""
+    global import_process_pool
+    if import_process_pool is None or getattr(import_process_pool, "_broken", False):
+        import_process_pool = create_worker_pool(IMPORT_WORKERS)
+    return import_process_pool
+
+class ImportBulkWriter:
+    """Batches parsed import rows into bulk inventory writes"""
+    
+    def __init__(self, user_email: str, batch_size: int = IMPORT_BATCH_SIZE):
+        self.user_email = user_email
+        self.batch_size = batch_size
+        self.pending = []
+        self.pending_keys = set()
+        self.inserted = 0
+        self.updated = 0
+        self.unchanged = 0
+        self.errors = []
+        self.master_data_values = {field: set() for field in IMPORT_MASTER_DATA_FIELDS}
+    
+    def collect_master_data(self, item: dict):
+        """Remember the dropdown values used by an imported item"""
+        for field, item_field in IMPORT_MASTER_DATA_FIELDS.items():
+            if item_field.startswith("fabric_specs."):
+                value = (item.get("fabric_specs") or {}).get(item_field.split(".")[1])
+            else:
+                value = item.get(item_field)
+            if value:
+                self.master_data_values[field].add(value)
+    
+    async def add(self, row: dict):
+        key = (row["item"]["sku"], row["item"]["warehouse"])
+        if key in self.pending_keys:
+            # A repeated SKU + Warehouse must see the write of its earlier row
+            await self.flush()
+        self.pending.append(row)
+        self.pending_keys.add(key)
+        if len(self.pending) >= self.batch_size:
+            await self.flush()
+    
+    async def flush(self):
+        if not self.pending:
+            return
+        rows, self.pending, self.pending_keys = self.pending, [], set()
         
-        return ImportResult(
-            total_rows=total_rows,
-            successful=successful,
-            failed=failed,
-            errors=errors,
-            inserted=inserted,
-            updated=updated
+        # One lookup for the whole batch (by SKU + Warehouse combination)
+        existing_hashes = {}
+        existing_items = {}
+        cursor = db.inventory.find(
+            {"sku": {"$in": list({row["item"]["sku"] for row in rows})}},
+            {"_id": 0, "sku": 1, "warehouse": 1, "content_hash": 1, **{field: 1 for field in MASTER_DATA_INVENTORY_FIELDS.values()}}
         )
+        async for doc in cursor:
+            existing_hashes[(doc["sku"], doc["warehouse"])] = doc.get("content_hash")
+            existing_items[(doc["sku"], doc["warehouse"])] = doc
         
-    except HTTPException:
-        # Re-raise HTTP exceptions (like missing columns)
-        raise
+        now = datetime.now(timezone.utc).isoformat()
+        operations = []
+        written = []
+        for row in rows:
+            item = row["item"]
+            key = (item["sku"], item["warehouse"])
+            if key in existing_hashes:
+                if existing_hashes[key] == row["content_hash"]:
+                    # Nothing changed since the last import - skip the write
+                    self.unchanged += 1
+                    self.collect_master_data(item)
+                    continue
+                operations.append(UpdateOne(
+                    {"sku": item["sku"], "warehouse": item["warehouse"]},
+                    {"$set": {
+                        **item,
+                        "content_hash": row["content_hash"],
+                        "updated_at": now,
+                        "last_modified_by": self.user_email
+                    }}
+                ))
+                written.append((row, "updated"))
+            else:
+                operations.append(InsertOne({
+                    "id": str(uuid.uuid4()),
+                    **item,
+                    "content_hash": row["content_hash"],
+                    "images": [],
+                    "sync_status": "synced",
+                    "created_at": now,
+                    "updated_at": now,
+                    "created_by": self.user_email,
+                    "last_modified_by": self.user_email,
+                    "last_synced_at": None
+                }))
+                written.append((row, "inserted"))
+        
+        if not operations:
+            return
+        
+        write_errors = {}
+        try:
+            await db.inventory.bulk_write(operations, ordered=False)
+        except BulkWriteError as e:
+            write_errors = {error["index"]: error["errmsg"] for error in e.details.get("writeErrors", [])}
+        await bump_inventory_version()
+        
+        usage_delta = Counter()
+        for index, (row, outcome) in enumerate(written):
+            if index not in write_errors:
+                previous_item = existing_items.get((row["item"]["sku"], row["item"]["warehouse"]))
+                new_item = {**previous_item, **row["item"]} if previous_item else row["item"]
+                usage_delta.update(master_data_usage_delta(previous_item, new_item))
+        await apply_master_data_usage(usage_delta)
+        
+        for index, (row, outcome) in enumerate(written):
+            if index in write_errors:
+                self.errors.append({
+                    "sheet": row["sheet"],
+                    "row": row["row"],
+                    "sku": row["item"]["sku"],
+                    "error": write_errors[index],
+                    "values": row["values"]
+                })
+            elif outcome == "inserted":
+                self.inserted += 1
+                self.collect_master_data(row["item"])
+            else:
+                self.updated += 1
+                self.collect_master_data(row["item"])
+
+async def register_import_master_data(values_by_field: Dict[str, set]) -> Dict[str, List[str]]:
+    """Add the dropdown values introduced by an import to master data in a single update"""
+    master_doc = await db.master_data.find_one(
+        {"_id": "master_data"},
+        {field: 1 for field in IMPORT_MASTER_DATA_FIELDS}
+    ) or default_master_data()
+    
+    new_values = {}
+    for field, values in values_by_field.items():
+        known_values = set(master_doc.get(field, []))
+        fresh_values = sorted(value for value in values if value not in known_values)
+        if fresh_values:
+            new_values[field] = fresh_values
+    
+    if new_values:
+        # One $addToSet/$each per field, all fields in the same update
+        update = {"$addToSet": {field: {"$each": values} for field, values in new_values.items()}}
+        if "sizes" in new_values and "_id" not in master_doc:
+            # First write creates the document, so keep the default sizes
+            update["$addToSet"]["sizes"]["$each"] = master_doc["sizes"] + new_values["sizes"]
+        await write_master_data(update, upsert=True)
+    
+    return new_values
+
+async def save_import_errors(import_id: str, errors: List[dict], sheet_names: List[str]):
+    """Persist the failing rows of an import for the downloadable error report"""
+    expires_at = datetime.now(timezone.utc) + timedelta(days=IMPORT_ERROR_RETENTION_DAYS)
+    for start in range(0, len(errors), IMPORT_BATCH_SIZE):
+        await db.import_errors.insert_many([
+            {
+                "import_id": import_id,
+                "sheet": error["sheet"],
+                "sheet_index": sheet_names.index(error["sheet"]),
+                "row": error["row"],
+                "sku": error["sku"],
+                "error": error["error"],
+                "values": error["values"],
+                "expires_at": expires_at
+            }
+            for error in errors[start:start + IMPORT_BATCH_SIZE]
+        ])
+
+async def run_import(file_path: str, sheets: Optional[str], current_user: dict, filename: str) -> ImportResult:
+    """Parse the selected sheets in worker processes and write their rows in bulk"""
+    loop = asyncio.get_running_loop()
+    pool = get_import_pool()
+    
+    try:
+        sheet_names = await loop.run_in_executor(pool, resolve_import_sheets, file_path, sheets)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"Failed to process Excel file: {str(e)}")
+    
+    writer = ImportBulkWriter(current_user["email"])
+    total_rows = 0
+    header_rows = {}
+    
+    # Sheets are parsed in parallel; rows are written as soon as each sheet is ready
+    parse_jobs = [loop.run_in_executor(pool, parse_import_sheet, file_path, name) for name in sheet_names]
+    for parse_job in asyncio.as_completed(parse_jobs):
+        try:
+            parsed = await parse_job
+        except Exception as e:
+            raise HTTPException(status_code=400, detail=f"Failed to process Excel file: {str(e)}")
+        
+        total_rows += parsed["total_rows"]
+        header_rows[parsed["sheet"]] = parsed["header_row"]
+        writer.errors.extend(parsed["errors"])
+        for row in parsed["rows"]:
+            warehouse = row["item"]["warehouse"]
+            if current_user.get("warehouses") and warehouse not in current_user["warehouses"]:
+                writer.errors.append({
+                    "sheet": row["sheet"],
+                    "row": row["row"],
+                    "sku": row["item"]["sku"],
+                    "error": f"Access denied to warehouse '{warehouse}'",
+                    "values": row["values"]
+                })
+                continue
+            await writer.add(row)
+    
+    await writer.flush()
+    
+    errors = sorted(writer.errors, key=lambda error: (sheet_names.index(error["sheet"]), error["row"]))
+    successful = writer.inserted + writer.updated + writer.unchanged
+    
+    # Keep the full error list in the database; the response only carries a preview
+    import_id = str(uuid.uuid4())
+    await db.imports.insert_one({
+        "id": import_id,
+        "filename": filename,
+        "sheets": sheet_names,
+        "header_rows": [header_rows.get(name, []) for name in sheet_names],
+        "total_rows": total_rows,
+        "successful": successful,
+        "failed": len(errors),
+        "inserted": writer.inserted,
+        "updated": writer.updated,
+        "unchanged": writer.unchanged,
+        "created_by": current_user["email"],
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "expires_at": datetime.now(timezone.utc) + timedelta(days=IMPORT_ERROR_RETENTION_DAYS)
+    })
+    await save_import_errors(import_id, errors, sheet_names)
+    master_data_added = await register_import_master_data(writer.master_data_values)
+    
+    return ImportResult(
+        total_rows=total_rows,
+        successful=successful,
+        failed=len(errors),
+        errors=[
+            {key: value for key, value in error.items() if key != "values"}
+            for error in errors[:IMPORT_ERROR_PREVIEW_LIMIT]
+        ],
+        inserted=writer.inserted,
+        updated=writer.updated,
+        unchanged=writer.unchanged,
+        import_id=import_id,
+        errors_truncated=len(errors) > IMPORT_ERROR_PREVIEW_LIMIT,
+        master_data_added=master_data_added
+    )
+
+@api_router.post("/inventory/import", response_model=ImportResult)
+async def import_inventory(
+    file: UploadFile = File(...),
+    sheets: Optional[str] = Query(None, description="Comma-separated sheet names, or 'all'. Defaults to the active sheet."),
+    current_user: dict = Depends(require_role([UserRole.ADMIN, UserRole.STAFF]))
+):
+    """Import inventory data from Excel file"""
+    if not file.filename.endswith(('.xlsx', '.xls')):
+        raise HTTPException(status_code=400, detail="Only Excel files (.xlsx, .xls) are supported")
+    
+    # Workers open the workbook by path, so spool the upload to disk first
+    with tempfile.NamedTemporaryFile(suffix=".xlsx", delete=False) as tmp:
+        await run_in_threadpool(shutil.copyfileobj, file.file, tmp)
+    
+    try:
+        return await run_import(tmp.name, sheets, current_user, file.filename)
+    finally:
+        os.unlink(tmp.name)
+
+def format_error_report_row(error_doc: dict, width: int) -> list:
+    """Original row values padded to the header width, followed by the error"""
+    values = list(error_doc.get("values", []))[:width]
+    values += [None] * (width - len(values))
+    return values + [error_doc["error"]]
+
+def error_report_columns(header: list) -> List[tuple]:
+    """Key each header cell by (name, occurrence), so repeated or blank names stay distinct columns"""
+    seen = Counter()
+    columns = []
+    for name in header:
+        columns.append((name, seen[name]))
+        seen[name] += 1
+    return columns
+
+async def stream_error_report_csv(import_doc: dict):
+    """Yield the failing rows of an import as CSV
+    
+    Sheets can have different column layouts, so the header is the union of their columns and each
+    row is placed under its own sheet's headings.
+    """
+    multi_sheet = len(import_doc["sheets"]) > 1
+    sheet_columns = [error_report_columns(header) for header in import_doc["header_rows"]]
+    columns = list(dict.fromkeys(column for header_columns in sheet_columns for column in header_columns))
+    buffer = StringIO()
+    writer = csv.writer(buffer)
+    
+    writer.writerow((["Sheet"] if multi_sheet else []) + [name for name, _ in columns] + ["Error"])
+    
+    cursor = db.import_errors.find({"import_id": import_doc["id"]}, {"_id": 0}).sort([("sheet_index", 1), ("row", 1)])
+    async for error_doc in cursor:
+        header_columns = sheet_columns[error_doc["sheet_index"]]
+        *values, error = format_error_report_row(error_doc, len(header_columns))
+        by_column = dict(zip(header_columns, values))
+        row = [by_column.get(column) for column in columns] + [error]
+        writer.writerow(
+            ([error_doc["sheet"]] if multi_sheet else []) + ["" if value is None else value for value in row]
+        )
+        if buffer.tell() >= 64 * 1024:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    
+    yield buffer.getvalue()
+
+async def write_error_report_xlsx(import_doc: dict, output_path: str):
+    """Write the failing rows of an import to a write-only workbook, one sheet per source sheet"""
+    wb = Workbook(write_only=True)
+    header_font = Font(bold=True)
+    ws = None
+    current_sheet = None
+    
+    cursor = db.import_errors.find({"import_id": import_doc["id"]}, {"_id": 0}).sort([("sheet_index", 1), ("row", 1)])
+    async for error_doc in cursor:
+        if error_doc["sheet"] != current_sheet:
+            current_sheet = error_doc["sheet"]
+            header = import_doc["header_rows"][error_doc["sheet_index"]]
+            ws = wb.create_sheet(title=current_sheet)
+            header_cells = []
+            for value in header + ["Error"]:
+                cell = WriteOnlyCell(ws, value=value)
+                cell.font = header_font
+                header_cells.append(cell)
+            ws.append(header_cells)
+        ws.append(format_error_report_row(error_doc, len(header)))
+    
+    if ws is None:
+        wb.create_sheet(title="Errors").append(["Error"])
+    
+    await run_in_threadpool(wb.save, output_path)
+
+@api_router.get("/inventory/import/{import_id}/errors")
+async def download_import_errors(
+    import_id: str,
+    format: str = Query("xlsx", description="xlsx or csv"),
+    current_user: dict = Depends(require_role([UserRole.ADMIN, UserRole.STAFF]))
+):
+    """Download the failing rows of an import annotated with their errors"""
+    import_query = {"id": import_id}
+    if current_user.get("warehouses"):
+        # Failed rows can belong to any warehouse, so scoped keys only see their own imports
+        import_query["created_by"] = current_user["email"]
+    import_doc = await db.imports.find_one(import_query, {"_id": 0})
+    if not import_doc:
+        raise HTTPException(status_code=404, detail="Import not found or its error report has expired")
+    
+    if format == "csv":
+        return StreamingResponse(
+            stream_error_report_csv(import_doc),
+            media_type="text/csv",
+            headers={"Content-Disposition": f"attachment; filename=import_errors_{import_id}.csv"}
+        )
+    if format != "xlsx":
+        raise HTTPException(status_code=400, detail="Invalid format. Use 'xlsx' or 'csv'")
+    
+    with tempfile.NamedTemporaryFile(suffix=".xlsx", delete=False) as tmp:
+        pass
+    try:
+        await write_error_report_xlsx(import_doc, tmp.name)
+    except Exception:
+        os.unlink(tmp.name)
+        raise
+    
+    return FileResponse(
+        tmp.name,
+        media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+        filename=f"import_errors_{import_id}.xlsx",
+        background=BackgroundTask(os.unlink, tmp.name)
+    )
+
+# ==================== CHUNKED IMPORT UPLOADS ====================
+
+def upload_chunk_count(upload_doc: dict) -> int:
+    """Number of chunks a chunked upload is split into"""
+    return max(1, -(-upload_doc["total_size"] // upload_doc["chunk_size"]))
+
+def expected_chunk_size(upload_doc: dict, index: int) -> int:
+    """Byte size of chunk `index`; only the last chunk may be shorter"""
+    if index == upload_chunk_count(upload_doc) - 1:
+        return upload_doc["total_size"] - upload_doc["chunk_size"] * index
+    return upload_doc["chunk_size"]
+
+def upload_status(upload_doc: dict) -> ChunkedUploadStatus:
+    """Progress view of a chunked upload"""
+    return ChunkedUploadStatus(
+        upload_id=upload_doc["id"],
+        filename=upload_doc["filename"],
+        total_size=upload_doc["total_size"],
+        chunk_size=upload_doc["chunk_size"],
+        total_chunks=upload_chunk_count(upload_doc),
+        received_chunks=sorted(upload_doc.get("received_chunks", [])),
+        completed=upload_doc.get("completed", False),
+        import_id=upload_doc.get("import_id")
+    )
+
+def write_chunk_file(path: Path, data: bytes):
+    # Write to a side file first so a dropped connection never leaves a partial chunk
+    partial_path = path.with_suffix(".part")
+    with open(partial_path, "wb") as f:
+        f.write(data)
+    os.replace(partial_path, path)
+
+def assemble_chunks(upload_dir: Path, total_chunks: int, output_path: Path):
+    """Concatenate the received chunks into the final file"""
+    with open(output_path, "wb") as output:
+        for index in range(total_chunks):
+            with open(upload_dir / f"chunk_{index:06d}", "rb") as chunk:
+                shutil.copyfileobj(chunk, output)
+
+async def cleanup_expired_uploads():
+    """Remove chunk directories of uploads that were never completed"""
+    now = datetime.now(timezone.utc)
+    async for upload_doc in db.import_uploads.find({"expires_at": {"$lt": now}}, {"_id": 0, "id": 1}):
+        await run_in_threadpool(shutil.rmtree, UPLOAD_DIR / upload_doc["id"], True)
+        await db.import_uploads.delete_one({"id": upload_doc["id"]})
+
+async def get_upload_for_user(upload_id: str, current_user: dict) -> dict:
+    """Fetch an upload started by the current user"""
+    upload_doc = await db.import_uploads.find_one({"id": upload_id, "created_by": current_user["email"]}, {"_id": 0})
+    if not upload_doc:
+        raise HTTPException(status_code=404, detail="Upload not found or expired")
+    return upload_doc
+
+@api_router.post("/inventory/import/uploads", response_model=ChunkedUploadStatus)
+async def create_chunked_upload(
+    upload_data: ChunkedUploadCreate,
+    current_user: dict = Depends(require_role([UserRole.ADMIN, UserRole.STAFF]))
+):
+    """Start a resumable chunked upload of an import file"""
+    if not upload_data.filename.endswith(('.xlsx', '.xls')):
+        raise HTTPException(status_code=400, detail="Only Excel files (.xlsx, .xls) are supported")
+    if upload_data.total_size <= 0 or upload_data.total_size > UPLOAD_MAX_FILE_SIZE:
+        raise HTTPException(status_code=400, detail=f"File size must be between 1 and {UPLOAD_MAX_FILE_SIZE} bytes")
+    if upload_data.chunk_size <= 0 or upload_data.chunk_size > UPLOAD_MAX_CHUNK_SIZE:
+        raise HTTPException(status_code=400, detail=f"Chunk size must be between 1 and {UPLOAD_MAX_CHUNK_SIZE} bytes")
+    
+    await cleanup_expired_uploads()
+    
+    upload_doc = {
+        "id": str(uuid.uuid4()),
+        "filename": upload_data.filename,
+        "total_size": upload_data.total_size,
+        "chunk_size": upload_data.chunk_size,
+        "received_chunks": [],
+        "completed": False,
+        "created_by": current_user["email"],
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "expires_at": datetime.now(timezone.utc) + timedelta(hours=UPLOAD_EXPIRY_HOURS)
+    }
+    (UPLOAD_DIR / upload_doc["id"]).mkdir(parents=True, exist_ok=True)
+    await db.import_uploads.insert_one(upload_doc)
+    
+    return upload_status(upload_doc)
+
+@api_router.get("/inventory/import/uploads/{upload_id}", response_model=ChunkedUploadStatus)
+async def get_chunked_upload(
+    upload_id: str,
+    current_user: dict = Depends(require_role([UserRole.ADMIN, UserRole.STAFF]))
+):
+    """Get upload progress so an interrupted client can resume with the missing chunks"""
+    return upload_status(await get_upload_for_user(upload_id, current_user))
+
+@api_router.put("/inventory/import/uploads/{upload_id}/chunks/{index}", response_model=ChunkedUploadStatus)
+async def upload_chunk(
+    upload_id: str,
+    index: int,
+    request: Request,
+    x_chunk_sha256: str = Header(..., description="Hex SHA-256 of the chunk body"),
+    current_user: dict = Depends(require_role([UserRole.ADMIN, UserRole.STAFF]))
+):
+    """Upload chunk `index` (0-based) as the raw request body"""
+    upload_doc = await get_upload_for_user(upload_id, current_user)
+    if upload_doc.get("completed"):
+        raise HTTPException(status_code=400, detail="Upload already completed")
+    if upload_doc.get("state") == "importing":
+        raise HTTPException(status_code=409, detail="Upload is already being imported")
+    if index < 0 or index >= upload_chunk_count(upload_doc):
+        raise HTTPException(status_code=400, detail=f"Chunk index must be between 0 and {upload_chunk_count(upload_doc) - 1}")
+    
+    expected_size = expected_chunk_size(upload_doc, index)
+    digest = hashlib.sha256()
+    data = bytearray()
+    async for piece in request.stream():
+        data.extend(piece)
+        if len(data) > expected_size:
+            raise HTTPException(status_code=400, detail=f"Chunk {index} is larger than {expected_size} bytes")
+        digest.update(piece)
+    
+    if len(data) != expected_size:
+        raise HTTPException(status_code=400, detail=f"Chunk {index} must be {expected_size} bytes, got {len(data)}")
+    if digest.hexdigest() != x_chunk_sha256.lower():
+        raise HTTPException(status_code=400, detail=f"Checksum mismatch for chunk {index}")
+    
+    await run_in_threadpool(write_chunk_file, UPLOAD_DIR / upload_id / f"chunk_{index:06d}", bytes(data))
+    
+    upload_doc = await db.import_uploads.find_one_and_update(
+        {"id": upload_id},
+        {"$addToSet": {"received_chunks": index}},
+        projection={"_id": 0},
+        return_document=ReturnDocument.AFTER
+    )
+    return upload_status(upload_doc)
+
+@api_router.post("/inventory/import/uploads/{upload_id}/complete", response_model=ImportResult)
+async def complete_chunked_upload(
+    upload_id: str,
+    sheets: Optional[str] = Query(None, description="Comma-separated sheet names, or 'all'. Defaults to the active sheet."),
+    current_user: dict = Depends(require_role([UserRole.ADMIN, UserRole.STAFF]))
+):
+    """Assemble the uploaded chunks and import the file"""
+    upload_doc = await get_upload_for_user(upload_id, current_user)
+    if upload_doc.get("completed"):
+        raise HTTPException(status_code=400, detail="Upload already completed")
+    
+    total_chunks = upload_chunk_count(upload_doc)
+    missing_chunks = sorted(set(range(total_chunks)) - set(upload_doc.get("received_chunks", [])))
+    if missing_chunks:
+        raise HTTPException(status_code=400, detail=f"Missing chunks: {missing_chunks[:50]}")
+    
+    # Claim the upload so a retried /complete cannot start a second import of the same chunks
+    claimed = await db.import_uploads.find_one_and_update(
+        {"id": upload_id, "completed": False, "state": {"$ne": "importing"}},
+        {"$set": {"state": "importing"}}
+    )
+    if not claimed:
+        raise HTTPException(status_code=409, detail="Upload is already being imported")
+    
+    upload_dir = UPLOAD_DIR / upload_id
+    file_path = upload_dir / f"upload_{uuid.uuid4().hex}.xlsx"
+    try:
+        await run_in_threadpool(assemble_chunks, upload_dir, total_chunks, file_path)
+        result = await run_import(str(file_path), sheets, current_user, upload_doc["filename"])
+    except BaseException:
+        # A failed import keeps the chunks so the client can retry /complete
+        await db.import_uploads.update_one({"id": upload_id}, {"$unset": {"state": ""}})
+        raise
+    finally:
+        await run_in_threadpool(lambda: file_path.unlink(missing_ok=True))
+    
+    await db.import_uploads.update_one(
+        {"id": upload_id},
+        {"$set": {"completed": True, "import_id": result.import_id}, "$unset": {"state": ""}}
+    )
+    await run_in_threadpool(shutil.rmtree, upload_dir, True)
+    
+    return result
+
+@api_router.delete("/inventory/import/uploads/{upload_id}")
+async def abort_chunked_upload(
+    upload_id: str,
+    current_user: dict = Depends(require_role([UserRole.ADMIN, UserRole.STAFF]))
+):
+    """Cancel a chunked upload and discard its chunks"""
+    await get_upload_for_user(upload_id, current_user)
+    await run_in_threadpool(shutil.rmtree, UPLOAD_DIR / upload_id, True)
+    await db.import_uploads.delete_one({"id": upload_id})
+    
+    return {"message": "Upload cancelled"}
+
+def build_export_query(filters: Optional[Dict], current_user: dict) -> dict:
+    """Mongo query for the filters of an export request, with the same filters as the listing"""
+    filters = normalize_export_filters(filters)
+    
+    # Filter values come from a JSON body, so anything but a string would reach Mongo or re.escape as is
+    for key in EXPORT_TEXT_FILTERS:
+        if key in filters and not isinstance(filters[key], str):
+            raise HTTPException(status_code=400, detail=f"Invalid {key} filter")
+    status_filter = filters.get("status")
+    if status_filter is not None and (
+        not isinstance(status_filter, str) or status_filter not in {item_status.value for item_status in ItemStatus}
+    ):
+        raise HTTPException(status_code=400, detail="Invalid status filter")
+    prices = {}
+    for key in ("min_price", "max_price"):
+        if key in filters:
+            try:
+                prices[key] = float(filters[key])
+            except (TypeError, ValueError):
+                raise HTTPException(status_code=400, detail=f"Invalid {key} filter")
+    
+    query = build_inventory_query(
+        **{key: filters.get(key) for key in EXPORT_TEXT_FILTERS},
+        status=status_filter,
+        **prices
+    )
+    return scope_inventory_query(query, current_user)
+
+def validate_export_request(export_request: ExportRequest):
+    if export_request.format not in EXPORT_FORMATS:
+        raise HTTPException(status_code=400, detail="Invalid format. Use 'excel', 'word', 'pdf', 'csv' or 'ndjson'")
 
 @api_router.post("/inventory/export")
 async def export_inventory(
@@ -1045,95 +2923,600 @@ async def export_inventory(
     """Export inventory data in specified format"""
     # Get filtered items
     filters = export_request.filters or {}
-    query = {}
+    query = build_export_query(filters, current_user)
+    
+    validate_export_request(export_request)
+    extension, media_type = EXPORT_FORMATS[export_request.format]
+    plan = await resolve_export_plan(export_request, current_user)
+    filename = f"inventory_report_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{extension}"
+    
+    # Text formats go straight from the cursor to the response with constant memory
+    if export_request.format in ("csv", "ndjson"):
+        writer_class = CsvExportWriter if export_request.format == "csv" else NdjsonExportWriter
+        return StreamingResponse(
+            stream_export_rows(db.inventory.find(query, plan.projection), writer_class, plan),
+            media_type=media_type,
+            headers={"Content-Disposition": f"attachment; filename={filename}"}
+        )
     
-    if filters.get("brand"):
-        query["brand"] = filters["brand"]
-    if filters.get("warehouse"):
-        query["warehouse"] = filters["warehouse"]
-    if filters.get("category"):
-        query["category"] = filters["category"]
-    if filters.get("gender"):
-        query["gender"] = filters["gender"]
+    # Rendered files are reused until the inventory changes
+    cache_key = ExportCache.make_key(
+        query,
+        plan.fields,
+        export_request.format,
+        await get_inventory_version()
+    )
+    cached_path = export_cache.get(cache_key, extension)
+    if cached_path:
+        return FileResponse(
+            cached_path,
+            media_type=media_type,
+            filename=filename,
+            headers={"X-Export-Cache": "HIT"},
+            background=BackgroundTask(export_cache.release, cached_path)
+        )
     
-    items = await db.inventory.find(query, {"_id": 0}).to_list(10000)
+    cursor = db.inventory.find(query, plan.projection)
+    rows_path, row_count = await spool_export_rows(cursor, plan)
     
-    # Convert datetime objects to strings
-    for item in items:
-        if isinstance(item.get("created_at"), datetime):
-            item["created_at"] = item["created_at"].strftime("%Y-%m-%d %H:%M:%S")
-        if isinstance(item.get("updated_at"), datetime):
-            item["updated_at"] = item["updated_at"].strftime("%Y-%m-%d %H:%M:%S")
-    
-    # Generate file based on format
-    if export_request.format == "excel":
-        file_data = generate_excel(items, export_request.fields)
-        filename = f"inventory_report_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx"
-        media_type = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-    elif export_request.format == "word":
-        file_data = generate_word(items, export_request.fields)
-        filename = f"inventory_report_{datetime.now().strftime('%Y%m%d_%H%M%S')}.docx"
-        media_type = "application/vnd.openxmlformats-officedocument.wordprocessingml.document"
-    elif export_request.format == "pdf":
-        file_data = generate_pdf(items, export_request.fields)
-        filename = f"inventory_report_{datetime.now().strftime('%Y%m%d_%H%M%S')}.pdf"
-        media_type = "application/pdf"
+    with tempfile.NamedTemporaryFile(suffix=f".{extension}", delete=False) as output:
+        pass
+    try:
+        timings = await render_export([export_request.format], plan.fields, plan.headers, rows_path, [output.name], row_count)
+    except Exception:
+        os.unlink(output.name)
+        raise
+    finally:
+        os.unlink(rows_path)
+    
+    file_path = await run_in_threadpool(export_cache.put, cache_key, extension, output.name)
+    
+    return FileResponse(
+        file_path,
+        media_type=media_type,
+        filename=filename,
+        headers={
+            "X-Export-Cache": "MISS",
+            "X-Export-Queue-Wait-Ms": str(timings["queue_wait_ms"]),
+            "X-Export-Render-Ms": str(timings["render_ms"])
+        },
+        background=BackgroundTask(export_cache.release, file_path)
+    )
+
+def write_export_bundle(paths: List[str], output_path: str):
+    """Zip rendered exports; Office files are already compressed and are stored as they are"""
+    with zipfile.ZipFile(output_path, "w", zipfile.ZIP_DEFLATED) as bundle:
+        for path in paths:
+            compression = zipfile.ZIP_STORED if path.endswith((".xlsx", ".docx")) else zipfile.ZIP_DEFLATED
+            bundle.write(path, os.path.basename(path), compress_type=compression)
+
+@api_router.post("/inventory/export/bundle")
+async def export_inventory_bundle(
+    bundle_request: ExportBundleRequest,
+    current_user: dict = Depends(get_current_user)
+):
+    """Export inventory in several formats from a single read, returned as one zip"""
+    export_formats = list(dict.fromkeys(bundle_request.formats))
+    if not export_formats:
+        raise HTTPException(status_code=400, detail="Select at least one format to export")
+    for export_format in export_formats:
+        if export_format not in EXPORT_FORMATS:
+            raise HTTPException(status_code=400, detail="Invalid format. Use 'excel', 'word', 'pdf', 'csv' or 'ndjson'")
+    
+    filters = bundle_request.filters or {}
+    query = build_export_query(filters, current_user)
+    plan = await resolve_export_plan(bundle_request, current_user)
+    filename = f"inventory_report_{datetime.now().strftime('%Y%m%d_%H%M%S')}.zip"
+    
+    cache_key = ExportCache.make_key(
+        query,
+        plan.fields,
+        "bundle:" + "+".join(export_formats),
+        await get_inventory_version()
+    )
+    cached_path = export_cache.get(cache_key, "zip")
+    if cached_path:
+        return FileResponse(
+            cached_path,
+            media_type="application/zip",
+            filename=filename,
+            headers={"X-Export-Cache": "HIT"},
+            background=BackgroundTask(export_cache.release, cached_path)
+        )
+    
+    # One scan of the inventory feeds every writer
+    cursor = db.inventory.find(query, plan.projection)
+    rows_path, row_count = await spool_export_rows(cursor, plan)
+    
+    with tempfile.TemporaryDirectory() as directory:
+        output_paths = [
+            os.path.join(directory, f"inventory_report.{EXPORT_FORMATS[export_format][0]}")
+            for export_format in export_formats
+        ]
+        try:
+            timings = await render_export(export_formats, plan.fields, plan.headers, rows_path, output_paths, row_count)
+        finally:
+            os.unlink(rows_path)
+        
+        bundle_path = os.path.join(directory, filename)
+        await run_in_threadpool(write_export_bundle, output_paths, bundle_path)
+        file_path = await run_in_threadpool(export_cache.put, cache_key, "zip", bundle_path)
+    
+    return FileResponse(
+        file_path,
+        media_type="application/zip",
+        filename=filename,
+        headers={
+            "X-Export-Cache": "MISS",
+            "X-Export-Queue-Wait-Ms": str(timings["queue_wait_ms"]),
+            "X-Export-Render-Ms": str(timings["render_ms"])
+        },
+        background=BackgroundTask(export_cache.release, file_path)
+    )
+
+@api_router.post("/inventory/export/preflight", response_model=ExportPreflight)
+async def preflight_export(
+    export_request: ExportRequest,
+    current_user: dict = Depends(get_current_user)
+):
+    """Estimate the row count and file size of an export before running it"""
+    validate_export_request(export_request)
+    plan = await resolve_export_plan(export_request, current_user)
+    query = build_export_query(export_request.filters, current_user)
+    
+    count_exact = True
+    if not query:
+        row_count = await db.inventory.estimated_document_count()
+        count_exact = False
     else:
-        raise HTTPException(status_code=400, detail="Invalid format. Use 'excel', 'word', or 'pdf'")
+        try:
+            row_count = await db.inventory.count_documents(query, maxTimeMS=EXPORT_PREFLIGHT_COUNT_TIMEOUT_MS)
+        except ExecutionTimeout:
+            row_count = await db.inventory.estimated_document_count()
+            count_exact = False
+    
+    # Size the average row from a small sample written by the text writers
+    encoding, ratio, overhead = EXPORT_SIZE_ESTIMATES[export_request.format]
+    sample = await db.inventory.find(query, plan.projection).limit(EXPORT_PREFLIGHT_SAMPLE_ROWS).to_list(EXPORT_PREFLIGHT_SAMPLE_ROWS)
+    buffer = StringIO()
+    writer = (CsvExportWriter if encoding == "csv" else NdjsonExportWriter)(plan.fields, buffer)
+    header_bytes = len(buffer.getvalue().encode("utf-8"))
+    for item in sample:
+        writer.write_row(plan.row(item))
+    row_bytes = (len(buffer.getvalue().encode("utf-8")) - header_bytes) / len(sample) if sample else 0
+    estimated_bytes = int(overhead + header_bytes + row_count * row_bytes * ratio)
+    
+    background = row_count > EXPORT_BACKGROUND_ROWS or estimated_bytes > EXPORT_BACKGROUND_BYTES
+    return ExportPreflight(
+        format=export_request.format,
+        fields=plan.fields,
+        estimated_rows=row_count,
+        count_exact=count_exact,
+        estimated_bytes=estimated_bytes,
+        recommended_mode="background" if background else "direct"
+    )
+
+# ==================== EXPORT JOBS ====================
+
+def export_job_view(job_doc: dict) -> ExportJob:
+    """Public view of an export job, with a signed download link once it is ready"""
+    download_url = None
+    if job_doc["status"] == "completed":
+        token = jwt.encode(
+            {"job_id": job_doc["id"], "purpose": "export_download", "aud": EXPORT_DOWNLOAD_AUDIENCE, "exp": job_doc["expires_at"]},
+            EXPORT_DOWNLOAD_SECRET,
+            algorithm=JWT_ALGORITHM
+        )
+        download_url = f"/api/inventory/export/jobs/{job_doc['id']}/download?token={token}"
+    
+    return ExportJob(
+        id=job_doc["id"],
+        status=job_doc["status"],
+        format=job_doc["format"],
+        total_rows=job_doc.get("total_rows"),
+        processed_rows=job_doc.get("processed_rows", 0),
+        progress=job_doc.get("progress", 0.0),
+        error=job_doc.get("error"),
+        download_url=download_url,
+        created_at=datetime.fromisoformat(job_doc["created_at"]),
+        completed_at=datetime.fromisoformat(job_doc["completed_at"]) if job_doc.get("completed_at") else None,
+        expires_at=job_doc["expires_at"]
+    )
+
+async def update_export_job(job_id: str, **fields):
+    await db.export_jobs.update_one({"id": job_id}, {"$set": fields})
+
+async def renew_export_job_lease(job_id: str):
+    # Rendering can run for minutes without a progress update, so the lease is renewed on a timer
+    while True:
+        await asyncio.sleep(EXPORT_JOB_LEASE_SECONDS / 3)
+        await update_export_job(
+            job_id,
+            lease_expires_at=datetime.now(timezone.utc) + timedelta(seconds=EXPORT_JOB_LEASE_SECONDS)
+        )
+
+async def run_export_job(job_id: str, export_request: ExportRequest, plan: ExportPlan, query: dict):
+    """Produce the file of an export job in the background"""
+    extension, _ = EXPORT_FORMATS[export_request.format]
+    output_path = EXPORT_JOBS_DIR / f"{job_id}.{extension}"
+    rows_path = None
+    lease_task = asyncio.create_task(renew_export_job_lease(job_id))
     
-    return StreamingResponse(
-        file_data,
+    try:
+        total_rows = await db.inventory.count_documents(query)
+        await update_export_job(job_id, status="running", total_rows=total_rows)
+        
+        async def report_progress(processed_rows: int):
+            # Reading rows is the first 90%, rendering the rest
+            progress = min(processed_rows / total_rows, 1.0) * 0.9 if total_rows else 0.9
+            await update_export_job(job_id, processed_rows=processed_rows, progress=round(progress, 3))
+        
+        cursor = db.inventory.find(query, plan.projection)
+        
+        EXPORT_JOBS_DIR.mkdir(parents=True, exist_ok=True)
+        if export_request.format in ("csv", "ndjson"):
+            writer_class = CsvExportWriter if export_request.format == "csv" else NdjsonExportWriter
+            processed_rows = 0
+            with open(output_path, "w", encoding="utf-8", newline="") as output:
+                writer = writer_class(plan.fields, output)
+                async for item in cursor:
+                    writer.write_row(plan.row(item))
+                    processed_rows += 1
+                    if processed_rows % EXPORT_PROGRESS_INTERVAL == 0:
+                        await report_progress(processed_rows)
+                writer.close()
+            timings = {}
+        else:
+            rows_path, processed_rows = await spool_export_rows(cursor, plan, report_progress)
+            await update_export_job(job_id, processed_rows=processed_rows, progress=0.9)
+            timings = await render_export(
+                [export_request.format], plan.fields, plan.headers, rows_path, [str(output_path)], processed_rows,
+                reject_when_busy=False
+            )
+        
+        await update_export_job(
+            job_id,
+            status="completed",
+            processed_rows=processed_rows,
+            progress=1.0,
+            file_name=output_path.name,
+            completed_at=datetime.now(timezone.utc).isoformat(),
+            **timings
+        )
+    except Exception as e:
+        logger.exception("Export job %s failed", job_id)
+        output_path.unlink(missing_ok=True)
+        detail = e.detail if isinstance(e, HTTPException) else str(e)
+        await update_export_job(job_id, status="failed", error=detail)
+    finally:
+        lease_task.cancel()
+        if rows_path:
+            os.unlink(rows_path)
+        export_job_tasks.pop(job_id, None)
+
+async def cleanup_expired_export_jobs():
+    """Delete the files of expired export jobs and fail jobs that never finished"""
+    now = datetime.now(timezone.utc)
+    async for job_doc in db.export_jobs.find(
+        {"expires_at": {"$lt": now}, "status": {"$in": ["queued", "running", "completed"]}},
+        {"_id": 0, "id": 1, "status": 1, "file_name": 1}
+    ):
+        if job_doc.get("file_name"):
+            (EXPORT_JOBS_DIR / job_doc["file_name"]).unlink(missing_ok=True)
+        if job_doc["status"] == "completed":
+            await update_export_job(job_doc["id"], status="expired")
+        else:
+            await update_export_job(job_doc["id"], status="failed", error="Export did not finish before it expired")
+
+async def fail_orphaned_export_jobs():
+    """Fail export jobs whose worker stopped renewing their lease, e.g. because it restarted"""
+    now = datetime.now(timezone.utc)
+    async for job_doc in db.export_jobs.find(
+        {
+            "status": {"$in": ["queued", "running"]},
+            "$or": [{"lease_expires_at": {"$lt": now}}, {"lease_expires_at": {"$exists": False}}]
+        },
+        {"_id": 0, "id": 1, "format": 1}
+    ):
+        # The lease condition is checked again so a job renewed in the meantime is left alone
+        result = await db.export_jobs.update_one(
+            {
+                "id": job_doc["id"],
+                "status": {"$in": ["queued", "running"]},
+                "$or": [{"lease_expires_at": {"$lt": now}}, {"lease_expires_at": {"$exists": False}}]
+            },
+            {"$set": {"status": "failed", "error": "Export was interrupted by a server restart. Please start it again."}}
+        )
+        if result.modified_count:
+            logger.warning("Export job %s was orphaned and has been failed", job_doc["id"])
+            (EXPORT_JOBS_DIR / f"{job_doc['id']}.{EXPORT_FORMATS[job_doc['format']][0]}").unlink(missing_ok=True)
+
+async def run_janitor():
+    """Periodically remove expired export files and abandoned chunked uploads, fail orphaned export jobs,
+    resume orphaned rename jobs and build the master data usage counters if no worker has yet"""
+    while True:
+        try:
+            await cleanup_expired_export_jobs()
+            await fail_orphaned_export_jobs()
+            await cleanup_expired_uploads()
+            await resume_master_data_renames()
+            await build_master_data_usage()
+        except Exception:
+            logger.exception("Janitor run failed")
+        await asyncio.sleep(JANITOR_INTERVAL_SECONDS)
+
+@api_router.post("/inventory/export/jobs", response_model=ExportJob, status_code=202)
+async def create_export_job(
+    export_request: ExportRequest,
+    current_user: dict = Depends(get_current_user)
+):
+    """Start an export in the background; poll the job and download the file when ready"""
+    validate_export_request(export_request)
+    plan = await resolve_export_plan(export_request, current_user)
+    query = build_export_query(export_request.filters, current_user)
+    
+    now = datetime.now(timezone.utc)
+    job_doc = {
+        "id": str(uuid.uuid4()),
+        "status": "queued",
+        "format": export_request.format,
+        "fields": plan.fields,
+        "template_id": export_request.template_id,
+        "filters": export_request.filters,
+        "processed_rows": 0,
+        "progress": 0.0,
+        "created_by": current_user["email"],
+        "created_at": now.isoformat(),
+        "expires_at": now + timedelta(hours=EXPORT_JOB_TTL_HOURS),
+        "lease_expires_at": now + timedelta(seconds=EXPORT_JOB_LEASE_SECONDS)
+    }
+    await db.export_jobs.insert_one(job_doc)
+    export_job_tasks[job_doc["id"]] = asyncio.create_task(run_export_job(job_doc["id"], export_request, plan, query))
+    
+    return export_job_view(job_doc)
+
+@api_router.get("/inventory/export/jobs", response_model=List[ExportJob])
+async def get_export_jobs(current_user: dict = Depends(get_current_user)):
+    """List the current user's recent export jobs"""
+    job_docs = await db.export_jobs.find(
+        {"created_by": current_user["email"]},
+        {"_id": 0}
+    ).sort("created_at", -1).to_list(50)
+    
+    return [export_job_view(job_doc) for job_doc in job_docs]
+
+@api_router.get("/inventory/export/jobs/{job_id}", response_model=ExportJob)
+async def get_export_job(job_id: str, current_user: dict = Depends(get_current_user)):
+    """Get the status and progress of an export job"""
+    job_doc = await db.export_jobs.find_one({"id": job_id, "created_by": current_user["email"]}, {"_id": 0})
+    if not job_doc:
+        raise HTTPException(status_code=404, detail="Export job not found")
+    
+    return export_job_view(job_doc)
+
+@api_router.get("/inventory/export/jobs/{job_id}/download")
+async def download_export_job(job_id: str, token: str = Query(...)):
+    """Download the file of a finished export job through its signed link"""
+    try:
+        payload = jwt.decode(token, EXPORT_DOWNLOAD_SECRET, algorithms=[JWT_ALGORITHM], audience=EXPORT_DOWNLOAD_AUDIENCE)
+    except jwt.ExpiredSignatureError:
+        raise HTTPException(status_code=410, detail="Download link has expired")
+    except jwt.InvalidTokenError:
+        raise HTTPException(status_code=401, detail="Invalid download link")
+    if payload.get("purpose") != "export_download" or payload.get("job_id") != job_id:
+        raise HTTPException(status_code=401, detail="Invalid download link")
+    
+    job_doc = await db.export_jobs.find_one({"id": job_id}, {"_id": 0})
+    if not job_doc or job_doc["status"] != "completed":
+        raise HTTPException(status_code=404, detail="Export file not available")
+    
+    file_path = EXPORT_JOBS_DIR / job_doc["file_name"]
+    if not file_path.exists():
+        raise HTTPException(status_code=410, detail="Export file has expired")
+    
+    extension, media_type = EXPORT_FORMATS[job_doc["format"]]
+    created_at = datetime.fromisoformat(job_doc["created_at"])
+    return FileResponse(
+        file_path,
         media_type=media_type,
-        headers={"Content-Disposition": f"attachment; filename={filename}"}
+        filename=f"inventory_report_{created_at.strftime('%Y%m%d_%H%M%S')}.{extension}"
     )
 
 # ==================== MASTER DATA MANAGEMENT ====================
 
+class MasterDataSnapshot:
+    """Master data parsed once and held in memory, reloaded when its stored version changes"""
+    
+    def __init__(self):
+        self.loaded = False
+        self.version = None  # None while there is no master data document
+        self.body = b""
+        self.etag = ""
+        self.data = {}
+    
+    def apply(self, master_doc: Optional[dict]):
+        data = {**default_master_data(), **(master_doc or {})}
+        response = {
+            "brands": data["brands"],
+            "warehouses": data["warehouses"],
+            "product_types": data["product_types"],
+            "product_hierarchy": data["product_hierarchy"],
+            "designs": data["designs"],
+            "colors": data["colors"],
+            "sizes": data["sizes"],
+            "materials": data["materials"],
+            "weights": data["weights"]
+        }
+        self.data = response
+        # The response body is serialized once per version, not once per request
+        self.body = json.dumps(response).encode("utf-8")
+        self.etag = f'"{hashlib.sha256(self.body).hexdigest()[:32]}"'
+        self.version = data.get("version", 0) if master_doc else None
+        self.loaded = True
+    
+    async def refresh(self):
+        self.apply(await db.master_data.find_one({"_id": "master_data"}, {"_id": 0}))
+    
+    async def check_version(self):
+        """Reload only when another API worker changed master data"""
+        version_doc = await db.master_data.find_one({"_id": "master_data"}, {"_id": 0, "version": 1})
+        version = version_doc.get("version", 0) if version_doc is not None else None
+        if not self.loaded or version != self.version:
+            await self.refresh()
+
+master_data_snapshot = MasterDataSnapshot()
+
+async def ensure_master_data():
+    """Create the master data document with its defaults (write paths only)"""
+    await db.master_data.update_one(
+        {"_id": "master_data"},
+        {"$setOnInsert": {**default_master_data(), "version": 0}},
+        upsert=True
+    )
+
+async def write_master_data(update: dict, conditions: Optional[dict] = None, upsert: bool = False):
+    """Apply one update to master data, bumping its version and refreshing the snapshot"""
+    update = {**update, "$inc": {**update.get("$inc", {}), "version": 1}}
+    result = await db.master_data.update_one({"_id": "master_data", **(conditions or {})}, update, upsert=upsert)
+    if result.modified_count or result.upserted_id is not None:
+        await master_data_snapshot.refresh()
+    return result
+
+async def apply_master_data_usage(delta: Counter):
+    """Move the per-value usage counters by the changes of one inventory write"""
+    operations = [
+        UpdateOne({"field": field_name, "value": value}, {"$inc": {"count": change}}, upsert=True)
+        for (field_name, value), change in delta.items() if change
+    ]
+    if operations:
+        await db.master_data_usage.bulk_write(operations, ordered=False)
+
+async def count_master_data_usage() -> Dict[tuple, int]:
+    """Count every master data value from inventory, keyed by (field name, value)"""
+    counts = {}
+    for field_name, item_field in MASTER_DATA_INVENTORY_FIELDS.items():
+        pipeline = [
+            {"$match": {item_field: {"$nin": [None, ""]}}},
+            {"$group": {"_id": f"${item_field}", "count": {"$sum": 1}}}
+        ]
+        async for group in db.inventory.aggregate(pipeline):
+            counts[(field_name, group["_id"])] = group["count"]
+    return counts
+
+async def rebuild_master_data_usage() -> int:
+    """Recount every master data value from inventory (first start, or to repair drifted counters)"""
+    counts = await count_master_data_usage()
+    
+    # Overwrite counters in place so a concurrent $inc upsert or a second rebuild never hits the unique index
+    if counts:
+        await db.master_data_usage.bulk_write([
+            UpdateOne({"field": field_name, "value": value}, {"$set": {"count": count}}, upsert=True)
+            for (field_name, value), count in counts.items()
+        ], ordered=False)
+    stale_ids = [
+        usage_doc["_id"]
+        async for usage_doc in db.master_data_usage.find({}, {"field": 1, "value": 1})
+        if (usage_doc["field"], usage_doc["value"]) not in counts
+    ]
+    if stale_ids:
+        await db.master_data_usage.delete_many({"_id": {"$in": stale_ids}})
+    await mark_master_data_usage_built()
+    return len(counts)
+
+async def mark_master_data_usage_built():
+    global master_data_usage_built
+    await db.data_versions.update_one(
+        {"_id": "master_data_usage"},
+        {
+            "$set": {"status": "built", "built_at": datetime.now(timezone.utc).isoformat()},
+            "$unset": {"lease_expires_at": ""}
+        },
+        upsert=True
+    )
+    master_data_usage_built = True
+
+async def master_data_usage_ready() -> bool:
+    """Whether the usage counters have been built, by this or another API worker"""
+    global master_data_usage_built
+    if not master_data_usage_built:
+        marker = await db.data_versions.find_one({"_id": "master_data_usage"}, {"status": 1})
+        master_data_usage_built = bool(marker) and marker.get("status") == "built"
+    return master_data_usage_built
+
+async def claim_master_data_usage_build() -> bool:
+    """True for the one API worker that builds the counters; a build whose worker died is claimed again after its lease"""
+    now = datetime.now(timezone.utc)
+    try:
+        result = await db.data_versions.update_one(
+            {
+                "_id": "master_data_usage",
+                "status": {"$ne": "built"},
+                "$or": [{"lease_expires_at": {"$lt": now}}, {"lease_expires_at": {"$exists": False}}]
+            },
+            {"$set": {
+                "status": "building",
+                "lease_expires_at": now + timedelta(seconds=MASTER_DATA_USAGE_BUILD_LEASE_SECONDS)
+            }},
+            upsert=True
+        )
+    except DuplicateKeyError:
+        return False
+    return result.upserted_id is not None or result.modified_count > 0
+
+async def build_master_data_usage():
+    """Build the counters of a deployment that predates them, or whose first build failed"""
+    if await master_data_usage_ready() or not await claim_master_data_usage_build():
+        return
+    try:
+        await rebuild_master_data_usage()
+    except Exception:
+        # Let the next janitor run retry without waiting for the lease
+        await db.data_versions.update_one({"_id": "master_data_usage"}, {"$unset": {"lease_expires_at": ""}})
+        raise
+
+async def get_master_data_usage_count(field_name: str, value: str) -> int:
+    if not await master_data_usage_ready():
+        return await db.inventory.count_documents({MASTER_DATA_INVENTORY_FIELDS[field_name]: value})
+    usage_doc = await db.master_data_usage.find_one({"field": field_name, "value": value})
+    return usage_doc["count"] if usage_doc else 0
+
+def master_data_values(field_name: str) -> List[str]:
+    """Configured values of a master data list; categories and product names live in the hierarchy"""
+    data = master_data_snapshot.data
+    hierarchy = data.get("product_hierarchy", {})
+    if field_name == "categories":
+        return sorted({category for categories in hierarchy.values() for category in categories})
+    if field_name == "product_names":
+        return sorted({name for categories in hierarchy.values() for names in categories.values() for name in names})
+    return data.get(field_name, [])
+
+async def run_master_data_sync():
+    while True:
+        await asyncio.sleep(MASTER_DATA_SYNC_SECONDS)
+        try:
+            await master_data_snapshot.check_version()
+        except Exception:
+            logger.exception("Master data sync failed")
+
 # Get all master data
 @api_router.get("/master-data")
-async def get_master_data(current_user: dict = Depends(get_current_user)):
+async def get_master_data(request: Request, current_user: dict = Depends(get_current_user)):
     """Get all master data for dropdowns"""
-    try:
-        # Get master data from dedicated collection
-        master_doc = await db.master_data.find_one({"_id": "master_data"})
-        
-        if not master_doc:
-            # Initialize with default values if not exists
-            default_data = {
-                "_id": "master_data",
-                "brands": [],
-                "warehouses": [],
-                "product_types": [],
-                "product_hierarchy": {},  # {"Product Type": {"Category": ["Product Name1", "Product Name2"]}}
-                "designs": [],
-                "colors": [],
-                "sizes": ["XS(36)", "S(38)", "M(40)", "L(42)", "XL(44)", "2XL(46)"],
-                "materials": [],
-                "weights": []
-            }
-            await db.master_data.insert_one(default_data)
-            master_doc = default_data
-        
-        return {
-            "brands": master_doc.get("brands", []),
-            "warehouses": master_doc.get("warehouses", []),
-            "product_types": master_doc.get("product_types", []),
-            "product_hierarchy": master_doc.get("product_hierarchy", {}),
-            "designs": master_doc.get("designs", []),
-            "colors": master_doc.get("colors", []),
-            "sizes": master_doc.get("sizes", ["XS(36)", "S(38)", "M(40)", "L(42)", "XL(44)", "2XL(46)"]),
-            "materials": master_doc.get("materials", []),
-            "weights": master_doc.get("weights", [])
-        }
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+    if not master_data_snapshot.loaded:
+        await master_data_snapshot.refresh()
+    
+    headers = {"ETag": master_data_snapshot.etag, "Cache-Control": "private, no-cache"}
+    if_none_match = request.headers.get("if-none-match", "")
+    if master_data_snapshot.etag in [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]:
+        return Response(status_code=304, headers=headers)
+    
+    return Response(content=master_data_snapshot.body, media_type="application/json", headers=headers)
 
 # Add master data value
 @api_router.post("/master-data/{field_name}")
 async def add_master_data(field_name: str, request: dict, current_user: dict = Depends(get_current_user)):
     """Add a new value to master data"""
-    if current_user["role"] != "admin":
-        raise HTTPException(status_code=403, detail="Only admins can manage master data")
+    check_master_data_admin(current_user)
     
     value = request.get("value", "").strip()
     if not value:
@@ -1143,103 +3526,179 @@ async def add_master_data(field_name: str, request: dict, current_user: dict = D
     if field_name not in valid_fields:
         raise HTTPException(status_code=400, detail=f"Invalid field name. Must be one of: {', '.join(valid_fields)}")
     
-    # Get current master data
-    master_doc = await db.master_data.find_one({"_id": "master_data"})
-    if not master_doc:
-        master_doc = {
-            "_id": "master_data",
-            "brands": [], "warehouses": [], "product_types": [], "categories": [],
-            "product_names": [], "designs": [], "colors": [], 
-            "sizes": ["XS(36)", "S(38)", "M(40)", "L(42)", "XL(44)", "2XL(46)"],
-            "materials": [], "weights": []
-        }
-        await db.master_data.insert_one(master_doc)
+    await ensure_master_data()
     
-    # Check if value already exists
-    current_values = master_doc.get(field_name, [])
-    if value in current_values:
+    # Add the new value unless it already exists
+    result = await write_master_data({"$push": {field_name: value}}, {field_name: {"$ne": value}})
+    if result.matched_count == 0:
         raise HTTPException(status_code=400, detail=f"'{value}' already exists in {field_name}")
     
-    # Add the new value
-    await db.master_data.update_one(
-        {"_id": "master_data"},
-        {"$push": {field_name: value}}
-    )
-    
     return {"message": f"Value '{value}' added to {field_name}", "value": value}
 
 # Update master data value
-@api_router.put("/master-data/{field_name}/{old_value}")
+@api_router.put("/master-data/{field_name}/{old_value}", status_code=202)
 async def update_master_data(field_name: str, old_value: str, request: dict, current_user: dict = Depends(get_current_user)):
-    """Update a master data value"""
-    if current_user["role"] != "admin":
-        raise HTTPException(status_code=403, detail="Only admins can manage master data")
+    """Rename a master data value; inventory items are rewritten by a background job"""
+    check_master_data_admin(current_user)
     
     new_value = request.get("new_value", "").strip()
     if not new_value:
         raise HTTPException(status_code=400, detail="New value cannot be empty")
     
-    valid_fields = ["brands", "warehouses", "product_types", "categories", "product_names", "designs", "colors", "sizes", "materials", "weights"]
-    if field_name not in valid_fields:
+    if field_name not in MASTER_DATA_INVENTORY_FIELDS:
         raise HTTPException(status_code=400, detail="Invalid field name")
+    if new_value == old_value:
+        raise HTTPException(status_code=400, detail="New value is the same as the old value")
     
-    # Update in master data collection
-    master_doc = await db.master_data.find_one({"_id": "master_data"})
-    if master_doc:
-        current_values = master_doc.get(field_name, [])
-        if old_value in current_values:
-            # Remove old value and add new value
-            await db.master_data.update_one(
-                {"_id": "master_data"},
-                {
-                    "$pull": {field_name: old_value},
-                }
-            )
-            await db.master_data.update_one(
-                {"_id": "master_data"},
-                {
-                    "$push": {field_name: new_value}
-                }
-            )
+    # Rename in place in a single update; when the new value already exists the old one is merged into it
+    result = await write_master_data(
+        {"$set": {f"{field_name}.$": new_value}},
+        {field_name: old_value, "$nor": [{field_name: new_value}]}
+    )
+    if result.matched_count == 0:
+        await write_master_data({"$pull": {field_name: old_value}}, {field_name: old_value})
     
-    # Also update all inventory items with the old value
-    field_mapping = {
-        "brands": "brand",
-        "warehouses": "warehouse",
-        "product_types": "product_type",
-        "categories": "category",
-        "product_names": "name",
-        "designs": "design",
-        "colors": "color",
-        "sizes": "size",
-        "materials": "fabric_specs.material",
-        "weights": "fabric_specs.weight"
+    job_doc = {
+        "id": str(uuid.uuid4()),
+        "field_name": field_name,
+        "old_value": old_value,
+        "new_value": new_value,
+        "status": "queued",
+        "total": None,
+        "processed": 0,
+        "error": None,
+        "created_by": current_user["email"],
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "completed_at": None,
+        "lease_expires_at": datetime.now(timezone.utc) + timedelta(seconds=MASTER_DATA_RENAME_LEASE_SECONDS)
     }
+    await db.master_data_jobs.insert_one(job_doc)
+    master_data_rename_tasks[job_doc["id"]] = asyncio.create_task(
+        run_master_data_rename(job_doc["id"], field_name, old_value, new_value)
+    )
     
-    db_field = field_mapping[field_name]
-    
-    if field_name in ["materials", "weights"]:
-        field_key = db_field.split(".")[1]
-        result = await db.inventory.update_many(
-            {f"fabric_specs.{field_key}": old_value},
-            {"$set": {f"fabric_specs.{field_key}": new_value}}
+    return {"message": "Updated successfully", "job_id": job_doc["id"], "status": job_doc["status"]}
+
+async def update_master_data_job(job_id: str, **fields):
+    await db.master_data_jobs.update_one({"id": job_id}, {"$set": fields})
+
+async def run_master_data_rename(job_id: str, field_name: str, old_value: str, new_value: str, processed: int = 0):
+    """Rewrite the inventory items that use a renamed value, one indexed batch at a time"""
+    db_field = MASTER_DATA_INVENTORY_FIELDS[field_name]
+    try:
+        # A resumed job only finds the items the previous run did not reach
+        total = processed + await db.inventory.count_documents({db_field: old_value})
+        await update_master_data_job(job_id, status="running", total=total)
+        
+        while True:
+            batch = await db.inventory.find(
+                {db_field: old_value}, {"_id": 1}
+            ).limit(MASTER_DATA_RENAME_BATCH_SIZE).to_list(MASTER_DATA_RENAME_BATCH_SIZE)
+            if not batch:
+                break
+            # Renamed rows no longer match their import hash, so the next import rewrites them
+            result = await db.inventory.update_many(
+                {"_id": {"$in": [doc["_id"] for doc in batch]}, db_field: old_value},
+                {"$set": {db_field: new_value}, "$unset": {"content_hash": ""}}
+            )
+            processed += result.modified_count
+            await apply_master_data_usage(Counter({(field_name, new_value): result.modified_count, (field_name, old_value): -result.modified_count}))
+            await update_master_data_job(
+                job_id,
+                processed=processed,
+                lease_expires_at=datetime.now(timezone.utc) + timedelta(seconds=MASTER_DATA_RENAME_LEASE_SECONDS)
+            )
+        
+        # Cached exports still show the old value until the inventory version moves
+        if processed:
+            await bump_inventory_version()
+        await update_master_data_job(job_id, status="completed", completed_at=datetime.now(timezone.utc).isoformat())
+    except Exception as e:
+        logger.exception("Master data rename job %s failed", job_id)
+        await update_master_data_job(job_id, status="failed", error=str(e))
+    finally:
+        master_data_rename_tasks.pop(job_id, None)
+
+async def resume_master_data_renames():
+    """Restart rename jobs whose worker died before finishing them"""
+    while True:
+        now = datetime.now(timezone.utc)
+        job_doc = await db.master_data_jobs.find_one_and_update(
+            {
+                "status": {"$in": ["queued", "running"]},
+                "$or": [{"lease_expires_at": {"$lt": now}}, {"lease_expires_at": {"$exists": False}}]
+            },
+            {"$set": {"lease_expires_at": now + timedelta(seconds=MASTER_DATA_RENAME_LEASE_SECONDS)}},
+            projection={"_id": 0}
         )
+        if not job_doc:
+            return
+        logger.info("Resuming master data rename job %s", job_doc["id"])
+        master_data_rename_tasks[job_doc["id"]] = asyncio.create_task(run_master_data_rename(
+            job_doc["id"], job_doc["field_name"], job_doc["old_value"], job_doc["new_value"], job_doc.get("processed", 0)
+        ))
+
+@api_router.get("/master-data/usage")
+async def get_master_data_usage(current_user: dict = Depends(get_current_user)):
+    """How many inventory items use each master data value, and which values are unused"""
+    check_master_data_admin(current_user)
+    
+    await master_data_snapshot.check_version()
+    counts = {field_name: {} for field_name in MASTER_DATA_INVENTORY_FIELDS}
+    if await master_data_usage_ready():
+        async for usage_doc in db.master_data_usage.find({"count": {"$gt": 0}}, {"_id": 0}):
+            if usage_doc["field"] in counts:
+                counts[usage_doc["field"]][usage_doc["value"]] = usage_doc["count"]
     else:
-        result = await db.inventory.update_many(
-            {db_field: old_value},
-            {"$set": {db_field: new_value}}
-        )
+        for (field_name, value), count in (await count_master_data_usage()).items():
+            counts[field_name][value] = count
+    
+    return {
+        field_name: {
+            "counts": counts[field_name],
+            "unused": [value for value in master_data_values(field_name) if value not in counts[field_name]]
+        }
+        for field_name in MASTER_DATA_INVENTORY_FIELDS
+    }
+
+@api_router.post("/master-data/usage/rebuild")
+async def rebuild_master_data_usage_counts(current_user: dict = Depends(require_role([UserRole.ADMIN], fresh_role=True))):
+    """Recount master data usage from inventory"""
+    check_master_data_admin(current_user)
+    values = await rebuild_master_data_usage()
+    return {"message": "Usage counters rebuilt", "values": values}
+
+@api_router.get("/master-data/rename-jobs/{job_id}")
+async def get_master_data_rename_job(job_id: str, current_user: dict = Depends(get_current_user)):
+    """Get the progress of a master data rename"""
+    check_master_data_admin(current_user)
     
-    return {"message": f"Updated successfully", "modified_count": result.modified_count}
+    job_doc = await db.master_data_jobs.find_one({"id": job_id}, {"_id": 0, "lease_expires_at": 0})
+    if not job_doc:
+        raise HTTPException(status_code=404, detail="Rename job not found")
+    return job_doc
 
 # ==================== PRODUCT HIERARCHY MANAGEMENT ====================
 
+def hierarchy_path(*keys: str) -> str:
+    """Dotted path into product_hierarchy; names become keys, so they cannot contain '.' or start with '$'"""
+    for key in keys:
+        if "." in key or key.startswith("$"):
+            raise HTTPException(status_code=400, detail=f"'{key}' cannot contain '.' or start with '$'")
+    return ".".join(("product_hierarchy",) + keys)
+
+async def get_hierarchy_branch(product_type: str) -> Optional[dict]:
+    """Read one product type of the hierarchy, to explain why a conditional update did not match"""
+    master_doc = await db.master_data.find_one({"_id": "master_data"}, {"_id": 0, hierarchy_path(product_type): 1})
+    if not master_doc:
+        raise HTTPException(status_code=404, detail="Master data not initialized")
+    return master_doc.get("product_hierarchy", {}).get(product_type)
+
 # Add category to product type
 @api_router.post("/master-data/hierarchy/category")
 async def add_category_to_product_type(request: dict, current_user: dict = Depends(get_current_user)):
     """Add a category under a product type"""
-    if current_user["role"] != "admin":
-        raise HTTPException(status_code=403, detail="Only admins can manage master data")
+    check_master_data_admin(current_user)
     
     product_type = request.get("product_type", "").strip()
     category = request.get("category", "").strip()
@@ -1247,33 +3706,19 @@ async def add_category_to_product_type(request: dict, current_user: dict = Depen
     if not product_type or not category:
         raise HTTPException(status_code=400, detail="Product type and category are required")
     
-    master_doc = await db.master_data.find_one({"_id": "master_data"})
-    if not master_doc:
-        raise HTTPException(status_code=404, detail="Master data not initialized")
-    
-    hierarchy = master_doc.get("product_hierarchy", {})
-    
-    if product_type not in hierarchy:
-        hierarchy[product_type] = {}
-    
-    if category in hierarchy[product_type]:
+    path = hierarchy_path(product_type, category)
+    result = await write_master_data({"$set": {path: []}}, {path: {"$exists": False}})
+    if result.matched_count == 0:
+        await get_hierarchy_branch(product_type)
         raise HTTPException(status_code=400, detail=f"Category '{category}' already exists under '{product_type}'")
     
-    hierarchy[product_type][category] = []
-    
-    await db.master_data.update_one(
-        {"_id": "master_data"},
-        {"$set": {"product_hierarchy": hierarchy}}
-    )
-    
     return {"message": f"Category '{category}' added to '{product_type}'"}
 
 # Add product name to category
 @api_router.post("/master-data/hierarchy/product-name")
 async def add_product_name_to_category(request: dict, current_user: dict = Depends(get_current_user)):
     """Add a product name under a category"""
-    if current_user["role"] != "admin":
-        raise HTTPException(status_code=403, detail="Only admins can manage master data")
+    check_master_data_admin(current_user)
     
     product_type = request.get("product_type", "").strip()
     category = request.get("category", "").strip()
@@ -1282,28 +3727,16 @@ async def add_product_name_to_category(request: dict, current_user: dict = Depen
     if not product_type or not category or not product_name:
         raise HTTPException(status_code=400, detail="Product type, category, and product name are required")
     
-    master_doc = await db.master_data.find_one({"_id": "master_data"})
-    if not master_doc:
-        raise HTTPException(status_code=404, detail="Master data not initialized")
-    
-    hierarchy = master_doc.get("product_hierarchy", {})
-    
-    if product_type not in hierarchy:
-        raise HTTPException(status_code=400, detail=f"Product type '{product_type}' not found")
-    
-    if category not in hierarchy[product_type]:
-        raise HTTPException(status_code=400, detail=f"Category '{category}' not found under '{product_type}'")
-    
-    if product_name in hierarchy[product_type][category]:
+    path = hierarchy_path(product_type, category)
+    result = await write_master_data({"$push": {path: product_name}}, {path: {"$exists": True, "$ne": product_name}})
+    if result.matched_count == 0:
+        branch = await get_hierarchy_branch(product_type)
+        if branch is None:
+            raise HTTPException(status_code=400, detail=f"Product type '{product_type}' not found")
+        if category not in branch:
+            raise HTTPException(status_code=400, detail=f"Category '{category}' not found under '{product_type}'")
         raise HTTPException(status_code=400, detail=f"Product name '{product_name}' already exists")
     
-    hierarchy[product_type][category].append(product_name)
-    
-    await db.master_data.update_one(
-        {"_id": "master_data"},
-        {"$set": {"product_hierarchy": hierarchy}}
-    )
-    
     return {"message": f"Product name '{product_name}' added to '{category}'"}
 
 # Delete from hierarchy
@@ -1316,69 +3749,40 @@ async def delete_from_hierarchy(
     current_user: dict = Depends(get_current_user)
 ):
     """Delete category or product name from hierarchy"""
-    if current_user["role"] != "admin":
-        raise HTTPException(status_code=403, detail="Only admins can manage master data")
+    check_master_data_admin(current_user)
     
-    master_doc = await db.master_data.find_one({"_id": "master_data"})
-    if not master_doc:
-        raise HTTPException(status_code=404, detail="Master data not initialized")
-    
-    hierarchy = master_doc.get("product_hierarchy", {})
+    if hierarchy_type not in ("category", "product_name"):
+        raise HTTPException(status_code=400, detail="Invalid hierarchy type")
+    if not product_type or not category:
+        raise HTTPException(status_code=404, detail=f"Category '{category}' not found in '{product_type}'")
     
+    path = hierarchy_path(product_type, category)
     if hierarchy_type == "category":
-        if product_type and product_type in hierarchy and category and category in hierarchy[product_type]:
-            del hierarchy[product_type][category]
-        else:
-            raise HTTPException(status_code=404, detail=f"Category '{category}' not found in '{product_type}'")
-    elif hierarchy_type == "product_name":
-        if product_type and product_type in hierarchy and category and category in hierarchy[product_type]:
-            if product_name and product_name in hierarchy[product_type][category]:
-                hierarchy[product_type][category].remove(product_name)
-            else:
-                raise HTTPException(status_code=404, detail=f"Product '{product_name}' not found")
-        else:
+        result = await write_master_data({"$unset": {path: ""}}, {path: {"$exists": True}})
+        if result.matched_count == 0:
+            await get_hierarchy_branch(product_type)
             raise HTTPException(status_code=404, detail=f"Category '{category}' not found in '{product_type}'")
     else:
-        raise HTTPException(status_code=400, detail="Invalid hierarchy type")
-    
-    await db.master_data.update_one(
-        {"_id": "master_data"},
-        {"$set": {"product_hierarchy": hierarchy}}
-    )
+        # Without a product name the condition would be {path: None}, which matches a missing category
+        result = await write_master_data({"$pull": {path: product_name}}, {path: product_name}) if product_name else None
+        if result is None or result.matched_count == 0:
+            branch = await get_hierarchy_branch(product_type)
+            if branch is None or category not in branch:
+                raise HTTPException(status_code=404, detail=f"Category '{category}' not found in '{product_type}'")
+            raise HTTPException(status_code=404, detail=f"Product '{product_name}' not found")
     
     return {"message": "Deleted successfully"}
 # Delete master data value
 @api_router.delete("/master-data/{field_name}/{value}")
 async def delete_master_data(field_name: str, value: str, current_user: dict = Depends(get_current_user)):
     """Delete a master data value"""
-    if current_user["role"] != "admin":
-        raise HTTPException(status_code=403, detail="Only admins can manage master data")
+    check_master_data_admin(current_user)
     
-    valid_fields = ["brands", "warehouses", "product_types", "categories", "product_names", "designs", "colors", "sizes", "materials", "weights"]
-    if field_name not in valid_fields:
+    if field_name not in MASTER_DATA_INVENTORY_FIELDS:
         raise HTTPException(status_code=400, detail="Invalid field name")
     
-    # Check if value is used in inventory
-    field_mapping = {
-        "brands": "brand",
-        "warehouses": "warehouse",
-        "product_types": "product_type",
-        "categories": "category",
-        "product_names": "name",
-        "designs": "design",
-        "colors": "color",
-        "sizes": "size",
-        "materials": "fabric_specs.material",
-        "weights": "fabric_specs.weight"
-    }
-    
-    db_field = field_mapping[field_name]
-    
-    if field_name in ["materials", "weights"]:
-        field_key = db_field.split(".")[1]
-        count = await db.inventory.count_documents({f"fabric_specs.{field_key}": value})
-    else:
-        count = await db.inventory.count_documents({db_field: value})
+    # Usage counters are kept up to date by inventory writes, so this is a single lookup
+    count = await get_master_data_usage_count(field_name, value)
     
     if count > 0:
         raise HTTPException(
@@ -1387,14 +3791,45 @@ async def delete_master_data(field_name: str, value: str, current_user: dict = D
         )
     
     # Remove from master data
-    await db.master_data.update_one(
-        {"_id": "master_data"},
-        {"$pull": {field_name: value}}
-    )
+    await write_master_data({"$pull": {field_name: value}})
+    await db.master_data_usage.delete_one({"field": field_name, "value": value, "count": {"$lte": 0}})
     
     return {"message": f"Value '{value}' deleted successfully"}
 
 
+# Metrics
+@api_router.get("/metrics")
+async def get_metrics(current_user: dict = Depends(require_role([UserRole.ADMIN], fresh_role=True))):
+    """Runtime counters of this API worker"""
+    completed = export_metrics["completed"]
+    hashed = password_hash_metrics["completed"]
+    return {
+        "exports": {
+            **export_metrics,
+            "workers": EXPORT_WORKERS,
+            "max_queue": EXPORT_MAX_QUEUE,
+            "avg_queue_wait_ms": round(export_metrics["queue_wait_ms_total"] / completed, 1) if completed else 0.0,
+            "avg_render_ms": round(export_metrics["render_ms_total"] / completed, 1) if completed else 0.0,
+            "cache": export_cache.stats(),
+            "template_cache": export_template_cache.stats()
+        },
+        "user_cache": user_cache.stats(),
+        "login_throttle": {
+            **login_throttle_metrics,
+            "enabled": LOGIN_RATE_LIMIT_ENABLED,
+            "tracked_ips": len(login_ip_limiter.buckets),
+            "tracked_emails": len(login_email_limiter.buckets)
+        },
+        "password_hashing": {
+            **password_hash_metrics,
+            "workers": PASSWORD_HASH_WORKERS,
+            "max_queue": PASSWORD_HASH_MAX_QUEUE,
+            "bcrypt_rounds": BCRYPT_ROUNDS,
+            "avg_queue_wait_ms": round(password_hash_metrics["queue_wait_ms_total"] / hashed, 1) if hashed else 0.0,
+            "avg_hash_ms": round(password_hash_metrics["hash_ms_total"] / hashed, 1) if hashed else 0.0
+        }
+    }
+
 # Health check
 @api_router.get("/health")
 async def health_check():
@@ -1430,6 +3865,68 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+@app.on_event("startup")
+async def ensure_indexes():
+    # Import reports expire on their own after IMPORT_ERROR_RETENTION_DAYS
+    await db.imports.create_index("id", unique=True)
+    await db.imports.create_index("expires_at", expireAfterSeconds=0)
+    await db.import_errors.create_index([("import_id", 1), ("sheet_index", 1), ("row", 1)])
+    await db.import_errors.create_index("expires_at", expireAfterSeconds=0)
+    await db.import_uploads.create_index("id", unique=True)
+    await db.refresh_tokens.create_index("token_hash", unique=True)
+    await db.refresh_tokens.create_index("session_id")
+    await db.refresh_tokens.create_index("expires_at", expireAfterSeconds=0)
+    await db.revoked_sessions.create_index("session_id", unique=True)
+    await db.revoked_sessions.create_index("expires_at", expireAfterSeconds=0)
+    await db.api_keys.create_index("id", unique=True)
+    # Listing and export filters; sku prefix searches use the sku index
+    await db.inventory.create_index("sku")
+    await db.inventory.create_index([("brand", 1), ("warehouse", 1)])
+    await db.inventory.create_index("warehouse")
+    await db.inventory.create_index([("category", 1), ("gender", 1)])
+    await db.inventory.create_index("color")
+    await db.inventory.create_index("size")
+    await db.inventory.create_index("mrp")
+    await db.inventory.create_index("selling_price")
+    await db.inventory.create_index("created_at")
+    # Master data renames rewrite inventory by these fields in batches
+    await db.inventory.create_index("product_type")
+    await db.inventory.create_index("name")
+    await db.inventory.create_index("design")
+    await db.inventory.create_index("fabric_specs.material")
+    await db.inventory.create_index("fabric_specs.weight")
+    await db.master_data_jobs.create_index("id", unique=True)
+    await db.master_data_jobs.create_index([("status", 1), ("lease_expires_at", 1)])
+    await db.master_data_usage.create_index([("field", 1), ("value", 1)], unique=True)
+    await db.export_templates.create_index("id", unique=True)
+    await db.export_templates.create_index([("created_by", 1), ("is_default", 1), ("created_at", -1)])
+    # Export job records disappear a day after their download link expired
+    await db.export_jobs.create_index("id", unique=True)
+    await db.export_jobs.create_index([("created_by", 1), ("created_at", -1)])
+    await db.export_jobs.create_index([("status", 1), ("lease_expires_at", 1)])
+    await db.export_jobs.create_index("expires_at", expireAfterSeconds=24 * 3600)
+
+@app.on_event("startup")
+async def start_background_tasks():
+    global janitor_task, revocation_sync_task, master_data_sync_task
+    janitor_task = asyncio.create_task(run_janitor())
+    await load_revoked_sessions()
+    await load_api_keys()
+    revocation_sync_task = asyncio.create_task(run_revocation_sync())
+    await master_data_snapshot.refresh()
+    master_data_sync_task = asyncio.create_task(run_master_data_sync())
+
 @app.on_event("shutdown")
 async def shutdown_db_client():
+    if janitor_task is not None:
+        janitor_task.cancel()
+    if revocation_sync_task is not None:
+        revocation_sync_task.cancel()
+    if master_data_sync_task is not None:
+        master_data_sync_task.cancel()
     client.close()
+    if import_process_pool is not None:
+        import_process_pool.shutdown(wait=False, cancel_futures=True)
+    if export_process_pool is not None:
+        export_process_pool.shutdown(wait=False, cancel_futures=True)
+    password_hash_pool.shutdown(wait=False, cancel_futures=True)
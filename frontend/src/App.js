@@ -1,10 +1,34 @@
 import { useState, useEffect } from 'react';
+import axios from 'axios';
 import './App.css';
 import Login from './components/Login';
 import Dashboard from './components/Dashboard';
 import Settings from './components/Settings';
 import { Toaster } from './components/ui/sonner';
 
+const BACKEND_URL = process.env.REACT_APP_BACKEND_URL;
+const API = `${BACKEND_URL}/api`;
+
+// Concurrent 401s in this tab share one refresh call, since each refresh token works only once
+// (other tabs are covered by the server's short reuse grace period)
+let refreshPromise = null;
+
+const refreshTokens = () => {
+  if (!refreshPromise) {
+    refreshPromise = axios
+      .post(`${API}/auth/refresh`, { refresh_token: localStorage.getItem('refreshToken') })
+      .then((response) => {
+        localStorage.setItem('authToken', response.data.access_token);
+        localStorage.setItem('refreshToken', response.data.refresh_token);
+        return response.data.access_token;
+      })
+      .finally(() => {
+        refreshPromise = null;
+      });
+  }
+  return refreshPromise;
+};
+
 function App() {
   const [isAuthenticated, setIsAuthenticated] = useState(false);
   const [user, setUser] = useState(null);
@@ -15,6 +39,37 @@ function App() {
     checkAuth();
   }, []);
 
+  // Access tokens are short-lived: on a 401, refresh once and retry the request
+  useEffect(() => {
+    const interceptor = axios.interceptors.response.use(
+      (response) => response,
+      async (error) => {
+        const request = error.config;
+        const isSessionCall = ['/auth/login', '/auth/refresh', '/auth/logout'].some((path) => request?.url?.endsWith(path));
+        if (error.response?.status !== 401 || !request || request._retried || isSessionCall || !localStorage.getItem('refreshToken')) {
+          return Promise.reject(error);
+        }
+
+        request._retried = true;
+        // Another tab may already have refreshed: reuse its token instead of spending the refresh token again
+        const storedToken = localStorage.getItem('authToken');
+        if (storedToken && request.headers?.Authorization !== `Bearer ${storedToken}`) {
+          request.headers.Authorization = `Bearer ${storedToken}`;
+          return axios(request);
+        }
+        try {
+          const token = await refreshTokens();
+          request.headers.Authorization = `Bearer ${token}`;
+          return axios(request);
+        } catch (refreshError) {
+          clearSession();
+          return Promise.reject(error);
+        }
+      }
+    );
+    return () => axios.interceptors.response.eject(interceptor);
+  }, []);
+
   const checkAuth = () => {
     const token = localStorage.getItem('authToken');
     const userData = localStorage.getItem('user');
@@ -26,20 +81,30 @@ function App() {
     setLoading(false);
   };
 
-  const handleLogin = (token, userData) => {
+  const handleLogin = (token, userData, refreshToken) => {
     localStorage.setItem('authToken', token);
+    localStorage.setItem('refreshToken', refreshToken);
     localStorage.setItem('user', JSON.stringify(userData));
     setIsAuthenticated(true);
     setUser(userData);
   };
 
-  const handleLogout = () => {
+  const clearSession = () => {
     localStorage.removeItem('authToken');
+    localStorage.removeItem('refreshToken');
     localStorage.removeItem('user');
     setIsAuthenticated(false);
     setUser(null);
   };
 
+  const handleLogout = () => {
+    const refreshToken = localStorage.getItem('refreshToken');
+    if (refreshToken) {
+      axios.post(`${API}/auth/logout`, { refresh_token: refreshToken }).catch(() => {});
+    }
+    clearSession();
+  };
+
   if (loading) {
     return (
       <div className="min-h-screen flex items-center justify-center bg-gradient-to-br from-slate-50 to-slate-100">
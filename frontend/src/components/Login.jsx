@@ -21,7 +21,7 @@ const Login = ({ onLogin }) => {
       });
 
       toast.success('Login successful!');
-      onLogin(response.data.access_token, response.data.user);
+      onLogin(response.data.access_token, response.data.user, response.data.refresh_token);
     } catch (error) {
       toast.error(error.response?.data?.detail || 'Login failed');
     } finally {
@@ -0,0 +1,10 @@
+import os
+import sys
+from pathlib import Path
+
+# server.py reads its configuration at import time; the Mongo client connects lazily
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+os.environ.setdefault("DB_NAME", "inventory_test")
+os.environ.setdefault("JWT_SECRET", "test-secret")
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
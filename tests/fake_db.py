@@ -0,0 +1,310 @@
+import copy
+import itertools
+import operator
+from types import SimpleNamespace
+
+from pymongo import InsertOne, ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+
+MISSING = object()
+
+
+def get_path(doc, path):
+    value = doc
+    for key in path.split("."):
+        if not isinstance(value, dict) or key not in value:
+            return MISSING
+        value = value[key]
+    return value
+
+
+def set_path(doc, path, value):
+    *parents, last = path.split(".")
+    for key in parents:
+        doc = doc.setdefault(key, {})
+    doc[last] = value
+
+
+def unset_path(doc, path):
+    *parents, last = path.split(".")
+    for key in parents:
+        doc = doc.get(key, {})
+    doc.pop(last, None)
+
+
+COMPARISONS = {"$lt": operator.lt, "$lte": operator.le, "$gt": operator.gt, "$gte": operator.ge}
+
+
+def matches_condition(value, condition):
+    if not (isinstance(condition, dict) and condition and all(key.startswith("$") for key in condition)):
+        # Like Mongo, a missing field equals None and an array matches any of its elements
+        value = None if value is MISSING else value
+        return value == condition or (isinstance(value, list) and condition in value)
+    for name, operand in condition.items():
+        if name == "$exists":
+            ok = (value is not MISSING) == bool(operand)
+        elif name == "$ne":
+            ok = not matches_condition(value, operand)
+        elif name == "$in":
+            ok = any(matches_condition(value, option) for option in operand)
+        elif name == "$nin":
+            ok = not any(matches_condition(value, option) for option in operand)
+        elif name in COMPARISONS:
+            ok = value not in (MISSING, None) and COMPARISONS[name](value, operand)
+        else:
+            raise NotImplementedError(name)
+        if not ok:
+            return False
+    return True
+
+
+def matches(doc, query):
+    for key, condition in query.items():
+        if key == "$or":
+            if not any(matches(doc, clause) for clause in condition):
+                return False
+        elif key == "$and":
+            if not all(matches(doc, clause) for clause in condition):
+                return False
+        elif not matches_condition(get_path(doc, key), condition):
+            return False
+    return True
+
+
+def project(doc, projection):
+    doc = copy.deepcopy(doc)
+    if not projection:
+        return doc
+    included = {key.split(".")[0] for key, flag in projection.items() if flag and key != "_id"}
+    if included:
+        doc = {key: value for key, value in doc.items() if key in included or key == "_id"}
+    for key, flag in projection.items():
+        if not flag:
+            unset_path(doc, key)
+    return doc
+
+
+class FakeCursor:
+    def __init__(self, docs):
+        self.docs = docs
+
+    def sort(self, key, direction=1):
+        keys = key if isinstance(key, list) else [(key, direction)]
+        for name, order in reversed(keys):
+            self.docs.sort(key=lambda doc: doc.get(name), reverse=order < 0)
+        return self
+
+    def limit(self, count):
+        self.docs = self.docs[:count] if count else self.docs
+        return self
+
+    async def to_list(self, length=None):
+        return self.docs[:length] if length else self.docs
+
+    def __aiter__(self):
+        self.iterator = iter(self.docs)
+        return self
+
+    async def __anext__(self):
+        try:
+            return next(self.iterator)
+        except StopIteration:
+            raise StopAsyncIteration
+
+
+class FakeCollection:
+    """Just enough of a Motor collection for the routes under test, kept in a list of dicts
+
+    unique lists field tuples that behave like unique indexes.
+    """
+
+    ids = itertools.count(1)
+
+    def __init__(self, docs=None, unique=()):
+        self.unique = [tuple(fields) for fields in unique]
+        self.docs = copy.deepcopy(docs or [])
+
+    @property
+    def docs(self):
+        return self._docs
+
+    @docs.setter
+    def docs(self, docs):
+        # Tests assign documents directly; they get an _id and are checked against the unique fields
+        self._docs = []
+        for doc in docs:
+            self.store(doc)
+
+    def store(self, doc):
+        doc.setdefault("_id", next(self.ids))
+        self.check_unique(doc)
+        self.docs.append(doc)
+
+    def check_unique(self, doc, ignore=None):
+        for fields in [("_id",)] + self.unique:
+            key = tuple(get_path(doc, field) for field in fields)
+            if any(other is not ignore and tuple(get_path(other, field) for field in fields) == key
+                   for other in self.docs):
+                raise DuplicateKeyError(f"E11000 duplicate key error on {fields}: {key}")
+
+    def apply_update(self, doc, update, inserting=False):
+        before = copy.deepcopy(doc)
+        for name, fields in update.items():
+            for path, value in fields.items():
+                current = get_path(doc, path)
+                if name == "$set":
+                    set_path(doc, path, copy.deepcopy(value))
+                elif name == "$setOnInsert":
+                    if inserting:
+                        set_path(doc, path, copy.deepcopy(value))
+                elif name == "$unset":
+                    unset_path(doc, path)
+                elif name == "$inc":
+                    set_path(doc, path, (0 if current is MISSING else current) + value)
+                elif name in ("$push", "$addToSet"):
+                    values = value["$each"] if isinstance(value, dict) and "$each" in value else [value]
+                    items = [] if current is MISSING else current
+                    for item in values:
+                        if name == "$push" or item not in items:
+                            items.append(item)
+                    set_path(doc, path, items)
+                elif name == "$pull":
+                    if current is not MISSING:
+                        set_path(doc, path, [item for item in current if item != value])
+                else:
+                    raise NotImplementedError(name)
+        return doc != before
+
+    def upsert_doc(self, query, update):
+        doc = {}
+        for key, value in query.items():
+            if not key.startswith("$") and not (isinstance(value, dict) and any(k.startswith("$") for k in value)):
+                set_path(doc, key, copy.deepcopy(value))
+        self.apply_update(doc, update, inserting=True)
+        self.store(doc)
+        return doc
+
+    def update(self, query, update, upsert=False, many=False):
+        matched = modified = 0
+        for doc in [doc for doc in self.docs if matches(doc, query)]:
+            matched += 1
+            snapshot = copy.deepcopy(doc)
+            if self.apply_update(doc, update):
+                try:
+                    self.check_unique(doc, ignore=doc)
+                except DuplicateKeyError:
+                    doc.clear()
+                    doc.update(snapshot)
+                    raise
+                modified += 1
+            if not many:
+                break
+        upserted_id = None
+        if not matched and upsert:
+            upserted_id = self.upsert_doc(query, update)["_id"]
+        return SimpleNamespace(matched_count=matched, modified_count=modified, upserted_id=upserted_id)
+
+    async def insert_one(self, doc):
+        doc.setdefault("_id", next(self.ids))
+        self.store(copy.deepcopy(doc))
+        return SimpleNamespace(inserted_id=doc["_id"])
+
+    async def insert_many(self, docs, ordered=True):
+        for doc in docs:
+            await self.insert_one(doc)
+
+    def find(self, query=None, projection=None):
+        return FakeCursor([project(doc, projection) for doc in self.docs if matches(doc, query or {})])
+
+    async def find_one(self, query=None, projection=None):
+        return next((project(doc, projection) for doc in self.docs if matches(doc, query or {})), None)
+
+    async def count_documents(self, query):
+        return sum(1 for doc in self.docs if matches(doc, query))
+
+    async def update_one(self, query, update, upsert=False):
+        return self.update(query, update, upsert=upsert)
+
+    async def update_many(self, query, update):
+        return self.update(query, update, many=True)
+
+    async def find_one_and_update(self, query, update, projection=None, upsert=False,
+                                  return_document=ReturnDocument.BEFORE):
+        doc = next((doc for doc in self.docs if matches(doc, query)), None)
+        if doc is None:
+            if not upsert:
+                return None
+            doc = self.upsert_doc(query, update)
+            return project(doc, projection) if return_document == ReturnDocument.AFTER else None
+        before = project(doc, projection)
+        self.apply_update(doc, update)
+        return project(doc, projection) if return_document == ReturnDocument.AFTER else before
+
+    async def find_one_and_delete(self, query, projection=None):
+        doc = next((doc for doc in self.docs if matches(doc, query)), None)
+        if doc is not None:
+            self.docs.remove(doc)
+            return project(doc, projection)
+        return None
+
+    async def delete_one(self, query):
+        doc = next((doc for doc in self.docs if matches(doc, query)), None)
+        if doc is not None:
+            self.docs.remove(doc)
+        return SimpleNamespace(deleted_count=int(doc is not None))
+
+    async def delete_many(self, query):
+        kept = [doc for doc in self.docs if not matches(doc, query)]
+        deleted, self.docs = len(self.docs) - len(kept), kept
+        return SimpleNamespace(deleted_count=deleted)
+
+    async def bulk_write(self, operations, ordered=True):
+        write_errors = []
+        for index, operation in enumerate(operations):
+            try:
+                if isinstance(operation, InsertOne):
+                    await self.insert_one(copy.deepcopy(operation._doc))
+                elif isinstance(operation, UpdateOne):
+                    self.update(operation._filter, operation._doc, upsert=operation._upsert)
+                else:
+                    raise NotImplementedError(type(operation))
+            except DuplicateKeyError as e:
+                write_errors.append({"index": index, "code": 11000, "errmsg": str(e)})
+                if ordered:
+                    break
+        if write_errors:
+            raise BulkWriteError({"writeErrors": write_errors})
+
+    def aggregate(self, pipeline):
+        """$match, and $group on one field with a {"$sum": 1} count"""
+        docs = list(self.docs)
+        for stage in pipeline:
+            if "$match" in stage:
+                docs = [doc for doc in docs if matches(doc, stage["$match"])]
+            elif "$group" in stage:
+                group_path = stage["$group"]["_id"].lstrip("$")
+                counts = {}
+                for doc in docs:
+                    key = get_path(doc, group_path)
+                    counts[key] = counts.get(key, 0) + 1
+                docs = [{"_id": key, "count": count} for key, count in counts.items()]
+            else:
+                raise NotImplementedError(stage)
+        return FakeCursor(docs)
+
+    async def create_index(self, *args, **kwargs):
+        pass
+
+
+class FakeDatabase:
+    """Collections are created on first use, like Mongo's"""
+
+    def __init__(self, **collections):
+        self.__dict__.update(collections)
+
+    def __getattr__(self, name):
+        if name.startswith("__"):
+            raise AttributeError(name)
+        collection = FakeCollection()
+        setattr(self, name, collection)
+        return collection
@@ -0,0 +1,228 @@
+import asyncio
+import time
+
+import bcrypt
+import jwt
+import pytest
+from fastapi import HTTPException
+from fastapi.security import HTTPAuthorizationCredentials
+from starlette.requests import Request
+
+import server
+from tests.fake_db import FakeCollection, FakeDatabase
+
+
+def bearer(token):
+    return HTTPAuthorizationCredentials(scheme="Bearer", credentials=token)
+
+
+def current_user(token=None, api_key=None):
+    return asyncio.run(server.get_current_user(bearer(token) if token else None, api_key))
+
+
+# Password hashing
+
+def test_password_needs_rehash_compares_work_factor(monkeypatch):
+    monkeypatch.setattr(server, "BCRYPT_ROUNDS", 5)
+    assert not server.password_needs_rehash(bcrypt.hashpw(b"pw", bcrypt.gensalt(rounds=5)).decode())
+    assert server.password_needs_rehash(bcrypt.hashpw(b"pw", bcrypt.gensalt(rounds=4)).decode())
+    assert server.password_needs_rehash("not-a-bcrypt-hash")
+
+
+# Access tokens
+
+def test_access_token_round_trip():
+    token = server.create_access_token("u1", "a@x.com", "admin", "s1")
+    user = current_user(token)
+    assert (user["user_id"], user["role"], user["sid"]) == ("u1", "admin", "s1")
+
+
+def test_revoked_session_is_rejected():
+    token = server.create_access_token("u1", "a@x.com", "admin", "revoked-session")
+    server.revoked_sessions.add("revoked-session")
+    try:
+        with pytest.raises(HTTPException) as error:
+            current_user(token)
+        assert error.value.status_code == 401
+    finally:
+        server.revoked_sessions.discard("revoked-session")
+
+
+def test_expired_access_token_is_rejected(monkeypatch):
+    monkeypatch.setattr(server, "ACCESS_TOKEN_EXPIRE_MINUTES", -1)
+    token = server.create_access_token("u1", "a@x.com", "admin")
+    with pytest.raises(HTTPException) as error:
+        current_user(token)
+    assert error.value.detail == "Token has expired"
+
+
+def test_export_download_link_is_not_an_access_token():
+    job_doc = {"id": "job-1", "status": "completed", "format": "csv", "expires_at": int(time.time()) + 3600,
+               "created_at": "2024-01-01T00:00:00+00:00"}
+    token = server.export_job_view(job_doc).download_url.split("token=")[1]
+    with pytest.raises(HTTPException) as error:
+        current_user(token)
+    assert error.value.status_code == 401
+
+
+def test_purpose_bound_token_signed_with_jwt_secret_is_rejected():
+    token = jwt.encode({"job_id": "job-1", "purpose": "export_download", "exp": int(time.time()) + 60},
+                       server.JWT_SECRET, algorithm=server.JWT_ALGORITHM)
+    with pytest.raises(HTTPException) as error:
+        current_user(token)
+    assert error.value.status_code == 401
+
+
+# API keys
+
+@pytest.fixture
+def api_key(monkeypatch):
+    monkeypatch.setattr(server, "api_key_table", {
+        "k1": {"secret_hmac": server.hash_api_key_secret("s3cret"), "name": "scanner", "role": "staff",
+               "warehouses": ["WH-A"]}
+    })
+    return "ik_k1_s3cret"
+
+
+def test_api_key_authenticates_with_its_scope(api_key):
+    user = current_user(api_key=api_key)
+    assert user["api_key_id"] == "k1"
+    assert user["role"] == "staff"
+    assert server.scope_inventory_query({"brand": "Nike"}, user) == {
+        "$and": [{"brand": "Nike"}, {"warehouse": {"$in": ["WH-A"]}}]
+    }
+
+
+def test_api_keys_with_the_same_name_have_separate_identities(api_key, monkeypatch):
+    server.api_key_table["k2"] = {**server.api_key_table["k1"], "warehouses": ["WH-B"]}
+    first, second = current_user(api_key=api_key), current_user(api_key="ik_k2_s3cret")
+    assert first["email"] == "api-key:k1"
+    assert first["email"] != second["email"]
+
+
+@pytest.mark.parametrize("bad_key", ["ik_k1_wrong", "ik_nope_s3cret", "xx_k1_s3cret", "ik_k1", ""])
+def test_invalid_api_keys_are_rejected(api_key, bad_key):
+    with pytest.raises(HTTPException) as error:
+        server.authenticate_api_key(bad_key)
+    assert error.value.status_code == 401
+
+
+def test_api_keys_cannot_manage_users_or_keys(api_key):
+    user = current_user(api_key=api_key)
+    with pytest.raises(HTTPException) as error:
+        server.reject_api_key(user, "change user roles")
+    assert error.value.status_code == 403
+
+
+def test_scoped_api_keys_cannot_manage_master_data(api_key):
+    user = {**current_user(api_key=api_key), "role": "admin"}
+    with pytest.raises(HTTPException) as error:
+        server.check_master_data_admin(user)
+    assert error.value.status_code == 403
+    server.check_master_data_admin({**user, "warehouses": []})
+
+
+def test_fresh_role_check_skips_api_keys(api_key):
+    checker = server.require_role([server.UserRole.STAFF], fresh_role=True)
+    user = current_user(api_key=api_key)
+    assert asyncio.run(checker(user)) is user
+
+
+# Login throttling
+
+def test_token_bucket_allows_burst_then_reports_retry_after():
+    limiter = server.TokenBucketLimiter(capacity=3, per_minute=60, max_keys=10)
+    assert [limiter.acquire("ip") for _ in range(3)] == [0.0, 0.0, 0.0]
+    retry_after = limiter.acquire("ip")
+    assert 0 < retry_after <= 1
+    assert limiter.acquire("other-ip") == 0.0
+
+
+def test_token_bucket_refills_over_time(monkeypatch):
+    clock = [1000.0]
+    monkeypatch.setattr(server.time, "monotonic", lambda: clock[0])
+    limiter = server.TokenBucketLimiter(capacity=1, per_minute=6, max_keys=10)
+    assert limiter.acquire("ip") == 0.0
+    assert limiter.acquire("ip") == pytest.approx(10.0)
+    clock[0] += 10
+    assert limiter.acquire("ip") == 0.0
+
+
+def test_token_bucket_drops_least_recently_used_keys():
+    limiter = server.TokenBucketLimiter(capacity=1, per_minute=1, max_keys=2)
+    for key in ("a", "b", "c"):
+        limiter.acquire(key)
+    assert list(limiter.buckets) == ["b", "c"]
+
+
+def login_request(ip, forwarded_for=None):
+    headers = [(b"x-forwarded-for", forwarded_for.encode())] if forwarded_for else []
+    return Request({"type": "http", "headers": headers, "client": (ip, 1234)})
+
+
+def test_throttle_login_limits_per_email_across_ips(monkeypatch):
+    monkeypatch.setattr(server, "login_ip_limiter", server.TokenBucketLimiter(100, 60, 100))
+    monkeypatch.setattr(server, "login_email_limiter", server.TokenBucketLimiter(2, 1, 100))
+    server.throttle_login(login_request("10.0.0.1"), "a@x.com")
+    server.throttle_login(login_request("10.0.0.2"), "A@x.com")
+    with pytest.raises(HTTPException) as error:
+        server.throttle_login(login_request("10.0.0.3"), "a@x.com")
+    assert error.value.status_code == 429
+    assert int(error.value.headers["Retry-After"]) >= 1
+
+
+def test_client_ip_ignores_forwarded_for_unless_trusted(monkeypatch):
+    request = login_request("10.0.0.1", forwarded_for="203.0.113.9, 10.0.0.1")
+    monkeypatch.setattr(server, "LOGIN_TRUST_FORWARDED_FOR", False)
+    assert server.client_ip(request) == "10.0.0.1"
+    monkeypatch.setattr(server, "LOGIN_TRUST_FORWARDED_FOR", True)
+    assert server.client_ip(request) == "203.0.113.9"
+
+
+# Refresh token rotation
+
+def session_database():
+    return FakeDatabase(users=FakeCollection([{"id": "u1", "email": "a@x.com", "role": "admin",
+                                               "created_at": "2024-01-01T00:00:00+00:00"}]))
+
+
+@pytest.fixture
+def session_db(monkeypatch):
+    database = session_database()
+    monkeypatch.setattr(server, "db", database)
+    monkeypatch.setattr(server, "user_cache", server.UserCache(60, 100))
+    monkeypatch.setattr(server, "revoked_sessions", set())
+    return database
+
+
+def refresh(token):
+    return asyncio.run(server.refresh_session(server.RefreshRequest(refresh_token=token)))
+
+
+def test_refresh_rotates_tokens_within_the_session(session_db):
+    tokens = asyncio.run(server.issue_session_tokens(asyncio.run(session_db.users.find_one({"id": "u1"}))))
+    rotated = refresh(tokens.refresh_token)
+    assert rotated.refresh_token != tokens.refresh_token
+    assert current_user(rotated.access_token)["sid"] == current_user(tokens.access_token)["sid"]
+
+
+def test_concurrent_refresh_from_another_tab_is_allowed(session_db):
+    tokens = asyncio.run(server.issue_session_tokens(asyncio.run(session_db.users.find_one({"id": "u1"}))))
+    first, second = refresh(tokens.refresh_token), refresh(tokens.refresh_token)
+    assert first.refresh_token != second.refresh_token
+    assert refresh(second.refresh_token).access_token
+    assert not server.revoked_sessions
+
+
+def test_refresh_token_reuse_after_grace_revokes_session(session_db, monkeypatch):
+    tokens = asyncio.run(server.issue_session_tokens(asyncio.run(session_db.users.find_one({"id": "u1"}))))
+    rotated = refresh(tokens.refresh_token)
+    monkeypatch.setattr(server, "REFRESH_REUSE_GRACE_SECONDS", -1)
+    with pytest.raises(HTTPException) as error:
+        refresh(tokens.refresh_token)
+    assert error.value.status_code == 401
+    with pytest.raises(HTTPException):
+        refresh(rotated.refresh_token)
+    with pytest.raises(HTTPException) as error:
+        current_user(rotated.access_token)
+    assert error.value.detail == "Session has been revoked"
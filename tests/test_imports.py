@@ -0,0 +1,213 @@
+import asyncio
+import hashlib
+from types import SimpleNamespace
+
+import pytest
+from fastapi import HTTPException
+from starlette.requests import Request
+
+import server
+from tests.fake_db import FakeCollection, FakeDatabase
+from tests.test_inventory import IMPORT_ROW
+
+
+def import_row(sku, row=2, **fields):
+    item = server.build_import_item({**IMPORT_ROW, "sku": sku, **fields})
+    return {"item": item, "content_hash": server.compute_content_hash(item), "sheet": "Sheet1", "row": row,
+            "values": [sku]}
+
+
+@pytest.fixture
+def import_db(monkeypatch):
+    database = FakeDatabase(
+        inventory=FakeCollection(unique=[("sku", "warehouse")]),
+        master_data_usage=FakeCollection(unique=[("field", "value")])
+    )
+    monkeypatch.setattr(server, "db", database)
+    monkeypatch.setattr(server, "master_data_snapshot", server.MasterDataSnapshot())
+    return database
+
+
+def write_rows(rows, user_email="a@x.com"):
+    async def run():
+        writer = server.ImportBulkWriter(user_email, batch_size=100)
+        for row in rows:
+            await writer.add(row)
+        await writer.flush()
+        return writer
+    return asyncio.run(run())
+
+
+def usage(database, field, value):
+    return next((doc["count"] for doc in database.master_data_usage.docs
+                 if (doc["field"], doc["value"]) == (field, value)), 0)
+
+
+# Bulk import writes
+
+def test_flush_counts_inserted_updated_and_unchanged_rows(import_db):
+    write_rows([import_row("A"), import_row("B")])
+    writer = write_rows([import_row("A"), import_row("B", quantity=9), import_row("C")], user_email="b@x.com")
+
+    assert (writer.inserted, writer.updated, writer.unchanged, writer.errors) == (1, 1, 1, [])
+    items = {doc["sku"]: doc for doc in import_db.inventory.docs}
+    assert items["A"]["last_modified_by"] == "a@x.com"
+    assert (items["B"]["quantity"], items["B"]["last_modified_by"]) == (9, "b@x.com")
+    assert items["B"]["content_hash"] == import_row("B", quantity=9)["content_hash"]
+    assert items["C"]["created_by"] == "b@x.com"
+    assert usage(import_db, "brands", "Nike") == 3
+
+
+def test_repeated_sku_in_one_file_sees_its_earlier_row(import_db):
+    writer = write_rows([import_row("A", row=2), import_row("A", row=3, quantity=7), import_row("A", row=4, quantity=7)])
+    assert (writer.inserted, writer.updated, writer.unchanged) == (1, 1, 1)
+    assert [doc["quantity"] for doc in import_db.inventory.docs] == [7]
+    assert usage(import_db, "brands", "Nike") == 1
+
+
+def test_rows_that_fail_to_write_are_reported_and_not_counted(import_db):
+    bulk_write = import_db.inventory.bulk_write
+
+    async def racing_bulk_write(operations, ordered=True):
+        # Another import inserts the same SKU + Warehouse between the lookup and the write
+        await import_db.inventory.insert_one(import_row("B")["item"])
+        await bulk_write(operations, ordered=ordered)
+
+    import_db.inventory.bulk_write = racing_bulk_write
+    writer = write_rows([import_row("A"), import_row("B", row=3, color="Red")])
+
+    assert (writer.inserted, writer.updated, writer.unchanged) == (1, 0, 0)
+    assert [(error["row"], error["sku"]) for error in writer.errors] == [(3, "B")]
+    assert "duplicate key" in writer.errors[0]["error"]
+    assert usage(import_db, "colors", "Red") == 0
+    assert writer.master_data_values["colors"] == {"Blue"}
+
+
+# Master data registration
+
+def test_import_registers_only_new_master_data_values(import_db):
+    import_db.master_data.docs = [{"_id": "master_data", "version": 1, "brands": ["Nike"], "colors": ["Blue"],
+                                   "sizes": ["M"]}]
+    new_values = asyncio.run(server.register_import_master_data(
+        {"brands": {"Nike", "Puma", "Adidas"}, "colors": {"Blue"}, "sizes": {"M", "L"}, "materials": set()}
+    ))
+
+    assert new_values == {"brands": ["Adidas", "Puma"], "sizes": ["L"]}
+    master_doc = import_db.master_data.docs[0]
+    assert master_doc["brands"] == ["Nike", "Adidas", "Puma"]
+    assert master_doc["sizes"] == ["M", "L"]
+    assert master_doc["version"] == 2
+    assert server.master_data_snapshot.data["brands"] == ["Nike", "Adidas", "Puma"]
+
+
+def test_first_import_keeps_the_default_sizes(import_db):
+    asyncio.run(server.register_import_master_data({"brands": {"Nike"}, "sizes": {"3XL(48)"}}))
+    master_doc = import_db.master_data.docs[0]
+    assert master_doc["brands"] == ["Nike"]
+    assert master_doc["sizes"] == server.default_master_data()["sizes"] + ["3XL(48)"]
+
+
+def test_import_without_new_values_does_not_write_master_data(import_db):
+    import_db.master_data.docs = [{"_id": "master_data", "version": 1, "brands": ["Nike"]}]
+    assert asyncio.run(server.register_import_master_data({"brands": {"Nike"}})) == {}
+    assert import_db.master_data.docs[0]["version"] == 1
+
+
+# Chunked uploads
+
+UPLOADER = {"email": "a@x.com", "role": "staff"}
+
+
+def chunk_request(data: bytes, piece_size=3):
+    pieces = [data[start:start + piece_size] for start in range(0, len(data), piece_size)] or [b""]
+    messages = [{"type": "http.request", "body": piece, "more_body": index < len(pieces) - 1}
+                for index, piece in enumerate(pieces)]
+
+    async def receive():
+        return messages.pop(0)
+
+    return Request({"type": "http", "method": "PUT", "headers": []}, receive)
+
+
+@pytest.fixture
+def upload_db(monkeypatch, tmp_path):
+    database = FakeDatabase(import_uploads=FakeCollection([{
+        "id": "up-1", "filename": "stock.xlsx", "total_size": 10, "chunk_size": 4, "received_chunks": [],
+        "completed": False, "created_by": UPLOADER["email"], "created_at": "2024-01-01T00:00:00+00:00"
+    }]))
+    monkeypatch.setattr(server, "db", database)
+    monkeypatch.setattr(server, "UPLOAD_DIR", tmp_path)
+    (tmp_path / "up-1").mkdir()
+    return database
+
+
+def put_chunk(index, data, checksum=None):
+    checksum = checksum or hashlib.sha256(data).hexdigest()
+    return asyncio.run(server.upload_chunk("up-1", index, chunk_request(data), checksum, UPLOADER))
+
+
+def test_chunks_are_stored_when_size_and_checksum_match(upload_db, tmp_path):
+    put_chunk(0, b"abcd")
+    status = put_chunk(2, b"ij")  # the last chunk holds the remainder
+    assert (status.total_chunks, status.received_chunks) == (3, [0, 2])
+    assert (tmp_path / "up-1" / "chunk_000002").read_bytes() == b"ij"
+
+
+@pytest.mark.parametrize("index, data, checksum, detail", [
+    (0, b"abc", None, "Chunk 0 must be 4 bytes, got 3"),
+    (0, b"abcdefg", None, "Chunk 0 is larger than 4 bytes"),
+    (2, b"ijk", None, "Chunk 2 is larger than 2 bytes"),
+    (0, b"abcd", "0" * 64, "Checksum mismatch for chunk 0"),
+    (3, b"ij", None, "Chunk index must be between 0 and 2")
+])
+def test_bad_chunks_are_rejected_and_not_stored(upload_db, tmp_path, index, data, checksum, detail):
+    with pytest.raises(HTTPException) as error:
+        put_chunk(index, data, checksum)
+    assert (error.value.status_code, error.value.detail) == (400, detail)
+    assert upload_db.import_uploads.docs[0]["received_chunks"] == []
+    assert not list((tmp_path / "up-1").iterdir())
+
+
+def test_uploads_from_other_users_are_not_found(upload_db):
+    with pytest.raises(HTTPException) as error:
+        asyncio.run(server.get_upload_for_user("up-1", {"email": "api-key:k1"}))
+    assert error.value.status_code == 404
+
+
+def complete_upload(upload_db):
+    for index, data in enumerate([b"abcd", b"efgh", b"ij"]):
+        put_chunk(index, data)
+    return asyncio.run(server.complete_chunked_upload("up-1", None, UPLOADER))
+
+
+def test_complete_imports_the_assembled_file_once(upload_db, monkeypatch, tmp_path):
+    imported = []
+
+    async def run_import(file_path, sheets, current_user, filename):
+        imported.append(open(file_path, "rb").read())
+        return SimpleNamespace(import_id="imp-1")
+
+    monkeypatch.setattr(server, "run_import", run_import)
+    assert complete_upload(upload_db).import_id == "imp-1"
+    assert imported == [b"abcdefghij"]
+    assert upload_db.import_uploads.docs[0]["completed"]
+    assert not (tmp_path / "up-1").exists()
+
+
+def test_complete_is_refused_while_another_import_of_the_upload_runs(upload_db):
+    upload_db.import_uploads.docs[0]["state"] = "importing"
+    with pytest.raises(HTTPException) as error:
+        complete_upload(upload_db)
+    assert error.value.status_code == 409
+
+
+def test_failed_import_releases_the_upload_for_a_retry(upload_db, monkeypatch, tmp_path):
+    async def run_import(*args):
+        raise HTTPException(status_code=400, detail="No data rows")
+
+    monkeypatch.setattr(server, "run_import", run_import)
+    with pytest.raises(HTTPException):
+        complete_upload(upload_db)
+    upload_doc = upload_db.import_uploads.docs[0]
+    assert "state" not in upload_doc and not upload_doc["completed"]
+    assert sorted(path.name for path in (tmp_path / "up-1").iterdir()) == ["chunk_000000", "chunk_000001", "chunk_000002"]
@@ -0,0 +1,198 @@
+import asyncio
+import csv
+import io
+import os
+import zipfile
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from fastapi import HTTPException
+
+import server
+from tests.fake_db import FakeCollection, FakeDatabase
+
+
+IMPORT_ROW = {
+    "sku": "TS-001", "name": "Tee", "brand": "Nike", "warehouse": "WH-A", "product_type": "Clothing",
+    "category": "T-Shirts", "gender": "Male", "color": "Blue", "material": "Cotton", "weight": 180,
+    "size": "M", "design": "Plain", "mrp": 999, "selling_price": 799, "quantity": 5
+}
+
+
+# Import content hash
+
+def created_item():
+    """An item as create_inventory_item stores it"""
+    item_data = server.InventoryItemCreate(
+        sku="TS-001", name="Tee", brand="Nike", warehouse="WH-A", category="T-Shirts", gender="male",
+        color="Blue", fabric_specs={"material": "Cotton", "weight": "180"}, size="M", design="Plain",
+        mrp=999, selling_price=799, quantity=5
+    )
+    return server.InventoryItem(**item_data.model_dump(), created_by="a@x.com", last_modified_by="a@x.com").model_dump()
+
+
+def test_content_hash_matches_between_created_and_imported_items():
+    imported = server.build_import_item(IMPORT_ROW)
+    assert server.compute_content_hash(created_item()) == server.compute_content_hash(imported)
+
+
+def test_content_hash_changes_with_imported_fields_only():
+    item = server.build_import_item(IMPORT_ROW)
+    baseline = server.compute_content_hash(item)
+    assert server.compute_content_hash({**item, "updated_at": "later", "images": ["x"]}) == baseline
+    assert server.compute_content_hash({**item, "quantity": 6}) != baseline
+    assert server.compute_content_hash({**item, "fabric_specs": {**item["fabric_specs"], "weight": "200"}}) != baseline
+
+
+def test_build_import_item_requires_fields():
+    with pytest.raises(ValueError, match="Missing required field: sku"):
+        server.build_import_item({**IMPORT_ROW, "sku": ""})
+    assert server.build_import_item({**IMPORT_ROW, "quantity": 0})["quantity"] == 0
+
+
+# Inventory queries
+
+def test_price_range_and_search_are_both_applied():
+    query = server.build_inventory_query(brand="Nike", min_price=100, max_price=500, search="a.b")
+    assert query["brand"] == "Nike"
+    price, search = query["$and"]
+    assert price == {"$or": [{"mrp": {"$gte": 100, "$lte": 500}}, {"selling_price": {"$gte": 100, "$lte": 500}}]}
+    assert search["$or"][0] == {"sku": {"$regex": r"a\.b", "$options": "i"}}
+
+
+def test_sku_search_is_an_escaped_prefix_match():
+    assert server.build_inventory_query(sku="TS(1")["sku"] == {"$regex": r"^TS\(1"}
+
+
+def test_export_query_rejects_non_string_filters():
+    user = {"role": "admin"}
+    for filters in ({"search": 5}, {"brand": {"$ne": "x"}}, {"status": ["active"]}, {"status": "gone"},
+                    {"min_price": "cheap"}):
+        with pytest.raises(HTTPException) as error:
+            server.build_export_query(filters, user)
+        assert error.value.status_code == 400
+
+
+def test_export_query_is_scoped_to_key_warehouses():
+    query = server.build_export_query({"brand": "Nike", "gender": ""}, {"role": "staff", "warehouses": ["WH-A"]})
+    assert query == {"$and": [{"brand": "Nike"}, {"warehouse": {"$in": ["WH-A"]}}]}
+
+
+# Export rendering
+
+def test_export_plan_projects_only_requested_fields():
+    assert server.ExportPlan(["sku", "material", "weight"]).projection == {
+        "_id": 0, "fabric_specs.material": 1, "fabric_specs.weight": 1, "sku": 1
+    }
+    assert server.ExportPlan(["fabric_specs", "material"]).projection == {"_id": 0, "fabric_specs": 1}
+
+
+def test_export_plan_rows_read_nested_and_empty_values():
+    plan = server.ExportPlan(["sku", "material", "mrp", "color_code"])
+    item = {"sku": "TS-001", "fabric_specs": {"material": "Cotton"}, "mrp": 999.0, "color_code": ""}
+    assert plan.row(item) == ["TS-001", "Cotton", 999.0, None]
+
+
+def test_share_width_keeps_narrow_columns_and_splits_the_rest():
+    assert server.PdfExportWriter.share_width([10, 20], 100) == [10, 20]
+    assert server.PdfExportWriter.share_width([10, 200, 300], 110) == [10, 50, 50]
+    assert sum(server.PdfExportWriter.share_width([80, 90, 100], 120)) == pytest.approx(120)
+
+
+def test_word_export_escapes_cell_text(tmp_path):
+    output_path = tmp_path / "report.docx"
+    writer = server.WordExportWriter(["Name", "Notes"], str(output_path), 1)
+    writer.write_row(["A & B <C>", "line 1\nline 2\x01"])
+    writer.close()
+
+    document_xml = zipfile.ZipFile(output_path).read("word/document.xml").decode("utf-8")
+    assert "A &amp; B &lt;C&gt;" in document_xml
+    assert "line 1</w:t><w:br/>" in document_xml
+    assert "\x01" not in document_xml
+    assert "__export_cell_" not in document_xml
+
+
+# Export cache
+
+def cache_file(tmp_path, name, size):
+    path = tmp_path / name
+    path.write_bytes(b"x" * size)
+    return str(path)
+
+
+def test_export_cache_evicts_least_recently_used_unpinned_files(tmp_path):
+    cache = server.ExportCache(tmp_path / "cache", max_bytes=250)
+    first = cache.put("a", "csv", cache_file(tmp_path, "a.csv", 100))
+    second = cache.put("b", "csv", cache_file(tmp_path, "b.csv", 100))
+    cache.release(first)
+    cache.release(second)
+    os.utime(first, (1, 1))
+    cache.release(cache.put("c", "csv", cache_file(tmp_path, "c.csv", 100)))
+    assert not first.exists()
+    assert cache.get("a", "csv") is None
+    assert cache.stats()["entries"] == 2
+
+
+def test_export_cache_keeps_files_pinned_by_another_worker(tmp_path):
+    directory = tmp_path / "cache"
+    worker_a, worker_b = server.ExportCache(directory, 150), server.ExportCache(directory, 150)
+    worker_a.release(worker_a.put("a", "csv", cache_file(tmp_path, "a.csv", 100)))
+    pinned = worker_b.get("a", "csv")
+    assert pinned
+
+    worker_a.release(worker_a.put("b", "csv", cache_file(tmp_path, "b.csv", 100)))
+    assert pinned.exists()
+    assert not (directory / "b.csv").exists()
+    worker_b.release(pinned)
+    assert worker_a.stats()["bytes"] == 100
+    assert not worker_b.pins
+
+
+def test_background_exports_wait_instead_of_being_rejected_when_the_queue_is_full(monkeypatch):
+    monkeypatch.setitem(server.export_metrics, "queued", server.EXPORT_MAX_QUEUE)
+    monkeypatch.setattr(server, "get_export_pool", lambda: None)  # the loop's default executor
+    monkeypatch.setattr(server, "render_export_files", lambda *args: 0.01)
+    render_args = (["pdf"], ["sku"], ["SKU"], "rows", ["out.pdf"], 1)
+
+    with pytest.raises(HTTPException) as error:
+        asyncio.run(server.render_export(*render_args))
+    assert error.value.status_code == 503
+    assert asyncio.run(server.render_export(*render_args, reject_when_busy=False))["render_ms"] == 10.0
+
+
+def test_export_jobs_whose_lease_lapsed_are_failed(monkeypatch, tmp_path):
+    now = datetime.now(timezone.utc)
+    jobs = FakeCollection([
+        {"id": "orphaned", "status": "running", "format": "pdf", "lease_expires_at": now - timedelta(seconds=1)},
+        {"id": "live", "status": "running", "format": "pdf", "lease_expires_at": now + timedelta(seconds=60)},
+        {"id": "done", "status": "completed", "format": "pdf", "lease_expires_at": now - timedelta(hours=1)}
+    ])
+    monkeypatch.setattr(server, "db", FakeDatabase(export_jobs=jobs))
+    monkeypatch.setattr(server, "EXPORT_JOBS_DIR", tmp_path)
+    (tmp_path / "orphaned.pdf").write_bytes(b"partial")
+
+    asyncio.run(server.fail_orphaned_export_jobs())
+    assert {job["id"]: job["status"] for job in jobs.docs} == {"orphaned": "failed", "live": "running", "done": "completed"}
+    assert not (tmp_path / "orphaned.pdf").exists()
+
+
+# Import error reports
+
+def test_csv_error_report_places_each_sheet_under_its_own_headings(monkeypatch):
+    import_doc = {"id": "imp-1", "sheets": ["Tops", "Shoes"],
+                  "header_rows": [["SKU", "Name", "Size"], ["SKU", "Size", "Sole", ""]]}
+    errors = FakeCollection([
+        {"import_id": "imp-1", "sheet": "Tops", "sheet_index": 0, "row": 2, "values": ["T1", "Tee"], "error": "bad size"},
+        {"import_id": "imp-1", "sheet": "Shoes", "sheet_index": 1, "row": 2, "values": ["S1", "42", "Rubber", "x"],
+         "error": "bad mrp"}
+    ])
+    monkeypatch.setattr(server, "db", FakeDatabase(import_errors=errors))
+
+    async def report():
+        return "".join([chunk async for chunk in server.stream_error_report_csv(import_doc)])
+
+    assert list(csv.reader(io.StringIO(asyncio.run(report())))) == [
+        ["Sheet", "SKU", "Name", "Size", "Sole", "", "Error"],
+        ["Tops", "T1", "Tee", "", "", "", "bad size"],
+        ["Shoes", "S1", "", "42", "Rubber", "x", "bad mrp"]
+    ]
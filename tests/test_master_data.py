@@ -0,0 +1,161 @@
+import asyncio
+from collections import Counter
+
+import pytest
+
+import server
+from tests.fake_db import FakeCollection, FakeDatabase
+
+
+def item(sku, brand="Nike", color="Blue", material="Cotton", **fields):
+    return {"sku": sku, "warehouse": "WH-A", "brand": brand, "color": color,
+            "fabric_specs": {"material": material}, **fields}
+
+
+@pytest.fixture
+def master_db(monkeypatch):
+    database = FakeDatabase(master_data_usage=FakeCollection(unique=[("field", "value")]))
+    monkeypatch.setattr(server, "db", database)
+    monkeypatch.setattr(server, "master_data_snapshot", server.MasterDataSnapshot())
+    monkeypatch.setattr(server, "master_data_usage_built", False)
+    return database
+
+
+def stored_usage(database):
+    return {(doc["field"], doc["value"]): doc["count"] for doc in database.master_data_usage.docs if doc["count"]}
+
+
+# Usage counters
+
+def test_usage_delta_moves_only_changed_values():
+    old, new = item("A"), item("A", color="Red", material="")
+    assert +server.master_data_usage_delta(old, new) == Counter({("colors", "Red"): 1})
+    assert -server.master_data_usage_delta(old, new) == Counter({("colors", "Blue"): 1, ("materials", "Cotton"): 1})
+    assert server.master_data_usage_delta(None, old)[("brands", "Nike")] == 1
+    assert server.master_data_usage_delta(old, None)[("brands", "Nike")] == -1
+
+
+def test_applied_deltas_track_inventory_writes(master_db):
+    asyncio.run(server.apply_master_data_usage(server.master_data_usage_delta(None, item("A"))))
+    asyncio.run(server.apply_master_data_usage(server.master_data_usage_delta(None, item("B", color="Red"))))
+    asyncio.run(server.apply_master_data_usage(server.master_data_usage_delta(item("B", color="Red"), item("B"))))
+    assert stored_usage(master_db) == {("brands", "Nike"): 2, ("warehouses", "WH-A"): 2, ("colors", "Blue"): 2,
+                                       ("materials", "Cotton"): 2}
+
+
+def test_usage_is_counted_from_inventory_until_the_counters_are_built(master_db):
+    master_db.inventory.docs = [item("A"), item("B")]
+    master_db.data_versions.docs = [{"_id": "master_data_usage", "built_at": "left by a failed build"}]
+    assert asyncio.run(server.get_master_data_usage_count("brands", "Nike")) == 2
+
+    asyncio.run(server.build_master_data_usage())
+    assert master_db.data_versions.docs[0]["status"] == "built"
+    assert stored_usage(master_db)[("brands", "Nike")] == 2
+    master_db.inventory.docs = []
+    assert asyncio.run(server.get_master_data_usage_count("brands", "Nike")) == 2
+
+
+def test_only_one_worker_claims_the_build_and_a_failure_releases_it(master_db, monkeypatch):
+    assert asyncio.run(server.claim_master_data_usage_build())
+    assert not asyncio.run(server.claim_master_data_usage_build())
+
+    async def failing_rebuild():
+        raise RuntimeError("connection lost")
+
+    master_db.data_versions.docs[0].pop("lease_expires_at")
+    monkeypatch.setattr(server, "rebuild_master_data_usage", failing_rebuild)
+    with pytest.raises(RuntimeError):
+        asyncio.run(server.build_master_data_usage())
+    assert not asyncio.run(server.master_data_usage_ready())
+    assert asyncio.run(server.claim_master_data_usage_build())
+
+
+def test_rebuild_overwrites_drifted_counters_and_drops_stale_ones(master_db):
+    master_db.inventory.docs = [item("A"), item("B", brand="Puma")]
+    master_db.master_data_usage.docs = [{"_id": 1, "field": "brands", "value": "Nike", "count": 7},
+                                        {"_id": 2, "field": "colors", "value": "Gone", "count": 3}]
+    asyncio.run(server.rebuild_master_data_usage())
+    assert stored_usage(master_db) == {("brands", "Nike"): 1, ("brands", "Puma"): 1, ("warehouses", "WH-A"): 2,
+                                       ("colors", "Blue"): 2, ("materials", "Cotton"): 2}
+    assert asyncio.run(server.master_data_usage_ready())
+
+
+# Product hierarchy
+
+def hierarchy_db(monkeypatch):
+    master_data = FakeCollection([{"_id": "master_data", "version": 3,
+                                   "product_hierarchy": {"Clothing": {"T-Shirts": ["Crew Neck"]}}}])
+    monkeypatch.setattr(server, "db", FakeDatabase(master_data=master_data))
+    monkeypatch.setattr(server, "master_data_snapshot", server.MasterDataSnapshot())
+    return master_data
+
+
+@pytest.mark.parametrize("category, product_name, detail", [
+    ("Jackets", None, "Category 'Jackets' not found in 'Clothing'"),
+    ("T-Shirts", None, "Product 'None' not found"),
+    ("T-Shirts", "Polo", "Product 'Polo' not found")
+])
+def test_deleting_a_missing_product_name_is_a_404_without_a_write(monkeypatch, category, product_name, detail):
+    master_data = hierarchy_db(monkeypatch)
+    with pytest.raises(server.HTTPException) as error:
+        asyncio.run(server.delete_from_hierarchy("product_name", "Clothing", category, product_name, {"role": "admin"}))
+    assert (error.value.status_code, error.value.detail) == (404, detail)
+    assert master_data.docs[0]["version"] == 3
+
+
+def test_deleting_a_product_name_removes_it(monkeypatch):
+    master_data = hierarchy_db(monkeypatch)
+    asyncio.run(server.delete_from_hierarchy("product_name", "Clothing", "T-Shirts", "Crew Neck", {"role": "admin"}))
+    assert master_data.docs[0]["product_hierarchy"] == {"Clothing": {"T-Shirts": []}}
+    assert master_data.docs[0]["version"] == 4
+
+
+# Rename jobs
+
+@pytest.fixture
+def rename_db(master_db, monkeypatch):
+    monkeypatch.setattr(server, "MASTER_DATA_RENAME_BATCH_SIZE", 2)
+    monkeypatch.setattr(server, "master_data_rename_tasks", {})
+    master_db.inventory.docs = [{**item(f"N{index}"), "content_hash": "h"} for index in range(5)] + [item("P", brand="Puma")]
+    master_db.master_data_usage.docs = [{"field": "brands", "value": "Nike", "count": 5}]
+    return master_db
+
+
+def rename_job(job_id, **fields):
+    return {"id": job_id, "field_name": "brands", "old_value": "Nike", "new_value": "Nike Inc", "status": "queued",
+            "processed": 0, **fields}
+
+
+def test_rename_job_rewrites_items_in_batches(rename_db):
+    rename_db.master_data_jobs.docs = [rename_job("job-1")]
+    asyncio.run(server.run_master_data_rename("job-1", "brands", "Nike", "Nike Inc"))
+
+    job = rename_db.master_data_jobs.docs[0]
+    assert (job["status"], job["total"], job["processed"]) == ("completed", 5, 5)
+    assert sorted(doc["brand"] for doc in rename_db.inventory.docs) == ["Nike Inc"] * 5 + ["Puma"]
+    assert not any("content_hash" in doc for doc in rename_db.inventory.docs)
+    assert stored_usage(rename_db)[("brands", "Nike Inc")] == 5
+    assert ("brands", "Nike") not in stored_usage(rename_db)
+    assert rename_db.data_versions.docs[0]["version"] == 1
+
+
+def test_orphaned_rename_job_is_resumed_from_its_progress(rename_db):
+    now = server.datetime.now(server.timezone.utc)
+    for doc in rename_db.inventory.docs[:2]:
+        doc["brand"] = "Nike Inc"
+    rename_db.master_data_jobs.docs = [
+        rename_job("orphaned", status="running", processed=2, lease_expires_at=now - server.timedelta(seconds=1)),
+        rename_job("live", status="running", lease_expires_at=now + server.timedelta(seconds=60))
+    ]
+
+    async def resume():
+        await server.resume_master_data_renames()
+        resumed = list(server.master_data_rename_tasks)
+        await asyncio.gather(*server.master_data_rename_tasks.values())
+        return resumed
+
+    assert asyncio.run(resume()) == ["orphaned"]
+    orphaned, live = rename_db.master_data_jobs.docs
+    assert (orphaned["status"], orphaned["total"], orphaned["processed"]) == ("completed", 5, 5)
+    assert live["status"] == "running"
+    assert sorted(doc["brand"] for doc in rename_db.inventory.docs) == ["Nike Inc"] * 5 + ["Puma"]